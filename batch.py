@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+The independent requests of one poll (status and quota, or probes of several API versions) run concurrently
+on a shared thread pool, over the connection pool of the manager's session, so a poll costs one round-trip
+instead of one per request.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='batch')
+
+
+def gather(*calls):
+    """ Results of the calls, run concurrently. The first one runs on the calling thread. """
+    futures = [_executor.submit(call) for call in calls[1:]]
+    results = [calls[0]()]
+    return results + [future.result() for future in futures]
+
+
+def first(*candidates):
+    """
+    Runs the (call, valid) candidates concurrently, in order of preference. Returns (index, result) of the
+    preferred valid result as soon as it is known, i.e. once all candidates before it came back invalid,
+    (None, None) if there is none. The others finish in the background, their results are dropped.
+    """
+    futures = {_executor.submit(call): index for index, (call, _) in enumerate(candidates)}
+    results = {}
+    for future in as_completed(futures):
+        results[futures[future]] = future.result()
+        for index, (_, valid) in enumerate(candidates):
+            if index not in results:
+                break
+            if valid(results[index]):
+                return index, results[index]
+    return None, None
+
+
+def race(calls, valid, stagger=None):
+    """
+    Runs the calls concurrently, returns (index, result) of the first valid result to come back, (None, None)
+    if there is none. The others finish in the background, their results are dropped.
+    With stagger (s), the calls are started one after the other, happy eyeballs style: the next one once the
+    running ones had stagger without a valid result, or right away when one came back invalid. Calls not
+    started by the time a valid result comes back are never started.
+    """
+    pending = list(enumerate(calls))
+    futures = {}
+
+    def start():
+        index, call = pending.pop(0)
+        futures[_executor.submit(call)] = index
+
+    start()
+    while pending and stagger is None:
+        start()
+    while futures or pending:
+        if not futures:
+            start()
+        done, _ = wait(futures, timeout=stagger if pending else None, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = futures.pop(future)
+            result = future.result()
+            if valid(result):
+                for other in futures:
+                    other.cancel()
+                return index, result
+        if pending:
+            start()
+    return None, None
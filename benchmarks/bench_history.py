@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Cost of the quota/connectivity history (history.py): one append per poll, and range reads into NumPy.
+
+Appends are measured with the ring buffer wrapping around, reads of the full buffer and of the last hour.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from history import History
+
+
+def main(capacity, appends):
+    with tempfile.TemporaryDirectory() as tmp:
+        history = History(os.path.join(tmp, 'history.bin'), capacity=capacity)
+        # Every append is written, to measure the writes and to fill the ring
+        history.sample_interval = 0
+        now = time.time() - appends
+        start = time.perf_counter()
+        for i in range(appends):
+            history.append('WIFIonICE', 'aa:bb:cc:dd:ee:ff', '02:00:00:00:00:01', i % 100 != 0, i / appends,
+                           i * 1000, 200 * 1024 * 1024, timestamp=now + i)
+        seconds = time.perf_counter() - start
+        print('append: {:.2f} us'.format(seconds / appends * 1e6))
+
+        try:
+            import numpy
+        except ImportError:
+            print('read: needs numpy')
+            return
+        for name, since in (('all', None), ('last hour', now + appends - 3600)):
+            start = time.perf_counter()
+            records = history.read(start=since)
+            print('read {} ({} records): {:.1f} ms'.format(name, len(records), (time.perf_counter() - start) * 1000))
+        history.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-c', '--capacity', type=int, default=History.capacity, help='Records in the buffer')
+    argparser.add_argument('-n', '--appends', type=int, default=2 * History.capacity)
+
+    args = argparser.parse_args()
+    main(args.capacity, args.appends)
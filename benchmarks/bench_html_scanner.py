@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+CPU time and peak memory of extracting the login form / meta refresh from the saved hotsplots pages in
+fixtures/hotsplots: the old bs4 + lxml trees against html_scanner. bs4 is only needed for the comparison.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+BASEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASEDIR)
+
+import html_scanner
+
+try:
+    import bs4
+except ImportError:
+    bs4 = None
+
+
+def form_bs4(text):
+    soup = bs4.BeautifulSoup(text, 'lxml')
+    return soup, {item.attrs.get('name'): item.attrs.get('value')
+                  for item in soup.find_all('input', attrs={'type': 'hidden'})}
+
+
+def refresh_bs4(text):
+    soup = bs4.BeautifulSoup(text, 'lxml')
+    refresh = soup.find('meta', attrs={'http-equiv': "refresh"})
+    return refresh.attrs.get('content')[len('0;url='):] if refresh else None
+
+
+def form_scanner(text):
+    return html_scanner.scan(text, until='form').hidden
+
+
+def refresh_scanner(text):
+    return html_scanner.scan(text, until='refresh').refresh_url
+
+
+def measure(func, text, number):
+    start = time.process_time()
+    for _ in range(number):
+        func(text)
+    cpu = (time.process_time() - start) / number
+
+    tracemalloc.start()
+    result = func(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return cpu, peak
+
+
+def main(number):
+    cases = [('login.html', 'form', form_bs4, form_scanner),
+             ('login_confirm.html', 'refresh', refresh_bs4, refresh_scanner)]
+    for filename, what, old, new in cases:
+        with open(os.path.join(BASEDIR, 'fixtures', 'hotsplots', filename)) as f:
+            text = f.read()
+        print('{} ({}, {} bytes)'.format(filename, what, len(text)))
+        for name, func in (('bs4', old), ('scanner', new)):
+            if name == 'bs4' and bs4 is None:
+                print('  bs4      not installed')
+                continue
+            cpu, peak = measure(func, text, number)
+            print('  {:<8} {:8.1f} us CPU, {:8.1f} KiB peak'.format(name, cpu * 1e6, peak / 1024))
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-n', '--number', type=int, default=200)
+
+    args = argparser.parse_args()
+    main(args.number)
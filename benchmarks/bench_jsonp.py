@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the JSONP decoding: the old regex/slicing approach against jsonp.decode,
+over the payloads in fixtures/jsonp.
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import timeit
+
+BASEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASEDIR)
+
+import jsonp
+
+json_decoder = json.JSONDecoder()
+
+
+def decode_regex(text):
+    """ What DBWifiOnICEManager._get_status_from_api used to do """
+    return json_decoder.decode(re.sub(r'[\n\(\); ]', '', text)[:-2] + '}')
+
+
+def decode_regex_cdwifi(text):
+    """ What DBCDWiFiManager._get_status_from_api used to do """
+    return json_decoder.decode(re.sub(r'[\n\(\); ]', '', text[1:-2]))
+
+
+def main(number):
+    for path in sorted(glob.glob(os.path.join(BASEDIR, 'fixtures', 'jsonp', '*.txt'))):
+        with open(path) as f:
+            text = f.read()
+        print(os.path.basename(path))
+        for name, decode in (('ice', decode_regex), ('cdwifi', decode_regex_cdwifi), ('jsonp', jsonp.decode)):
+            try:
+                result = decode(text)
+            except ValueError as e:
+                print('  {:<6} broken: {}'.format(name, e))
+                continue
+            seconds = timeit.timeit(lambda: decode(text), number=number)
+            print('  {:<6} {:6.2f} us/decode, expires={!r}'.format(name, seconds / number * 1e6,
+                                                                   result.get('expires')))
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-n', '--number', type=int, default=20000)
+
+    args = argparser.parse_args()
+    main(args.number)
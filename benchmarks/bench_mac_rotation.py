@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Downtime of MAC rotations (mac_rotation.py) against the stub portal in a network namespace: the stub counts
+session and quota per client MAC, the manager (CDWiFi) reaches it over a veth pair. Every time the cap is
+reached, the host side of the veth gets a new MAC and logs in again. Needs root.
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from retry import RetryEngine
+from mac_rotation import MacRotation
+from bench_managers import create_manager
+from stub_portal import StubProcess
+
+NETNS = 'dbwifi-bench'
+IFNAME = 'dbwifi0'
+PEER = 'dbwifi-peer'
+ADDRESS = '10.77.0.2'
+STUB_ADDRESS = '10.77.0.1'
+
+
+def ip(*args, check=True):
+    subprocess.run(('ip',) + args, check=check, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def setup():
+    ip('netns', 'add', NETNS)
+    ip('link', 'add', IFNAME, 'type', 'veth', 'peer', 'name', PEER, 'netns', NETNS)
+    ip('addr', 'add', ADDRESS + '/24', 'dev', IFNAME)
+    ip('link', 'set', 'dev', IFNAME, 'up')
+    ip('-n', NETNS, 'addr', 'add', STUB_ADDRESS + '/24', 'dev', PEER)
+    ip('-n', NETNS, 'link', 'set', 'dev', PEER, 'up')
+    ip('-n', NETNS, 'link', 'set', 'dev', 'lo', 'up')
+
+
+def teardown():
+    # Removes the veth pair along with it
+    ip('netns', 'del', NETNS, check=False)
+    ip('link', 'del', IFNAME, check=False)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(rotations, latency, loss, time_to_cap, interval):
+    teardown()
+    setup()
+    stub = None
+    try:
+        limit = 1024 * 1024
+        stub = StubProcess(netns=NETNS, host=STUB_ADDRESS, latency=latency, loss=loss, per_mac=1,
+                           quota_limit=limit, quota_rate=int(limit / time_to_cap))
+        manager = create_manager('db_cdwifi.DBCDWiFiManager', stub.address)
+        rotation = MacRotation()
+        rotation.min_interval = 0
+        if not RetryEngine().login(manager):
+            print('Not online at the start')
+            return
+
+        for _ in range(rotations):
+            while not (manager.is_online and rotation.due(manager, IFNAME)):
+                time.sleep(interval)
+                manager.update_online()
+            rotation.rotate(manager, IFNAME)
+
+        for done in rotation.rotations:
+            print(done)
+        downtimes = [done.downtime for done in rotation.rotations if done.downtime is not None]
+        resets = sum(done.quota_reset for done in rotation.rotations)
+        if downtimes:
+            print('downtime median {:.0f} ms, max {:.0f} ms, quota reset {} of {}'.format(
+                percentile(downtimes, 0.5) * 1000, max(downtimes) * 1000, resets, rotations))
+    finally:
+        if stub is not None:
+            stub.stop()
+        teardown()
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-n', '--rotations', type=int, default=5)
+    argparser.add_argument('-l', '--latency', type=float, default=0.02, help='Round-trip time of the portal (s)')
+    argparser.add_argument('--loss', type=float, default=0.0, help='Probability of a dropped request')
+    argparser.add_argument('-c', '--time-to-cap', type=float, default=2, help='Seconds online until the cap')
+    argparser.add_argument('-i', '--interval', type=float, default=0.5, help='Seconds between polls')
+
+    args = argparser.parse_args()
+    if os.geteuid() != 0:
+        sys.exit('Needs root for the network namespace and the MAC changes')
+    main(args.rotations, args.latency, args.loss, args.time_to_cap, args.interval)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark of all managers against the stub portal (stub_portal.py), reporting for each manager class
+the time-to-online from a captive state, and requests, wall and CPU time per poll once online.
+"""
+
+import os
+import sys
+import time
+import importlib
+
+BASEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASEDIR)
+
+from stub_portal import StubProcess, route_to_stub
+
+CASES = [
+    ('WIFIonICE (new API)', 'db_wifionice.DBWifiOnICEManager', {'api': 'new'}),
+    ('WIFIonICE (old API)', 'db_wifionice.DBWifiOnICEManager', {'api': 'old'}),
+    ('CDWiFi', 'db_cdwifi.DBCDWiFiManager', {}),
+    ('DBLounge', 'db_lounge.DBLoungeManager', {'captive_redirect': 1}),
+    ('DBLounge (no redirect)', 'db_lounge.DBLoungeManager', {'captive_redirect': 0}),
+    ('Wifi@DB Suewex', 'db_wifiatdb_suewex.DBWifiAtDBSuewex', {'api': 'new'}),
+]
+
+
+def create_manager(path, address):
+    module_name, class_name = path.rsplit('.', 1)
+    manager = getattr(importlib.import_module(module_name), class_name)()
+    route_to_stub(manager.session, address)
+    if hasattr(manager, 'dns'):
+        # The onboard resolver is not there, every name points to the stub anyway
+        manager.dns.entries = {host: ('172.18.0.1', float('inf')) for host in (manager.api_host, manager.api_host_new)}
+    return manager
+
+
+def time_to_online(manager, stub, max_tries=10):
+    """ (seconds, requests) from captive to online, checking and logging in without pauses """
+    stub.set(online=0)
+    before = stub.stats()['requests']
+    start = time.perf_counter()
+    for _ in range(max_tries):
+        manager.update_online()
+        if manager.is_online:
+            break
+        manager.login()
+    else:
+        return None, stub.stats()['requests'] - before
+    return time.perf_counter() - start, stub.stats()['requests'] - before
+
+
+def poll_cost(manager, stub, polls):
+    """ (requests, wall seconds, CPU seconds) per poll while online """
+    stub.set(online=1)
+    before = stub.stats()['requests']
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(polls):
+        manager.update_online()
+        manager.get_quota()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return (stub.stats()['requests'] - before) / polls, wall / polls, cpu / polls
+
+
+def main(runs, polls, latency, loss, only=None):
+    stub = StubProcess(latency=latency, loss=loss, quota_rate=100000)
+    print('{:<22} {:>12} {:>10} {:>10} {:>10} {:>10}'.format(
+        'manager', 'online (ms)', 'req/login', 'req/poll', 'ms/poll', 'CPU ms'))
+    try:
+        for name, path, state in CASES:
+            if only and only.lower() not in name.lower():
+                continue
+            stub.set(**state)
+            manager = create_manager(path, stub.address)
+
+            times, requests = [], []
+            for _ in range(runs):
+                seconds, count = time_to_online(manager, stub)
+                requests.append(count)
+                if seconds is not None:
+                    times.append(seconds)
+            times.sort()
+            online = '{:.1f}'.format(times[len(times) // 2] * 1000) if times else 'never'
+
+            per_poll, wall, cpu = poll_cost(manager, stub, polls)
+            print('{:<22} {:>12} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.2f}'.format(
+                name, online, sum(requests) / len(requests), per_poll, wall * 1000, cpu * 1000))
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-n', '--runs', type=int, default=10, help='Logins per manager')
+    argparser.add_argument('-p', '--polls', type=int, default=50, help='Polls per manager while online')
+    argparser.add_argument('-l', '--latency', type=float, default=0.05, help='Round-trip time of the portal (s)')
+    argparser.add_argument('--loss', type=float, default=0.0, help='Probability of a dropped request')
+    argparser.add_argument('manager', nargs='?', help='Only benchmark managers matching this name')
+
+    args = argparser.parse_args()
+    main(args.runs, args.polls, args.latency, args.loss, args.manager)
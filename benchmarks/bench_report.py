@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Time of the trip analytics (report.py) over a synthetic history, with a sample every History.sample_interval
+seconds like the history keeps them.
+
+The history has trips of a few hours on alternating trains, with a drop and a login every few minutes and
+a steadily growing quota.
+"""
+
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from history import History, DTYPE, EVENT_LOGIN
+from report import Analysis
+
+
+def synthetic(days, trip_hours=4, drop_every=300, seed=1, interval=History.sample_interval):
+    random = numpy.random.default_rng(seed)
+    n = int(days * 86400 / interval)
+    records = numpy.zeros(n, dtype=numpy.dtype(DTYPE))
+    records['timestamp'] = time.time() - n * interval + numpy.arange(n) * interval
+    drop_every //= interval
+    trip = numpy.arange(n) // int(trip_hours * 3600 / interval)
+    records['ssid'] = numpy.where(trip % 3 == 0, b'CDWiFi', b'WIFIonICE')
+    records['network'] = numpy.array([bytes([2, 0, 0, 0, 0, i]) for i in range(50)], dtype='V6')[trip % 50]
+    position = numpy.arange(n) % drop_every
+    outage = random.integers(3, 7, size=n // drop_every + 1)[numpy.arange(n) // drop_every]
+    records['online'] = position < drop_every - outage
+    records['event'] = numpy.where(position == drop_every - outage + 2, EVENT_LOGIN, 0)
+    records['quota'] = (numpy.arange(n) % int(trip_hours * 3600 / interval)) / (trip_hours * 3600 / interval) * 1.2
+    return records
+
+
+def main(days, runs):
+    records = synthetic(days)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        analysis = Analysis(records)
+        analysis.group(numpy.arange(len(analysis.trip_start)))
+        analysis.group(records['ssid'][analysis.trip_start])
+        analysis.group(records['network'][analysis.trip_start])
+        times.append(time.perf_counter() - start)
+    times.sort()
+    print('{} samples ({} days): median {:.0f} ms'.format(len(records), days, times[len(times) // 2] * 1000))
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-d', '--days', type=float, default=90)
+    argparser.add_argument('-n', '--runs', type=int, default=5)
+
+    args = argparser.parse_args()
+    main(args.days, args.runs)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Batch-mode time-to-online against the stub portal (stub_portal.py): the old loop (5 tries, 1s apart)
+against the deadline-based retry engine, with latency and loss on the portal.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from retry import RetryEngine
+from bench_managers import CASES, create_manager
+from stub_portal import StubProcess
+
+
+def old_loop(manager):
+    """ What DBManager.run did in batch mode before the retry engine """
+    for _ in range(5):
+        manager.update_online()
+        if manager.is_online:
+            return True
+        manager.login()
+        time.sleep(1)
+    return False
+
+
+def new_engine(manager):
+    return RetryEngine().login(manager)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(runs, latency, loss, manager_name):
+    path, state = next((path, state) for name, path, state in CASES if manager_name.lower() in name.lower())
+    stub = StubProcess(latency=latency, loss=loss, **state)
+    try:
+        for name, login in (('old loop', old_loop), ('retry engine', new_engine)):
+            times, failed = [], 0
+            for _ in range(runs):
+                manager = create_manager(path, stub.address)
+                stub.set(online=0)
+                start = time.perf_counter()
+                if login(manager):
+                    times.append(time.perf_counter() - start)
+                else:
+                    failed += 1
+            if times:
+                print('{:<14} median {:6.0f} ms, p99 {:6.0f} ms, {} of {} failed'.format(
+                    name, percentile(times, 0.5) * 1000, percentile(times, 0.99) * 1000, failed, runs))
+            else:
+                print('{:<14} never online'.format(name))
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-n', '--runs', type=int, default=50)
+    argparser.add_argument('-l', '--latency', type=float, default=0.1, help='Round-trip time of the portal (s)')
+    argparser.add_argument('--loss', type=float, default=0.2, help='Probability of a dropped request')
+    argparser.add_argument('manager', nargs='?', default='WIFIonICE (old', help='Manager to benchmark')
+
+    args = argparser.parse_args()
+    main(args.runs, args.latency, args.loss, args.manager)
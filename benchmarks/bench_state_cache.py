@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Cold vs. warm batch-mode time-to-online of the WIFIonICE manager against the stub portal (stub_portal.py).
+
+Cold: empty state cache, so the hosts are resolved and the API version is probed.
+Warm: the state cache written by the cold run, so it goes straight to the status check.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db_wifionice import DBWifiOnICEManager
+from state_cache import StateCache
+from stub_portal import State, start, route_to_stub
+
+
+class StubResolver:
+    """ Answers every name with the onboard address, a lookup costs one round-trip """
+    latency = 0.05
+
+    class Answer(list):
+        class rrset:
+            ttl = 300
+
+    class Record:
+        address = '172.18.0.1'
+
+    def resolve(self, host):
+        time.sleep(self.latency)
+        return self.Answer([self.Record()])
+
+
+def time_to_online(cache_path, address):
+    manager = DBWifiOnICEManager()
+    manager.dns.resolver = StubResolver()
+    route_to_stub(manager.session, address)
+    manager.state = StateCache(cache_path).network(DBWifiOnICEManager.SSID, bssid='00:00:00:00:00:01')
+    start = time.perf_counter()
+    while not manager.is_online:
+        manager.update_online()
+    return time.perf_counter() - start
+
+
+def main(runs, latency):
+    state = State()
+    state.set(online=True, api='new', latency=latency)
+    StubResolver.latency = latency
+    server = start(state)
+    address = '127.0.0.1:{}'.format(server.server_address[1])
+
+    cold, warm = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, 'state.json')
+            cold.append(time_to_online(cache_path, address))
+            warm.append(time_to_online(cache_path, address))
+    server.shutdown()
+
+    for name, times in (('cold', cold), ('warm', warm)):
+        times.sort()
+        print('{}: median {:.1f} ms, max {:.1f} ms'.format(name, times[len(times) // 2] * 1000, times[-1] * 1000))
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument('-n', '--runs', type=int, default=20)
+    argparser.add_argument('-l', '--latency', type=float, default=0.05, help='Round-trip time of the portal (s)')
+
+    args = argparser.parse_args()
+    main(args.runs, args.latency)
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Local simulator of the portals the managers talk to, so they can be measured without sitting on a train.
+
+One HTTP server answers for all hosts, dispatching on the path:
+    /de/, /de/?login, /usage_info          wifionice (old API), with CSRF token
+    /, /api/jsonp/user                     ombord (new API)
+    /api/jsonp/connectivity                CDWiFi
+    /portal/api/vehicle/gateway/...        CDWiFi data/limit and user/authenticate
+    /success.txt, /generate_204, ...       captive portal probes (see captive.py), captive while offline
+    /auth/login.php, /logon                hotsplots (DBLounge), with meta refresh
+    /connect.php                           Wifi@DB Suewex portal (wifi-bahn.de)
+    / on public-wifi.deutschebahn.com      Wifi@DB PublicWifi portal, subscribe and authenticate
+
+It is controlled over HTTP as well:
+    GET  /__stats                          {"requests": n, "paths": {...}}
+    POST /__state?online=0&latency=0.1     change the simulated state (see State)
+
+Use route_to_stub(session, address) to send all requests of a manager's session to the simulator.
+With per_mac, the session and the quota belong to the client's MAC (looked up in the ARP table, so the
+client has to be on a link of the simulator, e.g. a veth pair into a netns, see bench_mac_rotation.py).
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import threading
+import subprocess
+from urllib.parse import urlsplit, urlunsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CSRF_TOKEN = '0123456789abcdef0123456789abcdef'
+
+
+class State:
+    online = False
+    # 'new' for trains with the ombord API, 'old' for the wifionice page only
+    api = 'new'
+    # Round-trip time (s) and probability that a request is dropped
+    latency = 0.0
+    loss = 0.0
+    # Redirect the captive portal check instead of answering with the portal directly
+    captive_redirect = True
+    # Portal behind the captive portal check: 'hotsplots', 'suewex' or 'publicwifi'
+    captive_portal = 'hotsplots'
+    # Traffic (bytes/s) while online and the throttle cap (bytes)
+    quota_rate = 0
+    quota_limit = 200 * 1024 * 1024
+    # Seconds until the session expires after a login, 0 for never
+    session_time = 0
+    # A new client MAC starts offline with an unused quota, like on the trains
+    per_mac = False
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.paths = {}
+        self.online_since = None
+        self.used_before = 0
+        self.mac = None
+
+    def set(self, **values):
+        for key, value in values.items():
+            if not hasattr(State, key) or key.startswith('_'):
+                raise KeyError(key)
+            default = getattr(State, key)
+            if isinstance(default, bool):
+                value = value in (True, '1', 'true', 'True')
+            elif isinstance(default, (int, float)):
+                value = type(default)(value)
+            if key == 'online':
+                self.set_online(value)
+            else:
+                setattr(self, key, value)
+
+    def set_online(self, online):
+        with self.lock:
+            if online and not self.online:
+                self.online_since = time.time()
+            elif not online and self.online:
+                self.used_before = self.used()
+                self.online_since = None
+            self.online = online
+
+    def check_client(self, address):
+        mac = arp_lookup(address)
+        with self.lock:
+            if mac is None or mac == self.mac:
+                return
+            if self.mac is not None:
+                self.online, self.online_since, self.used_before = False, None, 0
+            self.mac = mac
+
+    def check_expiry(self):
+        if self.online and self.session_time and time.time() - self.online_since > self.session_time:
+            self.set_online(False)
+
+    def used(self):
+        if self.online_since is None:
+            return self.used_before
+        return min(self.used_before + int((time.time() - self.online_since) * self.quota_rate), self.quota_limit)
+
+    def timeleft(self):
+        if not self.online or not self.session_time:
+            return 0
+        return max(0, int(self.session_time - (time.time() - self.online_since)))
+
+
+def arp_lookup(address):
+    """ MAC of a neighbour from the ARP table, None if not there """
+    try:
+        with open('/proc/net/arp') as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if fields[0] == address and fields[3] != '00:00:00:00:00:00':
+                    return fields[3]
+    except OSError:
+        pass
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in one segment, a separate small body write would wait for the
+    # client's delayed ACK on kept-alive connections
+    wbufsize = 1 << 16
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        parts = urlsplit(self.path)
+        path = re.sub('/+', '/', parts.path)
+        query = parse_qs(parts.query, keep_blank_values=True)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = parse_qs(self.rfile.read(length).decode('utf-8', 'replace')) if length else {}
+
+        if path.startswith('/__'):
+            return self.control(path, query)
+
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            state.paths[path] = state.paths.get(path, 0) + 1
+        if state.per_mac:
+            state.check_client(self.client_address[0])
+        state.check_expiry()
+
+        if state.latency:
+            time.sleep(state.latency)
+        if state.loss and random.random() < state.loss:
+            self.close_connection = True
+            return
+
+        handler = getattr(self, 'portal_' + (re.sub('[/.-]', '_', path.strip('/')) or 'index'), None)
+        if handler is None:
+            return self.reply(404, 'Not found')
+        return handler(method, query, body)
+
+    def reply(self, status=200, body='', content_type='text/html', headers=None):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def control(self, path, query):
+        if path == '/__state':
+            self.state.set(**{key: values[-1] for key, values in query.items()})
+        stats = {'requests': self.state.requests, 'paths': self.state.paths, 'online': self.state.online,
+                 'mac': self.state.mac}
+        return self.reply(body=json.dumps(stats), content_type='application/json')
+
+    # wifionice, old API
+    def portal_de(self, method, query, body):
+        if method == 'POST' and 'login' in query:
+            # Trains with the new API don't seem to check the token
+            if self.state.api == 'new' or body.get('CSRFToken', [''])[0] == CSRF_TOKEN:
+                self.state.set_online(True)
+        word = 'online' if self.state.online else 'offline'
+        meter = '<div>Data meter header</div>' if self.state.online else ''
+        page = '<html><body>{}<form><input type="hidden" name="CSRFToken" value="{}"></form>{}</body></html>'
+        return self.reply(body=page.format(meter, CSRF_TOKEN, ' '.join(['<p>{}</p>'.format(word)] * 10)))
+
+    def portal_usage_info(self, method, query, body):
+        return self.reply(body='{:.2f}'.format(self.state.used() / self.state.quota_limit), content_type='text/plain')
+
+    # ombord, new API
+    def portal_index(self, method, query, body):
+        if self.headers.get('Host', '').startswith('public-wifi.'):
+            return self.public_wifi(method, body)
+        if self.state.api != 'new':
+            return self.reply(404, 'Not found')
+        return self.reply(body='<html><head><title>Ombord</title></head><body>{}</body></html>'.format('ombord ' * 20))
+
+    def portal_api_jsonp_user(self, method, query, body):
+        if self.state.api != 'new':
+            return self.reply(404, 'Not found')
+        state = self.state
+        timeleft = state.timeleft()
+        user = {
+            'version': '1.9', 'ip': '172.16.100.116', 'mac': '6C:88:14:84:84:88',
+            'online': '1' if state.online else '0', 'timeleft': str(timeleft), 'authenticated': '1',
+            'userclass': '2', 'expires': time.ctime(time.time() + timeleft) if timeleft else 'Never',
+            'timeused': '0', 'data_download_used': str(state.used()), 'data_upload_used': '0',
+            'data_total_used': str(state.used()), 'data_download_limit': str(state.quota_limit),
+            'data_upload_limit': '0', 'data_total_limit': '0', 'cap_level': '0',
+        }
+        callback = query.get('callback', [''])[0]
+        return self.reply(body='{}({});\n'.format(callback, json.dumps(user)), content_type='application/javascript')
+
+    # CDWiFi
+    def portal_api_jsonp_connectivity(self, method, query, body):
+        status = {'online': '1' if self.state.online else '0'}
+        return self.reply(body='({});\n'.format(json.dumps(status)), content_type='application/javascript')
+
+    def portal_portal_api_vehicle_gateway_data_limit(self, method, query, body):
+        limit = {'usedAmount': self.state.used(), 'totalLimit': self.state.quota_limit}
+        return self.reply(body=json.dumps(limit), content_type='application/json')
+
+    def portal_portal_api_vehicle_gateway_user_authenticate(self, method, query, body):
+        self.state.set_online(True)
+        return self.reply(body='{}', content_type='application/json')
+
+    # Captive portal probes and hotsplots (DBLounge)
+    def portal_success_txt(self, method, query, body):
+        return self.captive_probe(200, 'success\n')
+
+    def portal_generate_204(self, method, query, body):
+        return self.captive_probe(204, '')
+
+    def portal_connecttest_txt(self, method, query, body):
+        return self.captive_probe(200, 'Microsoft Connect Test')
+
+    def portal_hotspot_detect_html(self, method, query, body):
+        return self.captive_probe(200, '<HTML><HEAD><TITLE>Success</TITLE></HEAD><BODY>Success</BODY></HTML>')
+
+    # Where the probes are redirected to, and the page answering them
+    CAPTIVE_PORTALS = {
+        'hotsplots': ('http://www.hotsplots.de/auth/login.php?res=notyet', 'login_page'),
+        'suewex': ('http://wifi-bahn.de/connect.php', 'suewex_page'),
+        'publicwifi': ('https://public-wifi.deutschebahn.com/', 'public_wifi_page'),
+    }
+
+    def captive_probe(self, status, answer):
+        if self.state.online:
+            return self.reply(status, answer, content_type='text/plain')
+        location, page = self.CAPTIVE_PORTALS[self.state.captive_portal]
+        if self.state.captive_redirect:
+            return self.reply(302, '<html><body><a href="{0}">{0}</a></body></html>'.format(location),
+                              headers={'Location': location})
+        return getattr(self, page)()
+
+    def login_page(self):
+        fields = {'challenge': '5c3f8a0e1b9d4f2a7e6c1d0b3a9f8e7d', 'uamip': '192.168.44.1', 'uamport': '80'}
+        inputs = ''.join('<input type="hidden" name="{}" value="{}">'.format(k, v) for k, v in fields.items())
+        # Like the real page, the form comes after a few kB of head
+        head = '<head><title>hotsplots</title>{}</head>'.format(
+            ''.join('<link rel="stylesheet" href="/css/portal-{}.css">'.format(i) for i in range(40)))
+        return self.reply(body='<html>{}<body><form method="post" action="/auth/login.php">{}'
+                               '<input type="checkbox" name="termsOK"></form></body></html>'.format(head, inputs))
+
+    def portal_auth_login_php(self, method, query, body):
+        if method == 'GET':
+            return self.login_page()
+        if body.get('challenge') and body.get('termsOK'):
+            return self.reply(body='<html><head><meta http-equiv="refresh" content="0;url=http://192.168.44.1:3990/'
+                                   'logon?username=agb"></head><body><img src="loading.gif"></body></html>')
+        return self.login_page()
+
+    def portal_logon(self, method, query, body):
+        self.state.set_online(True)
+        return self.reply(body='<html><body><div class="alert_success">Online</div></body></html>')
+
+    # Wifi@DB
+    def portal_connect_php(self, method, query, body):
+        # Any request logs in, the page then asks the ombord API
+        self.state.set_online(True)
+        return self.suewex_page()
+
+    def suewex_page(self):
+        return self.reply(body='<html><head><title>Wifi@DB</title><script src="https://www.ombord.info/api/jsonp/'
+                               'user/?callback=jQuery311013181348935550807_1533860865681"></script></head>'
+                               '<body>Connected</body></html>',
+                          headers={'Set-Cookie': 'PHPSESSID=9f1c2e7a4b; path=/'})
+
+    def public_wifi(self, method, body):
+        action = body.get('action', [''])[0]
+        if method == 'POST' and action == 'subscribe':
+            account = {'login': 'arw005o', 'password': '5QMu7v6o'}
+            return self.reply(body=json.dumps(account), content_type='application/json')
+        if method == 'POST' and action == 'authenticate':
+            if body.get('login', [''])[0] == 'arw005o' and body.get('password', [''])[0] == '5QMu7v6o':
+                self.state.set_online(True)
+                return self.reply(body=json.dumps({'success': True}), content_type='application/json')
+            return self.reply(403, json.dumps({'success': False}), content_type='application/json')
+        return self.public_wifi_page()
+
+    def public_wifi_page(self):
+        return self.reply(body='<html><head><title>Wifi@DB</title></head><body><form id="subscribe">'
+                               '<input type="hidden" name="action" value="subscribe">'
+                               '<input type="hidden" name="type" value="one">'
+                               '<input type="checkbox" name="connect_policy_accept"></form>'
+                               '<script>var wispr_mode = false;</script></body></html>')
+
+
+def start(state=None, port=0, host='127.0.0.1'):
+    """ Start the simulator in a thread of this process, returns the server """
+    handler = type('Handler', (PortalHandler,), {'state': state or State()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StubProcess:
+    """ The simulator in its own process, so it doesn't show up in the CPU time of the manager.
+    With netns, the process runs in that network namespace and listens on host there. """
+    def __init__(self, netns=None, host='127.0.0.1', **state):
+        command = [sys.executable, __file__, '--port', '0', '--host', host]
+        if netns:
+            command = ['ip', 'netns', 'exec', netns] + command
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        self.address = '{}:{}'.format(host, int(self.process.stdout.readline().split()[-1]))
+        if state:
+            self.set(**state)
+
+    def control(self, path):
+        import urllib.request
+        request = urllib.request.Request('http://{}{}'.format(self.address, path), method='POST')
+        with urllib.request.urlopen(request) as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def set(self, **state):
+        return self.control('/__state?' + '&'.join('{}={}'.format(k, v) for k, v in state.items()))
+
+    def stats(self):
+        return self.control('/__stats')
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def stub_adapter(address, **kwargs):
+    """ requests adapter, which sends every request to the simulator at address, keeping the Host header.
+    kwargs go to the PortalAdapter, e.g. its source_address. """
+    from transport import PortalAdapter
+
+    class StubAdapter(PortalAdapter):
+        def send(self, request, **kwargs):
+            parts = urlsplit(request.url)
+            request.headers['Host'] = parts.netloc
+            request.url = urlunsplit(parts._replace(scheme='http', netloc=address))
+            return super().send(request, **kwargs)
+
+    return StubAdapter(**kwargs)
+
+
+def route_to_stub(session, address, **kwargs):
+    adapter = stub_adapter(address, **kwargs)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description="Simulates the DB/ombord/CDWiFi/hotsplots portals")
+    argparser.add_argument('-p', '--port', type=int, default=8080)
+    argparser.add_argument('--host', default='127.0.0.1')
+    for key in ('api', 'latency', 'loss', 'quota_rate', 'quota_limit', 'session_time', 'captive_portal'):
+        argparser.add_argument('--' + key.replace('_', '-'), type=type(getattr(State, key)))
+    argparser.add_argument('--per-mac', action='store_true', default=None)
+
+    args = argparser.parse_args()
+    state = State()
+    state.set(**{key: value for key, value in vars(args).items() if key not in ('port', 'host') and value is not None})
+    server = start(state, args.port, args.host)
+    print('Listening on {}'.format(server.server_address[1]), flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
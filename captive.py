@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Captive portal detection. Several well-known probe endpoints are asked, a moment apart (happy eyeballs), and
+the first conclusive answer wins. Redirects are not followed, a redirect is the portal telling us where it is; bodies are streamed and
+read up to a few hundred bytes, the expected answers are tiny and the portal pages are not needed for the
+decision. Who needs the portal page itself fetches it with fetch_portal().
+"""
+
+import logging
+from urllib.parse import urljoin
+
+import requests
+
+import batch
+
+
+class Probe:
+    def __init__(self, url, status=200, body=b''):
+        self.url = url
+        self.status = status
+        # Start of the body if we are online
+        self.body = body
+
+
+PROBES = (
+    Probe('http://detectportal.firefox.com/success.txt', body=b'success'),
+    Probe('http://connectivitycheck.gstatic.com/generate_204', status=204),
+    Probe('http://www.msftconnecttest.com/connecttest.txt', body=b'Microsoft Connect Test'),
+    Probe('http://captive.apple.com/hotspot-detect.html', body=b'<HTML><HEAD><TITLE>Success</TITLE>'),
+)
+
+# Bytes read of a probe's answer
+READ_LIMIT = 512
+# Seconds until the next probe is started while the running ones have not answered
+STAGGER = 0.25
+
+
+class Answer:
+    def __init__(self, online, portal_url=None, page=b'', cookies=(), redirected=False):
+        # True/False, None if no probe was conclusive
+        self.online = online
+        # Where the portal redirected us to, or the probe itself if the portal answered in its place
+        self.portal_url = portal_url
+        # Start of the portal's answer (page or redirect body) and the names of the cookies it set
+        self.page = page
+        self.cookies = cookies
+        # Whether page is only the body of the redirect, not the portal page
+        self.redirected = redirected
+
+
+def read_limited(response, limit=READ_LIMIT):
+    """ Start of the body of a streamed response. The connection is only kept if the body was read completely """
+    body = b''
+    for chunk in response.iter_content(limit):
+        body += chunk
+        if len(body) >= limit:
+            break
+    response.close()
+    return body[:limit]
+
+
+def probe(session, check, timeout, limit=READ_LIMIT):
+    try:
+        ret = session.get(check.url, timeout=timeout, allow_redirects=False, stream=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return Answer(None)
+
+    cookies = tuple(ret.cookies.keys())
+    if ret.is_redirect:
+        return Answer(False, urljoin(check.url, ret.headers['Location']), read_limited(ret, limit), cookies,
+                      redirected=True)
+    if ret.status_code == 511:
+        # Network Authentication Required
+        return Answer(False, check.url, read_limited(ret, limit), cookies)
+    if 200 <= ret.status_code < 300:
+        body = read_limited(ret, limit)
+        if ret.status_code == check.status and body.startswith(check.body):
+            return Answer(True)
+        return Answer(False, check.url, body, cookies)
+    ret.close()
+    return Answer(None)
+
+
+def detect(session, timeout, probes=PROBES, limit=READ_LIMIT, stagger=STAGGER):
+    """
+    Answer of the first conclusive probe, with up to limit bytes of the portal's answer. The probes are started
+    stagger apart, so usually only the first one is sent.
+    """
+    winner, answer = batch.race([lambda check=check: probe(session, check, timeout, limit) for check in probes],
+                                lambda answer: answer.online is not None, stagger)
+    if winner is None:
+        logging.debug('No captive portal probe was conclusive')
+        return Answer(None)
+    return answer
+
+
+def fetch_portal(session, answer, timeout, limit=READ_LIMIT, verify=False):
+    """ The answer with up to limit bytes of the portal page itself, if the probe only got a redirect to it """
+    if not answer.redirected:
+        return answer
+    try:
+        ret = session.get(answer.portal_url, timeout=timeout, verify=verify, stream=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        return answer
+
+    # The cookies set along the way, by the redirect and by the page
+    cookies = answer.cookies + tuple(name for response in ret.history + [ret] for name in response.cookies.keys())
+    return Answer(False, answer.portal_url, read_limited(ret, limit), tuple(dict.fromkeys(cookies)))
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Tiny client for daemon.py, used by the network-manager dispatcher. Only uses the stdlib, so it starts fast.
+Exits with 2 if the daemon is not running, so the caller can fall back to `manager.py -b`.
+"""
+
+import sys
+import socket
+
+SOCKET_PATH = '/run/dbwifi.sock'
+
+
+def send_command(command, socket_path=SOCKET_PATH, timeout=60):
+    """ Send one command to a running daemon and return its answer """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall('{}\n'.format(command).encode('utf-8'))
+        return sock.makefile('rb').readline().decode('utf-8', 'replace').strip()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: client.py up <interface> <ssid> | down <interface> | status')
+        sys.exit(1)
+
+    try:
+        print(send_command(' '.join(sys.argv[1:])))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit(2)
+    except socket.timeout:
+        print('Daemon did not answer in time')
+        sys.exit(1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Resident daemon, which keeps the managers (sessions, resolved hosts, detected API versions) warm between
+reconnects. The network-manager dispatcher talks to it via client.py over a Unix socket, so a reconnect
+costs one round-trip instead of a cold start of manager.py.
+
+Protocol: one line per request, one line per answer.
+    up <interface> <ssid>   ->  DB: 42%[, session ends in 0:12:34] | DB: ! | unknown ssid
+    down <interface>        ->  ok
+    status                  ->  <interface> <ssid> DB: 42%[; <interface> <ssid> DB: !...] | none
+
+Every interface gets its own manager, bound to it, and every request its own thread, so several uplinks (e.g. two
+wifi adapters) are handled at once: a status or the up of another interface doesn't wait for a running login.
+
+With --metrics, the request and login metrics are written to a file in the OpenMetrics text format,
+e.g. for the textfile collector of the Prometheus node exporter.
+"""
+
+import os
+import logging
+import socketserver
+
+from manager import DBManager, status_line
+from metrics import MetricsWriter
+from transport import close_transports
+from client import SOCKET_PATH
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline().decode('utf-8', 'replace').strip()
+        if not line:
+            return
+        try:
+            answer = self.server.daemon.handle_command(line.split())
+        except Exception as e:
+            logging.exception('Error while handling "{}": {}'.format(line, e))
+            answer = 'error {}'.format(e)
+        self.wfile.write('{}\n'.format(answer).encode('utf-8'))
+
+
+class ControlServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, ControlHandler)
+        os.chmod(path, 0o600)
+
+
+class DBDaemon:
+    def __init__(self, socket_path=SOCKET_PATH):
+        self.socket_path = socket_path
+        self.db_manager = DBManager(batch_mode=True)
+        # interface -> (ssid, manager)
+        self.interfaces = {}
+
+    def handle_command(self, args):
+        command, args = args[0], args[1:]
+        if command == 'up' and len(args) >= 2:
+            return self.up(args[0], ' '.join(args[1:]))
+        if command == 'down' and args:
+            return self.down(args[0])
+        if command == 'status':
+            return self.status()
+        return 'unknown command'
+
+    def up(self, interface, ssid):
+        logging.info('{} is up with {}'.format(interface, ssid))
+        # The managers, uplinks and interfaces are shared with the requests for the other interfaces
+        with self.db_manager.lock:
+            self.db_manager.network_changed(interface)
+            manager = self.db_manager.get_manager_for_ssid(ssid, ifname=interface)
+            if manager is None:
+                return 'unknown ssid'
+            self.interfaces[interface] = (ssid, manager)
+            self.db_manager.manager = manager
+        return self.db_manager.login_batch(manager)
+
+    def down(self, interface):
+        with self.db_manager.lock:
+            ssid, manager = self.interfaces.pop(interface, (None, None))
+            uplink = self.db_manager.uplinks.pop(interface, None)
+            if uplink is not None:
+                uplink.close()
+            # Its connections are gone with the link
+            close_transports(interface)
+            if manager is not None and self.db_manager.manager is manager:
+                self.db_manager.manager = None
+        return 'ok'
+
+    def status(self):
+        if not self.interfaces:
+            return 'none'
+        return '; '.join('{} {} {}'.format(interface, ssid, status_line(manager))
+                         for interface, (ssid, manager) in sorted(list(self.interfaces.items())))
+
+    def serve(self):
+        server = ControlServer(self.socket_path, self)
+        logging.warning('Listening on {}'.format(self.socket_path))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(self.socket_path)
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description="Keeps the DB Wifi managers warm and logs in on request")
+    argparser.add_argument('-s', '--socket', default=SOCKET_PATH, help='Path of the control socket')
+    argparser.add_argument('-m', '--metrics', metavar='PATH', help='Write OpenMetrics text to PATH every 15s')
+
+    args = argparser.parse_args()
+
+    metrics_writer = None
+    if args.metrics:
+        metrics_writer = MetricsWriter(args.metrics)
+        metrics_writer.start()
+    try:
+        DBDaemon(socket_path=args.socket).serve()
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        if metrics_writer is not None:
+            metrics_writer.stop()
@@ -1,27 +1,113 @@
 import requests
 import json
+import time
 import logging
 
+from state_cache import NetworkState
+from dns_cache import system_cache
+from transport import shared_transport, transport_for
+
 
 class DBManager:
     """
     The Interface all managers have to comply to.
     """
+    # Timeout (s) of each request, lowered by the retry engine when its deadline comes closer
+    timeout = 5
+    # Default protocol of _make_request(), and whether to check the portal's certificate
+    protocol = 'http'
+    verify = False
+
     def __init__(self):
         self.quota = None
+        # Throttle cap in bytes, if the portal tells us
+        self.data_limit = None
+        # time.monotonic() when the portal session ends, None if unknown or unlimited
+        self.session_expires = None
 
         self.is_online = None
 
         self.json_decoder = json.JSONDecoder()
-        self.session = requests.Session()
+        self.session = self._create_session()
         self.csrf_token = None
 
+        # Cached knowledge about the current network, replaced by the DBManager with a persistent one
+        self.state = NetworkState()
+        # Extrapolates the quota between portal readings, set by the DBManager if the interface is known
+        self.quota_estimator = None
+
     def get_quota(self):
-        return self.quota if self.quota else 0
+        quota = self.quota if self.quota else 0
+        if self.quota_estimator is not None:
+            return self.quota_estimator.estimate(quota)
+        return quota
+
+    def set_quota(self, quota, limit=None):
+        """ An authoritative reading of the quota (and the cap in bytes) from the portal """
+        self.quota = quota
+        if limit is not None:
+            self.data_limit = limit
+        if self.quota_estimator is not None:
+            self.quota_estimator.sync(quota)
+
+    def quota_fetch_needed(self):
+        """ False while the estimator can answer get_quota() without asking the portal """
+        return self.quota_estimator is None or self.quota_estimator.needs_sync()
+
+    def time_until_cap(self):
+        """ Projected seconds until the throttle cap, None if unknown """
+        if self.quota_estimator is None:
+            return None
+        return self.quota_estimator.time_until_cap()
+
+    def session_left(self):
+        """ Seconds until the portal session ends, None if unknown or unlimited """
+        if self.session_expires is None:
+            return None
+        return max(0, self.session_expires - time.monotonic())
+
+    def update_session(self, status):
+        """ Session end from the 'timeleft'/'expires' fields of the ombord API """
+        timeleft = status.get('timeleft')
+        expires = status.get('expires')
+        if type(timeleft) is int and timeleft > 0:
+            self.session_expires = time.monotonic() + timeleft
+        elif expires and expires != 'Never':
+            try:
+                expires = time.mktime(time.strptime(expires, '%a %b %d %H:%M:%S %Y'))
+                self.session_expires = time.monotonic() + expires - time.time()
+            except ValueError:
+                self.session_expires = None
+        else:
+            self.session_expires = None
+
+    def _create_session(self):
+        """ A session on the shared connection pool """
+        session = shared_transport().session()
+        self._mount_dns(session)
+        return session
+
+    def _mount_dns(self, session):
+        """ Resolve with the system DNS cache """
+        system_cache().mount(session)
+
+    def bind(self, ifname):
+        """ Send all requests of this manager from the interface """
+        transport_for(ifname).mount(self.session)
+        self._mount_dns(self.session)
+
+    def _timeouts(self):
+        """ (connect, read) timeout of a request """
+        return shared_transport().timeout(self.timeout)
+
+    def _make_request(self, url, protocol=None):
+        return self._send('GET', '{}://{}'.format(protocol or self.protocol, url))
 
-    def _make_request(self, url, protocol='http'):
+    def _send(self, method, url, data=None, verify=None):
+        """ The response, False if the request failed """
         try:
-            return self.session.get('{}://{}'.format(protocol, url), timeout=5, verify=False)
+            return self.session.request(method, url, data=data, timeout=self._timeouts(),
+                                        verify=self.verify if verify is None else verify)
         except requests.Timeout:
             return False
         except requests.ConnectionError as e:
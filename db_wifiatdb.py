@@ -1,45 +1,128 @@
 #!/usr/bin/env python3
 
-import requests
 import logging
-import re
+from urllib.parse import urlsplit
 
+import captive
 from db_wifiatdb_suewex import DBWifiAtDBSuewex
-from db_wifiatdb_publicwifi import DBWifiAtDBPublicWifi
+from dns_cache import system_cache
+from state_cache import default_gateway
+from transport import shared_transport
 
 logging.getLogger("requests").setLevel(logging.WARNING)
 
 
+class Fingerprint:
+    """
+    How the portal of a provider answers the first captive portal probe. Every matching feature is a vote
+    for the provider:
+        hosts      host (or parent domain) the probe is redirected to
+        locations  substrings of the redirect target
+        markers    substrings of the start of the portal page
+        gateways   address of the default gateway
+        cookies    names of cookies the portal sets
+    Gateways and cookies are common to many portals (private addresses, PHPSESSID), so they only add to the
+    votes of a provider which one of the other features picked.
+    """
+    def __init__(self, provider, hosts=(), locations=(), gateways=(), cookies=(), markers=()):
+        self.provider = provider
+        self.hosts = hosts
+        self.locations = locations
+        self.gateways = gateways
+        self.cookies = cookies
+        self.markers = markers
+
+
+class FingerprintIndex:
+    def __init__(self, fingerprints):
+        # (feature, value) -> providers, for the exact features
+        self.exact = {}
+        # (feature, value) -> providers, for the features which only support a match
+        self.supporting = {}
+        # (substring, provider), for the redirect target and the page
+        self.locations = []
+        self.markers = []
+        for fingerprint in fingerprints:
+            provider = fingerprint.provider
+            for value in fingerprint.hosts:
+                self.exact.setdefault(('host', value), []).append(provider)
+            for feature, values in (('gateway', fingerprint.gateways), ('cookie', fingerprint.cookies)):
+                for value in values:
+                    self.supporting.setdefault((feature, value), []).append(provider)
+            self.locations.extend((location, provider) for location in fingerprint.locations)
+            self.markers.extend((marker, provider) for marker in fingerprint.markers)
+
+    def match(self, answer, gateway=None):
+        """
+        The provider with the most matching features, None if no host, location or marker matches.
+        answer should have the portal page.
+        """
+        features = []
+        host = urlsplit(answer.portal_url).hostname if answer.portal_url else None
+        if host:
+            labels = host.split('.')
+            features += [('host', '.'.join(labels[i:])) for i in range(len(labels) - 1)]
+
+        votes = {}
+        for feature in features:
+            for provider in self.exact.get(feature, ()):
+                votes[provider] = votes.get(provider, 0) + 1
+        for location, provider in self.locations:
+            if answer.portal_url and location in answer.portal_url:
+                votes[provider] = votes.get(provider, 0) + 1
+        for marker, provider in self.markers:
+            if marker in answer.page:
+                votes[provider] = votes.get(provider, 0) + 1
+        for feature in [('gateway', gateway)] + [('cookie', name) for name in answer.cookies]:
+            for provider in self.supporting.get(feature, ()):
+                if provider in votes:
+                    votes[provider] += 1
+        return max(votes, key=votes.get) if votes else None
+
+
 class DBWifiAtDBDecider:
     """
     Wifi@DB is used by many different providers, only differing the captive portal.
 
     Therefore, we check the captive portal here to decide which provider works for
-    the specific portal, if we know any.
+    the specific portal, if we know any. One probe answer is matched against the
+    fingerprints of the providers; new providers only need an entry in FINGERPRINTS.
     """
     SSID = "Wifi@DB"
-    PROVIDERS = {
-        DBWifiAtDBSuewex.URL: DBWifiAtDBSuewex,
-        DBWifiAtDBPublicWifi.URL: DBWifiAtDBPublicWifi,
-    }
-
-    def get_specific_provider(self):
-        ret = requests.get('detectportal.firefox.com/success.txt')
-        if ret.ok:
-            if ret.text == 'success':
+    FINGERPRINTS = (
+        # An ombord gateway (the clients get 172.16.0.0/16) with a PHP portal that asks the ombord API
+        Fingerprint(DBWifiAtDBSuewex, hosts=(DBWifiAtDBSuewex.URL,), locations=('/connect.php',),
+                    gateways=('172.16.0.1',), cookies=('PHPSESSID',),
+                    markers=(b'ombord.info/api/jsonp/user/?callback=jQuery',)),
+        # DBWifiAtDBPublicWifi (db_wifiatdb_publicwifi.py) is not in here until its login was seen working
+    )
+    PROVIDERS = {fingerprint.provider.URL: fingerprint.provider for fingerprint in FINGERPRINTS}
+    INDEX = FingerprintIndex(FINGERPRINTS)
+    timeout = 5
+    # Bytes of the portal page to look for markers in
+    read_limit = 16384
+
+    def __init__(self):
+        self.session = shared_transport().session()
+        system_cache().mount(self.session)
+
+    def get_specific_provider(self, ifname=None):
+        answer = captive.detect(self.session, shared_transport().timeout(self.timeout))
+        if answer.online is None:
+            logging.debug('Portal detection failed, probably bad wifi')
+            return None
+
+        if self.INDEX.markers:
+            answer = captive.fetch_portal(self.session, answer, shared_transport().timeout(self.timeout),
+                                          limit=self.read_limit)
+        provider = self.INDEX.match(answer, default_gateway(ifname))
+        if provider is None:
+            if answer.online:
                 logging.warning('Already logged in, cannot determine which Portal we are connected to')
-                return None
-
-            base_url = re.search(r'https?://(.+)/', ret.url)
-            if not base_url:
-                logging.error('Cannot get base_url, portal is: {}'.format(ret.url))
-                return None
-
-            base_url = base_url.group(1)
-            provider = self.PROVIDERS.get(base_url)
-            if provider is None:
-                logging.warning("No specific provider implemented yet for this WIFI@DB :(")
-            return provider
+            else:
+                logging.warning("No specific provider implemented yet for this WIFI@DB ({}) :(".format(
+                    answer.portal_url))
+        return provider
 
 
 if __name__ == '__main__':
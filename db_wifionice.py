@@ -2,11 +2,13 @@
 
 import requests
 import logging
-import dns.resolver
-import json
-import re
 
+import batch
+import jsonp
 from db_generic_manager import DBManager
+from dns_cache import DNSCache
+from portal_spec import read_quota, OMBORD_QUOTA
+from profiler import phase, profiled
 
 logging.getLogger("requests").setLevel(logging.WARNING)
 
@@ -18,63 +20,78 @@ class DBWifiOnICEManager(DBManager):
     api_site = "usage_info/"
     api_host_new = "www.ombord.info"
     api_site_new = "api/jsonp/user"
+    api_ttl = 24 * 3600
+    hosts_ttl = 3600
+    protocol = 'https'
 
     def __init__(self):
+        self.dns = DNSCache(nameservers=['172.18.0.1'], fallback='172.18.0.1')
         super().__init__()
-        self.quota = None
-
-        self.is_online = None
         self.new_api = None
 
-        self.json_decoder = json.JSONDecoder()
-        self.session = requests.Session()
-        self.csrf_token = None
-
-        self.resolver = dns.resolver.Resolver()
-        self.resolver.nameservers = ['172.18.0.1']
-        try:
-            self.api_host_ip = self.resolve_url(self.api_host)
-            self.api_host_new_ip = self.resolve_url(self.api_host_new)
-        except dns.exception.Timeout:
-            self.api_host_ip = "172.18.0.1"
-            self.api_host_new_ip = "172.18.0.1"
-
-    def get_quota(self):
-        quota = 0
-        if self.quota:
-            quota = self.quota
-
-        return quota
+        self.api_host_ip = None
+        self.api_host_new_ip = None
+        self.api_from_cache = False
+
+    def _mount_dns(self, session):
+        self.dns.mount(session)
+
+    @profiled('dns')
+    def resolve_hosts(self):
+        """ Both API hosts are resolved concurrently, the DNS cache refreshes them in the background """
+        hosts = self.state.get('hosts')
+        if isinstance(hosts, dict):
+            self.dns.seed(hosts)
+
+        self.api_host_ip, self.api_host_new_ip = self.dns.resolve_all(self.api_host, self.api_host_new)
+        resolved = {self.api_host: self.api_host_ip, self.api_host_new: self.api_host_new_ip}
+        # Only real answers are cached, not the fallback of a failed lookup (even if the portal is at that address)
+        if resolved != hosts and None not in resolved.values() and not self.dns.failed & set(resolved):
+            self.state.set('hosts', resolved, ttl=self.hosts_ttl)
+
+    def reset_network(self):
+        """ Rediscover hosts and API version on the next update """
+        self.api_host_ip = self.api_host_new_ip = None
+        self.dns.clear()
+        self.new_api = None
+        self.api_from_cache = False
 
-    def _make_request(self, url, protocol='https'):
-        try:
-            return self.session.get('{}://{}'.format(protocol, url), timeout=5, verify=False)
-        except requests.Timeout:
-            return False
-        except requests.ConnectionError as e:
-            logging.warning('Connection Error: {}'.format(e))
-            return False
+    def forget_network(self):
+        """ Same as reset_network(), but the cached values did not work, so drop them as well """
+        self.state.invalidate('hosts', 'new_api')
+        self.reset_network()
 
+    @profiled('check api')
     def _check_api(self):
+        """
+        Probe the new and the old API at once. Trains with the new API serve the old page as well, so a valid
+        new API answer wins, the old page only if the new API is not there.
+        Returns that answer, so the poll doesn't need another round-trip for the status.
+        """
         logging.info('Checking API version...')
-        ret = self._make_request(self.api_host_new_ip)
-        if ret is not None:
-            if ret and ret.status_code != 404 and len(ret.text) > 60:
-                self.new_api = True
-                logging.info('Using new API.')
-            else:
-                self.new_api = False
-                logging.info('Using old API.')
-
-        return self.new_api
+        winner, answer = batch.first((self._get_status_from_api, bool),
+                                     (self._get_page, lambda ret: self._page_state(ret) is not None))
+        if winner is not None:
+            self.new_api = winner == 0
+            logging.info('Using new API.' if self.new_api else 'Using old API.')
+        return answer
 
     def update_online(self):
+        self.resolve_hosts()
+        if self.new_api is None:
+            self.new_api = self.state.get('new_api')
+            self.api_from_cache = self.new_api is not None
+        answer = None
         if self.new_api is None:
-            if self._check_api() is None:
-                print('api none')
+            answer = self._check_api()
+            if self.new_api is None:
                 return
+            self.state.set('new_api', self.new_api, ttl=self.api_ttl)
 
-        on = self.update_online_new_api() if self.new_api else self.update_online_old_api()
+        on = self.update_online_new_api(answer) if self.new_api else self.update_online_old_api(answer)
+        if on is None and self.api_from_cache:
+            # The cached API version or hosts may be wrong for this train
+            self.forget_network()
         if on is False:
             if self.is_online is True or self.is_online is None:
                 logging.info('I am not online anymore! :(')
@@ -84,32 +101,51 @@ class DBWifiOnICEManager(DBManager):
                 logging.info('I am online again! :)')
             self.is_online = True
 
-    def update_online_old_api(self):
-        """ Check if we are online. Don't change the state if the check fails itself """
-        ret = self._make_request('{}/de/'.format(self.api_host_ip), protocol='http')
-        if ret and ret.status_code == 200:
-            if 'Data meter header' in ret.text:
-                self.update_quota(ret.text)
-            else:
-                self.quota = 0.0
+    def _get_page(self):
+        return self._make_request('{}/de/'.format(self.api_host_ip), protocol='http')
 
-            self.csrf_token = self._get_csrf(ret.text)
+    def _get_usage_info(self):
+        return self._make_request("www.wifionice.de/usage_info", 'http')
 
+    @staticmethod
+    def _page_state(ret):
+        """ True/False if the page says online/offline, None if it's no valid page """
+        if ret and ret.status_code == 200:
             txt = ret.text.lower()
             if txt.count('offline') > 5:
                 return False
             if txt.count('online') > 5:
                 return True
+
+    def update_online_old_api(self, ret=None):
+        """ Check if we are online. Don't change the state if the check fails itself """
+        usage_info = None
+        if ret is None:
+            with phase('status'):
+                if self.is_online and self.quota_fetch_needed():
+                    # Most likely still online, so get the quota along with the page
+                    ret, usage_info = batch.gather(self._get_page, self._get_usage_info)
+                else:
+                    ret = self._get_page()
+        if ret and ret.status_code == 200:
+            if 'Data meter header' in ret.text:
+                self.update_quota(ret.text, usage_info)
+            else:
+                self.set_quota(0.0)
+
+            self.csrf_token = self._get_csrf(ret.text)
+            return self._page_state(ret)
         else:
             logging.debug('Return object from wifionice broken!: {}'.format(ret))
 
     @staticmethod
+    @profiled('csrf')
     def _get_csrf(text):
         search_string = 'name="CSRFToken" value="'
         pos = text.find(search_string)
         return text[pos+len(search_string): pos+len(search_string)+32]
 
-    def update_online_new_api(self):
+    def update_online_new_api(self, status=None):
         """
         "version":"1.9", "ip":"172.16.100.116", "mac":"6C:88:14:84:84:88", "online":"0", "timeleft":"0",
         "authenticated":"1", "userclass":"2", "expires":"Never", "timeused":"1206", "data_download_used":"9256202",
@@ -117,44 +153,54 @@ class DBWifiOnICEManager(DBManager):
         "data_upload_limit":"0", "data_total_limit":"0", "bandwidth_download_limit":"81250",
         "bandwidth_upload_limit":"81250", "cap_level":"0"
         """
-        status = self._get_status_from_api()
+        if status is None:
+            status = self._get_status_from_api()
+        if not status:
+            return None
         print(status)
 
+        self.update_session(status)
         self.update_quota(status)
 
         return status.get('online') == "1"
 
-    def update_quota(self, api_response):
+    def update_quota(self, api_response, usage_info=None):
         if type(api_response) is dict:
-            quota = api_response.get('data_download_used', '')
-            limit = api_response.get('data_download_limit', '')
-            if quota.isdigit() and limit.isdigit():
-                self.quota = 1.0*quota/limit
+            reading = read_quota(api_response, OMBORD_QUOTA)
+            if reading is not None:
+                self.set_quota(*reading)
             return
 
-        if self.new_api is False:
-            ret = self._make_request("www.wifionice.de/usage_info", 'http')
-            if ret:
+        if self.new_api is False and (usage_info is not None or self.quota_fetch_needed()):
+            if usage_info is None:
+                with phase('quota'):
+                    usage_info = self._get_usage_info()
+            if usage_info:
                 try:
-                    self.quota = float(ret.text)
+                    self.set_quota(float(usage_info.text))
                 except ValueError:
                     pass
 
+    @profiled('status')
     def _get_status_from_api(self):
         ret = self._make_request('{}/{}'.format(self.api_host_new_ip, self.api_site_new))
         if ret and ret.status_code == 200:
-            return self.json_decoder.decode(re.sub(r'[\n\(\); ]', '', ret.text)[:-2] + '}')
+            try:
+                return jsonp.decode(ret.text)
+            except ValueError as e:
+                logging.debug('Status from API broken: {}'.format(e))
         return {}
 
     def login(self):
         """ Log in to the ICE Portal (wifionice) """
         logging.info('Trying to log in...')
         try:
-            ret = self.session.post('http://{}/de/?login'.format(self.api_host_ip),
-                                    data={'login': True, 'CSRFToken': self.csrf_token})
-        except requests.exceptions.ConnectionError:
+            with phase('login post'):
+                ret = self.session.post('http://{}/de/?login'.format(self.api_host_ip),
+                                        data={'login': True, 'CSRFToken': self.csrf_token},
+                                        timeout=self._timeouts())
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             logging.debug('Login Failed, probably bad wifi')
 
     def resolve_url(self, url):
-        rrset = self.resolver.query(url).rrset
-        return rrset.items[0].address if rrset.items else None
+        return self.dns.resolve(url)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+DNS cache honouring the record TTLs. Lookups run in the background and concurrently; once a host is known,
+an expired answer is still served while it is refreshed, so a poll never waits for the (onboard) resolver.
+"""
+
+import time
+import socket
+import logging
+import threading
+import ipaddress
+from urllib.parse import urlsplit, urlunsplit
+from requests.adapters import BaseAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from metrics import METRICS, mark
+from profiler import phase
+
+
+class DNSCache:
+    # TTL (s) for answers of the system resolver, which doesn't tell us the real one
+    default_ttl = 300
+    # TTL (s) for the fallback address, so the real name gets resolved again soon
+    fallback_ttl = 30
+
+    def __init__(self, nameservers=None, fallback=None, timeout=2):
+        self.timeout = timeout
+        self.fallback = fallback
+        self.resolver = None
+        if nameservers:
+            import dns.resolver
+            self.resolver = dns.resolver.Resolver()
+            self.resolver.nameservers = nameservers
+            self.resolver.lifetime = timeout
+
+        self.entries = {}      # host -> (address, expires)
+        self.failed = set()    # hosts which are only known by the fallback address
+        self.refreshing = {}   # host -> Future
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='dns')
+
+    def seed(self, addresses):
+        """ Known {host: address}, e.g. from the state cache. They are served, but refreshed on first use. """
+        for host, address in addresses.items():
+            if address and host not in self.entries:
+                self.entries[host] = (address, 0)
+
+    def clear(self):
+        self.entries = {}
+        self.failed = set()
+
+    def resolve(self, host):
+        return self.resolve_all(host)[0]
+
+    def resolve_all(self, *hosts):
+        """ Addresses of the hosts, unknown ones are looked up concurrently. None if a lookup fails. """
+        now = time.time()
+        missing = {}
+        for host in hosts:
+            entry = self.entries.get(host)
+            if entry is None:
+                METRICS.inc('dbwifi_dns_cache_misses')
+                missing[host] = self._refresh(host)
+            elif entry[1] < now:
+                METRICS.inc('dbwifi_dns_cache_stale_hits')
+                self._refresh(host)
+            else:
+                METRICS.inc('dbwifi_dns_cache_hits')
+
+        if missing:
+            wait(missing.values(), timeout=self.timeout + 1)
+        return [self.entries.get(host, (None, 0))[0] for host in hosts]
+
+    def _refresh(self, host):
+        with self.lock:
+            future = self.refreshing.get(host)
+            if future is None:
+                future = self.refreshing[host] = self.executor.submit(self._lookup, host)
+            return future
+
+    def _lookup(self, host):
+        start = time.perf_counter()
+        try:
+            if self.resolver is not None:
+                query = getattr(self.resolver, 'resolve', None) or self.resolver.query
+                answer = query(host)
+                address, ttl = next(iter(answer)).address, answer.rrset.ttl
+            else:
+                address, ttl = socket.gethostbyname(host), self.default_ttl
+            self.entries[host] = (address, time.time() + ttl)
+            self.failed.discard(host)
+        except Exception as e:
+            METRICS.inc('dbwifi_dns_cache_failures')
+            logging.debug('Resolving {} failed: {}'.format(host, e))
+            if self.fallback and host not in self.entries:
+                self.entries[host] = (self.fallback, time.time() + self.fallback_ttl)
+                self.failed.add(host)
+        finally:
+            METRICS.observe('dbwifi_dns_lookup_seconds', (), time.perf_counter() - start)
+            with self.lock:
+                self.refreshing.pop(host, None)
+
+    def mount(self, session):
+        """ Let the plain-http requests of the session use this cache instead of the system resolver """
+        adapter = session.get_adapter('http://')
+        if isinstance(adapter, DNSCacheAdapter):
+            adapter = adapter.adapter
+        session.mount('http://', DNSCacheAdapter(self, adapter))
+
+
+class DNSCacheAdapter(BaseAdapter):
+    """
+    Replaces the hostname of plain-http requests by its cached address and keeps it in the Host header,
+    then sends them with the adapter it wraps, so the connections stay in the shared pool.
+    https is left alone, since the certificate check and SNI need the name.
+    """
+    def __init__(self, cache, adapter):
+        super().__init__()
+        self.cache = cache
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        if parts.scheme == 'http' and parts.hostname and not _is_address(parts.hostname):
+            start = time.perf_counter()
+            with phase('dns'):
+                address = self.cache.resolve(parts.hostname)
+            mark('dns', time.perf_counter() - start)
+            if address:
+                request.headers['Host'] = parts.netloc
+                netloc = address if parts.port is None else '{}:{}'.format(address, parts.port)
+                request.url = urlunsplit(parts._replace(netloc=netloc))
+        return self.adapter.send(request, **kwargs)
+
+    def close(self):
+        # The wrapped adapter is shared with other sessions
+        pass
+
+
+def _is_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+_system_cache = None
+
+
+def system_cache():
+    """ The cache for the system resolver, shared by all managers """
+    global _system_cache
+    if _system_cache is None:
+        _system_cache = DNSCache()
+    return _system_cache
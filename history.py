@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Quota and connectivity history: one fixed-size record per poll or login in a ring buffer, which lives in a
+memory-mapped file, so it survives restarts of the daemon and batch runs and costs one pack_into per sample.
+
+Header:  magic, record size, capacity, number of records written so far
+Record:  timestamp, quota, bytes used, limit, online, event, SSID, BSSID, network
+         (bytes used/limit are -1 if unknown, online is -1 if unknown, network is the gateway MAC or BSSID
+          the state cache identifies the train by)
+
+Polls which change nothing (same online state, SSID and network) are kept every sample_interval seconds;
+the last one before a change is always kept, so outages and logins keep their exact times.
+
+The writer only needs the standard library, the reader returns NumPy arrays.
+"""
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import logging
+from bisect import bisect_left
+
+HISTORY_PATH = os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')),
+                            'dbwifi', 'history.bin')
+
+MAGIC = b'DBWIFIH1'
+HEADER = struct.Struct('<8sIIQ')
+RECORD = struct.Struct('<dfqqbB32s6s6s')
+
+EVENT_POLL = 0
+EVENT_LOGIN = 1
+EVENT_LOGIN_FAILED = 2
+EVENT_MAC_ROTATION = 3
+
+# NumPy dtype of RECORD, see History.read(). The MACs are raw bytes, S6 would drop trailing zero bytes
+DTYPE = [('timestamp', '<f8'), ('quota', '<f4'), ('used', '<i8'), ('limit', '<i8'), ('online', 'i1'),
+         ('event', 'u1'), ('ssid', 'S32'), ('bssid', 'V6'), ('network', 'V6')]
+
+
+def mac_bytes(mac):
+    try:
+        return bytes(int(part, 16) for part in mac.split(':')) if mac else b''
+    except ValueError:
+        return b''
+
+
+class History:
+    # Records in a new file (77MB), ~4 months with a sample every sample_interval seconds
+    capacity = 1 << 20
+    # Seconds between kept polls while nothing changes
+    sample_interval = 10
+
+    def __init__(self, path=HISTORY_PATH, capacity=None):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        with self._locked():
+            self.file.seek(0, os.SEEK_END)
+            if self.file.tell() < HEADER.size:
+                self._create(capacity or self.capacity)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            magic, record_size, self.capacity, _ = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or record_size != RECORD.size:
+                raise ValueError('{} is no history file of this version'.format(path))
+        # (ssid, bssid, network) -> encoded fields, so a write doesn't have to encode them again
+        self.keys = {}
+        # (timestamp, online, key) of the last record written, and the last poll skipped since then
+        self.last = None
+        self.pending = None
+
+    def _create(self, capacity):
+        self.file.truncate(HEADER.size + capacity * RECORD.size)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, RECORD.size, capacity, 0))
+        self.file.flush()
+
+    def _locked(self):
+        return _FileLock(self.file)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return min(self.written(), self.capacity)
+
+    def written(self):
+        return HEADER.unpack_from(self.map, 0)[3]
+
+    def append(self, ssid, bssid, network, online, quota, used=-1, limit=-1, event=EVENT_POLL, timestamp=None):
+        key = (ssid, bssid, network)
+        encoded = self.keys.get(key)
+        if encoded is None:
+            encoded = self.keys[key] = ((ssid or '').encode('utf-8')[:32], mac_bytes(bssid), mac_bytes(network))
+
+        online = -1 if online is None else int(online)
+        timestamp = timestamp or time.time()
+        record = (timestamp, quota, used, limit, online, event) + encoded
+        last = self.last
+        unchanged = last is not None and last[1:] == (online, key)
+        if event == EVENT_POLL and unchanged and timestamp - last[0] < self.sample_interval:
+            self.pending = record
+            return
+
+        with self._locked():
+            if self.pending is not None and not unchanged:
+                self._write(self.pending)
+            self._write(record)
+        self.pending = None
+        self.last = (timestamp, online, key)
+
+    def _write(self, record):
+        written = self.written()
+        RECORD.pack_into(self.map, HEADER.size + (written % self.capacity) * RECORD.size, *record)
+        HEADER.pack_into(self.map, 0, MAGIC, RECORD.size, self.capacity, written + 1)
+
+    def record(self, manager, ssid, bssid=None, event=EVENT_POLL):
+        """ Sample of the manager's current state """
+        quota = manager.get_quota()
+        limit = getattr(manager, 'data_limit', None) or -1
+        used = int(quota * limit) if limit > 0 else -1
+        state = getattr(manager, 'state', None)
+        network = state.key.rsplit('/', 1)[-1] if state is not None and state.key else None
+        self.append(ssid, bssid, network, manager.is_online, quota, used, limit, event)
+
+    def read(self, start=None, end=None):
+        """
+        Structured NumPy array (see DTYPE) of the records from start to end (timestamps), oldest first.
+        Both parts of the ring are in time order, so the range is found by bisection and only it is copied.
+        """
+        import numpy
+
+        written = self.written()
+        records = numpy.frombuffer(self.map, dtype=numpy.dtype(DTYPE), count=self.capacity, offset=HEADER.size)
+        head = written % self.capacity
+        if written > self.capacity:
+            parts = (records[head:], records[:head])
+        else:
+            parts = (records[:written],)
+
+        selected = []
+        for part in parts:
+            timestamps = part['timestamp']
+            first = bisect_left(timestamps, start) if start is not None else 0
+            last = bisect_left(timestamps, end) if end is not None else len(part)
+            selected.append(part[first:last])
+        return numpy.concatenate(selected)
+
+
+class _FileLock:
+    """ Daemon and batch runs may write at the same time """
+    def __init__(self, file):
+        self.file = file
+
+    def __enter__(self):
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+
+    def __exit__(self, *args):
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+
+def open_history(path=HISTORY_PATH):
+    """ The History, None if it cannot be opened (e.g. read-only home) """
+    try:
+        return History(path)
+    except (OSError, ValueError) as e:
+        logging.warning('Cannot open history {}: {}'.format(path, e))
+        return None
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Streaming scanner for captive portal pages. Instead of building a whole tree, it only picks up what the
+managers need (hidden form fields, the meta-refresh URL, success markers) and stops as soon as it has them.
+"""
+
+from html.parser import HTMLParser
+
+
+class PortalPage:
+    def __init__(self):
+        self.hidden = {}
+        self.refresh_url = None
+        self.success = False
+
+
+class _Done(Exception):
+    pass
+
+
+class PortalScanner(HTMLParser):
+    """
+    until: 'form'    stop at the end of the first form with hidden fields
+           'refresh' stop at the meta refresh
+           'success' stop at the success marker
+           None      scan everything
+    """
+    success_class = 'alert_success'
+
+    def __init__(self, until=None):
+        super().__init__(convert_charrefs=True)
+        self.until = until
+        self.page = PortalPage()
+        self.in_form = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'input':
+            if not self.in_form:
+                # Hidden inputs outside of a form are not sent along with it
+                return
+            attrs = dict(attrs)
+            if (attrs.get('type') or '').lower() == 'hidden' and attrs.get('name'):
+                self.page.hidden[attrs['name']] = attrs.get('value')
+        elif tag == 'form':
+            self.in_form = True
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            if (attrs.get('http-equiv') or '').lower() == 'refresh':
+                content = attrs.get('content') or ''
+                pos = content.lower().find('url=')
+                if pos >= 0:
+                    self.page.refresh_url = content[pos+4:].strip(' \'"')
+                    if self.until == 'refresh':
+                        raise _Done
+        elif tag == 'div':
+            if self.success_class in (dict(attrs).get('class') or '').split():
+                self.page.success = True
+                if self.until == 'success':
+                    raise _Done
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self.in_form = False
+            if self.until == 'form' and self.page.hidden:
+                raise _Done
+
+
+def scan(source, until=None):
+    """ Scan a page, given as text or as an iterable of text chunks (e.g. from iter_content) """
+    scanner = PortalScanner(until)
+    try:
+        if isinstance(source, str):
+            scanner.feed(source)
+        else:
+            for chunk in source:
+                scanner.feed(chunk)
+        scanner.close()
+    except _Done:
+        pass
+    return scanner.page
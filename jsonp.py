@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Decoder for the JSONP answers of the ombord/CDWiFi APIs, e.g. `jQuery123_456({"online":"1", ...});`
+
+The object is decoded with raw_decode directly from the response text, without stripping or copying it first,
+so values containing spaces or parentheses (like "expires":"Thu Dec 26 22:26:52 2019") survive.
+"""
+
+import json
+
+_decoder = json.JSONDecoder()
+
+# Fields that are sent as strings, but are numbers
+INT_PREFIXES = ('data_',)
+INT_FIELDS = ('timeleft', 'timeused')
+
+
+def decode(text):
+    """ The object inside the callback wrapper, with typed integers. Raises ValueError if there is none. """
+    start = text.find('(')
+    start = text.find('{', start + 1 if start >= 0 else 0)
+    if start < 0:
+        raise ValueError('No JSON object in JSONP response')
+
+    obj, _ = _decoder.raw_decode(text, start)
+    if not isinstance(obj, dict):
+        raise ValueError('JSONP response is no object')
+
+    for key, value in obj.items():
+        if isinstance(value, str) and (key.startswith(INT_PREFIXES) or key in INT_FIELDS) and value.isdigit():
+            obj[key] = int(value)
+    return obj
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Keeps a table of the network interfaces, whether they are up and which SSID/BSSID they are associated with.
+
+The table is filled once by a netlink dump (rtnetlink for the links, nl80211 for the wireless association)
+and afterwards only changes when the kernel sends an event. If netlink is not available, the old way of
+parsing `ip a` and `iw dev <if> link` is used instead.
+"""
+
+import os
+import socket
+import struct
+import select
+import logging
+import threading
+import subprocess
+
+NETLINK_ROUTE = 0
+NETLINK_GENERIC = 16
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTMGRP_LINK = 0x1
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IF_OPER_UP = 6
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_GET_SCAN = 32
+NL80211_CMD_CONNECT = 46
+NL80211_CMD_ROAM = 47
+NL80211_CMD_DISCONNECT = 48
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_BSS = 47
+NL80211_ATTR_SSID = 52
+NL80211_BSS_BSSID = 1
+NL80211_BSS_STATUS = 9
+NL80211_BSS_STATUS_ASSOCIATED = 1
+
+NLA_TYPE_MASK = 0x3fff
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+
+
+class Link:
+    def __init__(self, ifname, index=None, up=False, ssid=None, bssid=None):
+        self.ifname = ifname
+        self.index = index
+        self.up = up
+        self.ssid = ssid
+        self.bssid = bssid
+
+    def __repr__(self):
+        return 'Link({}, up={}, ssid={}, bssid={})'.format(self.ifname, self.up, self.ssid, self.bssid)
+
+
+def parse_attrs(data, offset=0):
+    """ Parse netlink attributes into {type: payload}. """
+    attrs = {}
+    while offset + 4 <= len(data):
+        length, type_ = struct.unpack_from('HH', data, offset)
+        if length < 4:
+            break
+        attrs[type_ & NLA_TYPE_MASK] = data[offset+4:offset+length]
+        offset += (length + 3) & ~3
+    return attrs
+
+
+def pack_attr(type_, payload):
+    length = 4 + len(payload)
+    return struct.pack('HH', length, type_) + payload + b'\0' * (((length + 3) & ~3) - length)
+
+
+def iter_messages(data):
+    """ Yield (type, payload) for every netlink message in a datagram. """
+    offset = 0
+    while offset + 16 <= len(data):
+        length, type_, _flags, _seq, _pid = struct.unpack_from('IHHII', data, offset)
+        if length < 16:
+            break
+        yield type_, data[offset+16:offset+length]
+        offset += (length + 3) & ~3
+
+
+def format_mac(raw):
+    return ':'.join('{:02x}'.format(b) for b in raw)
+
+
+def parse_ip_a(output):
+    """ Names of the interfaces with "state UP" from the output of `ip a`. """
+    if isinstance(output, bytes):
+        output = output.decode('utf-8', 'replace')
+    return [line.split(':')[1].strip().split('@')[0] for line in output.split('\n') if 'state UP' in line]
+
+
+def parse_iw_link(output):
+    """ (ssid, bssid) from the output of `iw dev <if> link`, (None, None) if not connected. """
+    if isinstance(output, bytes):
+        output = output.decode('utf-8', 'replace')
+    ssid = bssid = None
+    for line in output.split('\n'):
+        line = line.strip()
+        if line.startswith('command failed') or line.startswith('Not connected'):
+            break
+        if line.startswith('Connected to '):
+            bssid = line.split()[2].lower()
+        elif line.lower().startswith('ssid:'):
+            ssid = line.split(':', 1)[1].strip()
+    return ssid, bssid
+
+
+class Netlink:
+    """ Minimal netlink socket, enough for rtnetlink link dumps and nl80211 requests """
+    def __init__(self, protocol, groups=0):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, protocol)
+        self.sock.bind((0, groups))
+        self.seq = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def join(self, group):
+        self.sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
+
+    def recv(self):
+        return list(iter_messages(self.sock.recv(65536)))
+
+    def request(self, type_, payload, dump=False):
+        self.seq += 1
+        flags = NLM_F_REQUEST | (NLM_F_DUMP if dump else 0)
+        self.sock.send(struct.pack('IHHII', 16 + len(payload), type_, flags, self.seq, 0) + payload)
+
+        messages = []
+        while True:
+            for msg_type, msg in self.recv():
+                if msg_type == NLMSG_DONE:
+                    return messages
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from('i', msg)[0]
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return messages
+                messages.append((msg_type, msg))
+            if not dump:
+                return messages
+
+    def genl_request(self, family, cmd, attrs=b'', dump=False):
+        return [(t, msg[4:]) for t, msg in self.request(family, struct.pack('BBH', cmd, 1, 0) + attrs, dump=dump)]
+
+
+class LinkMonitor:
+    """
+    In-memory table of ifname -> Link, which is only updated on kernel events.
+    get_ssids() is then just a lookup, instead of spawning `ip`/`iw` on every poll.
+    """
+    def __init__(self):
+        self.links = {}
+        self.netlink = False
+        self._thread = None
+        self._route = self._genl = self._events = None
+        self.nl80211_id = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """
+        callback(event, link) is called from the monitor thread, with event one of
+        'up', 'down', 'associated', 'roamed' (BSSID changed within the same SSID) or 'disconnected'.
+        """
+        self.listeners.append(callback)
+
+    def _update(self, link, up, ssid=None, bssid=None):
+        """ Store the new state of a link and notify the listeners about what changed """
+        event = None
+        if ssid and ssid != link.ssid:
+            event = 'associated'
+        elif ssid and bssid != link.bssid:
+            event = 'roamed'
+        elif link.ssid and not ssid:
+            event = 'disconnected' if up else 'down'
+        elif up != link.up:
+            event = 'up' if up else 'down'
+
+        link.up, link.ssid, link.bssid = up, ssid, bssid
+        self.links[link.ifname] = link
+        if event is not None:
+            logging.debug('{}: {}'.format(event, link))
+            for callback in self.listeners:
+                try:
+                    callback(event, link)
+                except Exception as e:
+                    logging.exception('Error in link listener: {}'.format(e))
+
+    def start(self):
+        try:
+            self._start_netlink()
+            self.netlink = True
+        except (OSError, AttributeError, struct.error) as e:
+            logging.info('Netlink not available ({}), falling back to ip/iw'.format(e))
+            self.close()
+            self.netlink = False
+
+    def close(self):
+        for sock in (self._route, self._genl, self._events):
+            if sock is not None:
+                sock.close()
+        self._route = self._genl = self._events = None
+
+    def get_ssids(self):
+        """ {ifname: ssid} of all interfaces that are up and associated """
+        if not self.netlink:
+            self.refresh_subprocess()
+        return {link.ifname: link.ssid for link in list(self.links.values()) if link.up and link.ssid}
+
+    def get_link(self, ifname):
+        if not self.netlink:
+            self.refresh_subprocess()
+        return self.links.get(ifname)
+
+    def _start_netlink(self):
+        self._route = Netlink(NETLINK_ROUTE, RTMGRP_LINK)
+        self._genl = Netlink(NETLINK_GENERIC)
+        self.nl80211_id, mlme_group = self._resolve_nl80211()
+
+        dump = Netlink(NETLINK_ROUTE)
+        try:
+            for msg_type, msg in dump.request(RTM_GETLINK, struct.pack('BxHiII', socket.AF_UNSPEC, 0, 0, 0, 0),
+                                              dump=True):
+                self._handle_link(msg_type, msg)
+        finally:
+            dump.close()
+
+        if self.nl80211_id is not None and mlme_group is not None:
+            self._events = Netlink(NETLINK_GENERIC)
+            self._events.join(mlme_group)
+
+        self._thread = threading.Thread(target=self._event_loop, name='link-monitor', daemon=True)
+        self._thread.start()
+
+    def _resolve_nl80211(self):
+        try:
+            reply = self._genl.genl_request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY,
+                                            pack_attr(CTRL_ATTR_FAMILY_NAME, b'nl80211\0'))
+        except OSError:
+            logging.info('nl80211 not available, no wireless interfaces?')
+            return None, None
+
+        family_id = mlme_group = None
+        for _, msg in reply:
+            attrs = parse_attrs(msg)
+            family_id = struct.unpack('H', attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+            for group in parse_attrs(attrs.get(CTRL_ATTR_MCAST_GROUPS, b'')).values():
+                group = parse_attrs(group)
+                if group.get(CTRL_ATTR_MCAST_GRP_NAME, b'').rstrip(b'\0') == b'mlme':
+                    mlme_group = struct.unpack('I', group[CTRL_ATTR_MCAST_GRP_ID][:4])[0]
+        return family_id, mlme_group
+
+    def _handle_link(self, msg_type, msg):
+        _family, _type, index, _flags, _change = struct.unpack_from('BxHiII', msg)
+        attrs = parse_attrs(msg, 16)
+        ifname = attrs.get(IFLA_IFNAME, b'').rstrip(b'\0').decode('utf-8', 'replace')
+        if not ifname:
+            return
+
+        link = self.links.get(ifname) or Link(ifname, index)
+        link.index = index
+        if msg_type == RTM_DELLINK:
+            self._update(link, False)
+            self.links.pop(ifname, None)
+            return
+
+        operstate = attrs.get(IFLA_OPERSTATE)
+        up = operstate is not None and operstate[0] == IF_OPER_UP
+        if up:
+            self._update(link, up, *self._query_wireless(index))
+        else:
+            self._update(link, up)
+
+    def _query_wireless(self, index):
+        """ (ssid, bssid) of the interface via nl80211, (None, None) if it is not a connected wifi """
+        if self.nl80211_id is None:
+            return None, None
+
+        ifindex = pack_attr(NL80211_ATTR_IFINDEX, struct.pack('I', index))
+        try:
+            reply = self._genl.genl_request(self.nl80211_id, NL80211_CMD_GET_INTERFACE, ifindex)
+        except OSError:
+            return None, None
+        ssid = None
+        for _, msg in reply:
+            raw = parse_attrs(msg).get(NL80211_ATTR_SSID)
+            if raw:
+                ssid = raw.decode('utf-8', 'replace')
+        if ssid is None:
+            return None, None
+
+        bssid = None
+        try:
+            for _, msg in self._genl.genl_request(self.nl80211_id, NL80211_CMD_GET_SCAN, ifindex, dump=True):
+                bss = parse_attrs(parse_attrs(msg).get(NL80211_ATTR_BSS, b''))
+                status = bss.get(NL80211_BSS_STATUS)
+                if status and struct.unpack('I', status[:4])[0] == NL80211_BSS_STATUS_ASSOCIATED:
+                    bssid = format_mac(bss[NL80211_BSS_BSSID])
+        except OSError:
+            pass
+        return ssid, bssid
+
+    def _handle_wireless(self, msg):
+        cmd = msg[0]
+        if cmd not in (NL80211_CMD_CONNECT, NL80211_CMD_ROAM, NL80211_CMD_DISCONNECT):
+            return
+        attrs = parse_attrs(msg, 4)
+        index = attrs.get(NL80211_ATTR_IFINDEX)
+        if index is None:
+            return
+        index = struct.unpack('I', index[:4])[0]
+        for link in list(self.links.values()):
+            if link.index == index:
+                if cmd == NL80211_CMD_DISCONNECT:
+                    self._update(link, link.up)
+                else:
+                    self._update(link, link.up, *self._query_wireless(index))
+
+    def _event_loop(self):
+        sockets = [s for s in (self._route, self._events) if s is not None]
+        while True:
+            try:
+                readable, _, _ = select.select(sockets, [], [])
+                for sock in readable:
+                    for msg_type, msg in sock.recv():
+                        if sock is self._route and msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                            self._handle_link(msg_type, msg)
+                        elif sock is self._events and msg_type == self.nl80211_id:
+                            self._handle_wireless(msg)
+            except (OSError, ValueError):
+                # socket closed
+                return
+            except Exception as e:
+                logging.exception('Error in link monitor: {}'.format(e))
+
+    def refresh_subprocess(self):
+        """ Fallback: rebuild the table from `ip a` and `iw dev <if> link` """
+        res = subprocess.run(['/bin/ip', 'a'], stdout=subprocess.PIPE)
+        up_interfaces = parse_ip_a(res.stdout)
+        for interface in up_interfaces:
+            res = subprocess.run(['/sbin/iw', 'dev', interface, 'link'], stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+            self._update(self.links.get(interface) or Link(interface), True, *parse_iw_link(res.stdout))
+        for interface in set(self.links) - set(up_interfaces):
+            self._update(self.links[interface], False)
+            self.links.pop(interface)
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) == 3:
+        # Parse captured output, e.g. fixtures/ip_a.txt fixtures/iw_link.txt
+        with open(sys.argv[1]) as f:
+            print(parse_ip_a(f.read()))
+        with open(sys.argv[2]) as f:
+            print(parse_iw_link(f.read()))
+    else:
+        m = LinkMonitor()
+        m.start()
+        print('netlink' if m.netlink else 'subprocess', m.links)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+MAC rotation once the throttle cap is reached (manager.py --rotate-mac): the portals count the quota per MAC,
+so a fresh locally administered MAC, a re-association and a new login reset it.
+
+The gap is kept short: the new MAC is set in one go while the link is down, the interface keeps its
+address if it can, the login starts as soon as the link is up, and with a lead time the rotation happens
+shortly before the projected cap instead of after it. Every rotation is reported with its phases and the
+downtime, from taking the link down until the portal says we are online again.
+"""
+
+import os
+import time
+import random
+import shutil
+import logging
+import subprocess
+
+from retry import RetryEngine
+from state_cache import interface_address
+from transport import shared_transport
+from quota_estimator import QuotaEstimator
+from metrics import METRICS
+
+
+def random_mac():
+    """ Locally administered, unicast """
+    octets = [random.randint(0, 255) for _ in range(6)]
+    octets[0] = (octets[0] & 0xfc) | 0x02
+    return ':'.join('{:02x}'.format(octet) for octet in octets)
+
+
+def current_mac(ifname):
+    try:
+        with open('/sys/class/net/{}/address'.format(ifname)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def operstate(ifname):
+    try:
+        with open('/sys/class/net/{}/operstate'.format(ifname)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class Rotation:
+    def __init__(self, ifname, old_mac, new_mac):
+        self.ifname = ifname
+        self.old_mac = old_mac
+        self.new_mac = new_mac
+        # (phase, seconds)
+        self.phases = []
+        self.downtime = None
+        self.quota_before = None
+        self.quota_after = None
+        self.online = False
+
+    @property
+    def quota_reset(self):
+        return self.online and self.quota_after is not None and self.quota_after < min(1, self.quota_before)
+
+    def __str__(self):
+        return '{} {} -> {}: {}, down {}, quota {:.0%} -> {}  ({})'.format(
+            self.ifname, self.old_mac, self.new_mac,
+            'quota reset' if self.quota_reset else 'online, quota NOT reset' if self.online else 'FAILED',
+            '{:.2f}s'.format(self.downtime) if self.downtime is not None else '?', self.quota_before,
+            '{:.0%}'.format(self.quota_after) if self.quota_after is not None else '?',
+            ', '.join('{} {:.2f}s'.format(phase, seconds) for phase, seconds in self.phases))
+
+
+class MacRotation:
+    # How long to wait for the link and its address after the change (s)
+    link_timeout = 15
+    # How long the login may take afterwards (s)
+    login_deadline = 20
+    # Don't rotate again within this many seconds, if the portal doesn't reset the quota it won't help
+    min_interval = 300
+
+    def __init__(self, lead=0, sleep=time.sleep):
+        # Rotate this many seconds before the projected cap, with 0 only once throttled
+        self.lead = lead
+        self.sleep = sleep
+        self.last = {}
+        self.rotations = []
+
+    def due(self, manager, ifname):
+        """ Whether the manager's uplink should get a new MAC now """
+        if ifname is None or time.monotonic() - self.last.get(ifname, -self.min_interval) < self.min_interval:
+            return False
+        if manager.get_quota() >= 1:
+            return True
+        if self.lead and hasattr(manager, 'time_until_cap'):
+            time_until_cap = manager.time_until_cap()
+            return time_until_cap is not None and time_until_cap <= self.lead
+        return False
+
+    def rotate(self, manager, ifname, ssid=None):
+        """ New MAC, re-association and login. Returns the Rotation. """
+        self.last[ifname] = time.monotonic()
+        rotation = Rotation(ifname, current_mac(ifname), random_mac())
+        rotation.quota_before = manager.get_quota()
+        address = interface_address(ifname)
+        logging.warning('Throttle cap {}, rotating the MAC of {} to {}'.format(
+            'reached' if rotation.quota_before >= 1 else 'close', ifname, rotation.new_mac))
+
+        start = phase_start = time.monotonic()
+
+        def phase(name):
+            nonlocal phase_start
+            now = time.monotonic()
+            rotation.phases.append((name, now - phase_start))
+            phase_start = now
+
+        try:
+            if not self.change_mac(ifname, rotation.new_mac):
+                return rotation
+            phase('change')
+            self.reassociate(ifname, ssid)
+            if not self.wait_for(lambda: operstate(ifname) in ('up', 'unknown')):
+                logging.warning('{} did not come up again'.format(ifname))
+                return rotation
+            phase('link')
+            if not self.wait_for(lambda: interface_address(ifname) is not None):
+                logging.warning('{} got no address'.format(ifname))
+                return rotation
+            phase('address')
+
+            self.prepare(manager, ifname, address)
+            rotation.online = RetryEngine(deadline=self.login_deadline, sleep=self.sleep).login(manager)
+            if rotation.online:
+                rotation.downtime = time.monotonic() - start
+            phase('login')
+            if rotation.online:
+                rotation.quota_after = manager.get_quota()
+            return rotation
+        finally:
+            self.report(rotation, type(manager).__name__)
+
+    def change_mac(self, ifname, mac):
+        return (self._run('ip', 'link', 'set', 'dev', ifname, 'down') and
+                self._run('ip', 'link', 'set', 'dev', ifname, 'address', mac, 'up'))
+
+    def reassociate(self, ifname, ssid):
+        """ Wired (e.g. veth) links come back by themselves, wifi needs to connect again """
+        if not os.path.exists('/sys/class/net/{}/wireless'.format(ifname)):
+            return
+        if shutil.which('nmcli') and self._run('nmcli', 'device', 'connect', ifname):
+            # The network manager keeps the MAC we set (cloned-mac-address 'preserve') and runs DHCP
+            return
+        if ssid:
+            self._run('iw', 'dev', ifname, 'connect', ssid)
+
+    def prepare(self, manager, ifname, address):
+        """ Forget what belonged to the old MAC """
+        shared = shared_transport().adapter
+        for adapter in set(manager.session.adapters.values()):
+            # The pooled connections of the interface's transport were opened by the old MAC. The shared
+            # transport is left alone, it holds the connections of the managers on the other interfaces
+            adapter = getattr(adapter, 'adapter', adapter)
+            if adapter is not shared:
+                adapter.close()
+        manager.session.cookies.clear()
+        state = getattr(manager, 'state', None)
+        if state is not None:
+            state.invalidate('cookies')
+        if hasattr(manager, 'bind') and interface_address(ifname) != address:
+            manager.bind(ifname)
+        if getattr(manager, 'quota_estimator', None) is not None:
+            # The old readings are from before the reset
+            manager.quota_estimator = QuotaEstimator(ifname)
+
+    def wait_for(self, condition, step=0.05):
+        end = time.monotonic() + self.link_timeout
+        while not condition():
+            if time.monotonic() > end:
+                return False
+            time.sleep(step)
+        return True
+
+    def report(self, rotation, manager_name):
+        self.rotations.append(rotation)
+        logging.warning('MAC rotation: {}'.format(rotation))
+        labels = (('manager', manager_name),)
+        METRICS.inc('dbwifi_mac_rotations', labels + (('result', 'reset' if rotation.quota_reset else
+                                                                  'online' if rotation.online else 'failed'),))
+        if rotation.downtime is not None:
+            METRICS.observe('dbwifi_mac_rotation_downtime_seconds', labels, rotation.downtime)
+
+    @staticmethod
+    def _run(*args):
+        try:
+            subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=10)
+            return True
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.warning('{} failed: {}'.format(' '.join(args), getattr(e, 'stderr', None) or e))
+            return False
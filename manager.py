@@ -1,117 +1,637 @@
 #!/usr/bin/env python3
 
+import sys
 import time
+import asyncio
 import logging
-import subprocess
+import importlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from db_lounge import DBLoungeManager
-from db_wifionice import DBWifiOnICEManager
-from db_cdwifi import DBCDWiFiManager
-from db_wifiatdb import DBWifiAtDBDecider
+from link_monitor import LinkMonitor
+from state_cache import StateCache
+from scheduler import PollScheduler
+from retry import RetryEngine
+from quota_estimator import QuotaEstimator
+from history import open_history, EVENT_POLL, EVENT_LOGIN, EVENT_LOGIN_FAILED, EVENT_MAC_ROTATION
+from metrics import METRICS, MetricsWriter
+from uplinks import Uplink, RouteSelector
+import profiler
+
+
+def status_line(manager, prefix='DB: '):
+    """ 'DB: 42%', with the remaining session time if the portal tells us """
+    if not manager.is_online:
+        return prefix + '!'
+    line = '{}{:.0%}'.format(prefix, manager.get_quota())
+    session_left = manager.session_left() if hasattr(manager, 'session_left') else None
+    if session_left is not None:
+        line += ', session ends in {}'.format(format_duration(session_left))
+    time_until_cap = manager.time_until_cap() if hasattr(manager, 'time_until_cap') else None
+    if time_until_cap is not None:
+        line += ', throttled in {}'.format(format_duration(time_until_cap))
+    return line
+
+
+def uplinks_line(uplinks, preferred, prefix='DB: '):
+    """ 'wlan0* DB: 42% | wlan1 DB: !', with the preferred uplink marked """
+    return ' | '.join('{}{} {}'.format(uplink.ifname, '*' if uplink is preferred else '',
+                                       status_line(uplink.manager, prefix)) for uplink in uplinks)
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return '{}:{:02d}:{:02d}'.format(minutes // 60, minutes % 60, seconds)
+
+
+class DeadlineMissed(Exception):
+    """ A manager call of the asyncio loop missed its deadline, its thread is still running """
 
 
 class DBManager:
+    # SSID -> "module.Class", imported only when the SSID is actually seen
     managers = {
-        DBLoungeManager.SSID: DBLoungeManager,
-        DBWifiOnICEManager.SSID: DBWifiOnICEManager,
-        DBWifiOnICEManager.SSID_secondary: DBWifiOnICEManager,
-        DBCDWiFiManager.SSID: DBCDWiFiManager,
-        DBWifiAtDBDecider.SSID: DBWifiAtDBDecider
+        "DBLounge": "db_lounge.DBLoungeManager",
+        "WIFIonICE": "db_wifionice.DBWifiOnICEManager",
+        "WIFI@DB": "db_wifionice.DBWifiOnICEManager",
+        "CDWiFi": "db_cdwifi.DBCDWiFiManager",
+        "Wifi@DB": "db_wifiatdb.DBWifiAtDBDecider",
     }
     manager = None
 
-    def __init__(self, batch_mode=False, ssid=""):
+    # How long batch mode tries to get online (s)
+    login_deadline = 20
+
+    # How long the decision for a Wifi@DB provider is cached (s)
+    provider_ttl = 24 * 3600
+
+    # Deadlines (s) for the coroutines of the asyncio run mode
+    deadline_detect = 3
+    deadline_status = 6
+    deadline_login = 10
+
+    # Time-to-online measurements kept for the stats
+    time_to_online_samples = 100
+
+    def __init__(self, batch_mode=False, ssid="", link_monitor=None, state_cache=None, history=None,
+                 switch_route=False, mac_rotation=None):
         self.batch_mode = batch_mode
+        self.fixed_ssid = False
+        # (step, seconds) of the imports and initializations, see --startup-profile
+        self.startup_profile = []
+        self.state_cache = state_cache if state_cache is not None else StateCache()
+        # Every poll and login is recorded here, None if the history file cannot be opened
+        self.history = history if history is not None else open_history()
+        # (ssid, ifname) of the current manager, and of every manager
+        self.link = (ssid, None)
+        self.links = {}
+        # (ssid, ifname) -> manager instance, each interface gets its own
+        self.instances = {}
+        # Managers of all interfaces on a known SSID, None until detected again
+        self.active = None
+        # ifname -> Uplink, scored to pick the preferred one if there are several
+        self.uplinks = {}
+        self.route_selector = RouteSelector(switch=switch_route)
+        # MacRotation to carry out at the throttle cap, None to only suggest it
+        self.mac_rotation = mac_rotation
+        self.lock = threading.Lock()
+        self.uplink_executor = ThreadPoolExecutor(thread_name_prefix='uplink')
         if ssid:
-            manager = self.managers.get(ssid)
-            if manager:
-                self.manager = manager()
+            self.manager = self.get_manager_for_ssid(ssid)
+            self.fixed_ssid = self.manager is not None
 
         logging.basicConfig(level=logging.WARNING if batch_mode else logging.INFO)
 
         self.is_online = None
         self.new_api = None
+        # Any object with start(), get_ssids() and add_listener() can be injected as event source
+        self.link_monitor = link_monitor
+        self.link_monitor_started = False
+        self.wakeup = threading.Event()
+        self.loop = None
+        self.async_wakeup = None
+        # Managers with a call still running in the executor, e.g. after it missed its deadline
+        self.busy = set()
+        # The get_login_managers() call of the asyncio loop while it runs, it is awaited again if it missed its deadline
+        self.detection = None
+        # ifname -> time.monotonic() of the association it is not yet online after
+        self.associated_at = {}
+        self.time_to_online = deque(maxlen=self.time_to_online_samples)
+        # manager -> PollScheduler
+        self.schedulers = {}
+        # manager -> last seen online state, and managers with a login whose outcome is not yet known
+        self.was_online = {}
+        self.pending_logins = set()
 
-    def run(self):
-        if self.batch_mode:
-            self.manager = self.get_login_manager()
-            if not self.manager:
+    def start_link_monitor(self):
+        if self.link_monitor is None:
+            self.link_monitor = LinkMonitor()
+        if not self.link_monitor_started:
+            self.link_monitor.add_listener(self.on_link_event)
+            self.link_monitor.start()
+            # The initial dump (or, without netlink, the first refresh) reports the associations we already had
+            self.link_monitor.get_ssids()
+            self.link_monitor_started = True
+
+    def on_link_event(self, event, link):
+        """ Called by the link monitor, wakes up the poll loop to check/login right away """
+        if event in ('associated', 'roamed'):
+            logging.info('{} {} ({}) on {}'.format(event.capitalize(), link.ssid, link.bssid, link.ifname))
+            if self.link_monitor_started:
+                self.associated_at[link.ifname] = time.monotonic()
+        if event in ('associated', 'disconnected', 'down'):
+            self.network_changed(link.ifname)
+        if event in ('associated', 'disconnected', 'down') and not self.fixed_ssid:
+            # The SSID may have changed, look the managers up again
+            self.manager = None
+            self.active = None
+            uplink = self.uplinks.pop(link.ifname, None)
+            if uplink is not None:
+                uplink.close()
+        for scheduler in self.schedulers.values():
+            scheduler.poll_now()
+        self.wake()
+
+    def network_changed(self, ifname):
+        """ Forget the addresses resolved on the interface's last network, they may not exist on the next one """
+        from dns_cache import system_cache
+        system_cache().clear()
+        for manager, (_, link_ifname) in list(self.links.items()):
+            if link_ifname == ifname and hasattr(manager, 'reset_network'):
+                manager.reset_network()
+
+    def scheduler_for(self, manager):
+        scheduler = self.schedulers.get(manager)
+        if scheduler is None:
+            scheduler = self.schedulers[manager] = PollScheduler(type(manager).__name__)
+            scheduler.attach(manager)
+        return scheduler
+
+    def _next_poll_in(self):
+        """ Seconds until the first manager wants to be polled, 1 while we still look for one """
+        # Busy managers wake the loop up once their call returned
+        managers = [manager for manager in self.active or [self.manager] if manager not in self.busy]
+        if self.manager is None or not managers:
+            return 1
+        return min(self.scheduler_for(manager).time_until_due() for manager in managers)
+
+    def wake(self):
+        self.wakeup.set()
+        if self.loop is not None and self.async_wakeup is not None:
+            self.loop.call_soon_threadsafe(self.async_wakeup.set)
+
+    def _sleep(self, seconds=1):
+        """ Sleep until the next poll is due or a link event comes in """
+        if self.wakeup.wait(seconds):
+            self.wakeup.clear()
+
+    async def _sleep_async(self, seconds=1):
+        try:
+            await asyncio.wait_for(self.async_wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self.async_wakeup.clear()
+        self.wakeup.clear()
+
+    def _association(self, manager):
+        """ The interface whose association the manager has yet to get online after, None if there is none """
+        ifname = self.links.get(manager, self.link)[1]
+        if ifname is None:
+            # Not bound to an interface (fixed SSID), any association is its own
+            return next(iter(self.associated_at), None)
+        return ifname if ifname in self.associated_at else None
+
+    def _check_time_to_online(self, manager):
+        """ Record how long it took from association to being online """
+        ifname = self._association(manager)
+        if manager.is_online and ifname is not None:
+            duration = time.monotonic() - self.associated_at.pop(ifname)
+            self.time_to_online.append(duration)
+            logging.info('Online {:.2f}s after association'.format(duration))
+
+    def _recheck_after_login(self, manager):
+        """ Right after a handover, don't wait for the next poll to see whether the login worked """
+        if self._association(manager) is not None:
+            manager.update_online()
+            self._check_time_to_online(manager)
+
+    def _record(self, manager, event=EVENT_POLL):
+        """ Count transitions and logins for the metrics and add a sample to the history """
+        with self.lock:
+            self._count(manager, event)
+            if self.history is None:
                 return
+            ssid, ifname = self.links.get(manager, self.link)
+            link = getattr(self.link_monitor, 'links', {}).get(ifname)
+            self.history.record(manager, ssid, link.bssid if link else None, event)
+
+    def _count(self, manager, event):
+        labels = (('manager', type(manager).__name__),)
+        online = manager.is_online
+        if online is not None and self.was_online.get(manager, online) != online:
+            METRICS.inc('dbwifi_transitions', labels + (('to', 'online' if online else 'offline'),))
+        if online is not None:
+            self.was_online[manager] = online
+
+        if event == EVENT_POLL:
+            if manager in self.pending_logins and online is False:
+                METRICS.inc('dbwifi_login_failures', labels)
+            self.pending_logins.discard(manager)
+            return
+        METRICS.inc('dbwifi_logins', labels)
+        if event == EVENT_LOGIN_FAILED:
+            METRICS.inc('dbwifi_login_failures', labels)
+        elif not online:
+            # The next poll tells whether it worked
+            self.pending_logins.add(manager)
+
+    def login_batch(self, manager, deadline=None):
+        """ Check status and login until online or the deadline has passed. Returns the status line. """
+        engine = RetryEngine(deadline=deadline or self.login_deadline, sleep=self._sleep)
+        online = engine.login(manager)
+        logins = [attempt for attempt in engine.timeline if attempt.logged_in]
+        for attempt in logins:
+            self._record(manager, EVENT_LOGIN if attempt.online else EVENT_LOGIN_FAILED)
+        if not logins:
+            self._record(manager)
+        self._check_time_to_online(manager)
+        engine.log_timeline()
+
+        status = status_line(manager)
+        print(status)
+        if online:
+            self._remember(manager)
+        else:
+            self._forget(manager)
+        return status
+
+    @staticmethod
+    def _remember(manager):
+        """ Keep the session cookies of a working login in the state cache """
+        if getattr(manager, 'state', None) is not None and hasattr(manager, 'session'):
+            manager.state.save_session(manager.session)
 
-            iteration_ = 5
-            while iteration_ > 0:
-                self.manager.update_online()
-                print('DB: !' if not self.manager.is_online else 'DB: {:.0%}'.format(self.manager.get_quota()))
-                if self.manager.is_online:
-                    return
-                else:
-                    self.manager.login()
+    @staticmethod
+    def _forget(manager):
+        """ The cached choices did not lead to a login, so don't trust them next time """
+        if getattr(manager, 'state', None) is not None:
+            manager.state.invalidate('provider', 'cookies')
+        if hasattr(manager, 'forget_network'):
+            manager.forget_network()
 
-                time.sleep(1)
+    def run(self):
+        self.start_link_monitor()
+        if self.batch_mode:
+            managers = self.get_login_managers()
+            if not managers:
+                return
 
-                iteration_ -= 1
+            self.manager = managers[0]
+            self._each(self.login_batch, managers)
         else:
-            while not time.sleep(1):
-                self.manager = self.get_login_manager()
-                if not self.manager:
+            while not self._sleep(self._next_poll_in()):
+                managers = self.get_login_managers()
+                if not managers:
                     continue
 
-                self.manager.update_online()
-                if self.manager.is_online:
-                    quota = self.manager.get_quota()
-                    if quota < 1:
-                        print('Quota: {0:.0%}\r'.format(quota), end='', flush=True)
-                    else:
-                        print("Quota surpassed, your traffic is being slowed! MAC-Change suggested")
-                elif self.manager.is_online is None:
+                self.manager = managers[0]
+                due = [manager for manager in managers if self.scheduler_for(manager).due()]
+                if not due:
                     continue
-                else:
-                    self.manager.login()
+                self._each(self.poll, due)
+                if len(self.uplinks) > 1:
+                    self._print_uplinks()
+
+    def _each(self, func, managers):
+        """ func(manager) for every manager, concurrently if there are several """
+        if len(managers) == 1:
+            func(managers[0])
+            return
+        for future in [self.uplink_executor.submit(func, manager) for manager in managers]:
+            future.result()
+
+    def _update_online(self, manager):
+        """ manager.update_online(), measured for the scoring of its uplink """
+        uplink = self.uplinks.get(self.links.get(manager, self.link)[1])
+        responses = uplink.responses if uplink is not None else 0
+        manager.update_online()
+        if uplink is not None and uplink.manager is manager:
+            uplink.record_poll(responses)
+
+    def poll(self, manager):
+        """ One poll of a manager: status, then quota or login """
+        scheduler = self.scheduler_for(manager)
+        self._update_online(manager)
+        scheduler.record(manager)
+        self._record(manager)
+        self._check_time_to_online(manager)
+        if manager.is_online:
+            self._remember(manager)
+            if scheduler.renewal_due(manager):
+                logging.info('Session ends in {:.0f}s, renewing'.format(manager.session_left()))
+                self._login(manager)
+            self._rotate_mac(manager)
+            if len(self.uplinks) <= 1:
+                self._print_quota(manager, manager.get_quota())
+        elif manager.is_online is False:
+            self._login(manager)
+            self._recheck_after_login(manager)
+
+    def _login(self, manager):
+        """ manager.login(), recorded once it returned """
+        manager.login()
+        self._record(manager, EVENT_LOGIN)
+
+    def _rotate_mac(self, manager):
+        """ New MAC and login, if the manager's uplink is (close to being) throttled and rotation is on """
+        ssid, ifname = self.links.get(manager, self.link)
+        if self.mac_rotation is None or not self.mac_rotation.due(manager, ifname):
+            return
+        self.mac_rotation.rotate(manager, ifname, ssid)
+        self.scheduler_for(manager).poll_now()
+        self._record(manager, EVENT_MAC_ROTATION)
+
+    @staticmethod
+    def _print_quota(manager, quota):
+        if quota < 1:
+            print('{}\r'.format(status_line(manager, 'Quota: ')), end='', flush=True)
+        else:
+            print("Quota surpassed, your traffic is being slowed! MAC-Change suggested")
+
+    def _print_uplinks(self):
+        """ Score the uplinks, pick the preferred one and show them all """
+        uplinks = list(self.uplinks.values())
+        preferred = self.route_selector.select(uplinks)
+        print('{}\r'.format(uplinks_line(uplinks, preferred, 'Quota: ')), end='', flush=True)
+
+    async def run_async(self):
+        """
+        Same as run(), but every blocking step (detection, status, quota, login) is a cancellable coroutine
+        with a deadline, so a stalled request cannot freeze the loop.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.async_wakeup = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.start_link_monitor()
+        try:
+            if self.batch_mode:
+                managers = await self._detect()
+                if managers:
+                    self.manager = managers[0]
+                    await asyncio.gather(*(self.manage_batch(manager) for manager in managers))
+            else:
+                while True:
+                    managers = await self._detect()
+                    if managers:
+                        self.manager = managers[0]
+                        polled = await asyncio.gather(*(self.manage(manager) for manager in managers))
+                        if any(polled) and len(self.uplinks) > 1:
+                            self._print_uplinks()
+                    await self._sleep_async(self._next_poll_in())
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def _call(self, func, *args, deadline=None, manager=None):
+        """
+        Run a blocking call in the executor. Returns None if it misses its deadline; the thread cannot be
+        stopped and keeps running. A call for a manager raises DeadlineMissed instead, and the manager stays
+        busy until its thread has returned, so nothing else touches its session and state meanwhile.
+        """
+        future = self.loop.run_in_executor(self.executor, func, *args)
+        if manager is not None:
+            self.busy.add(manager)
+            future.add_done_callback(lambda _: self._done(manager))
+        try:
+            # Shielded, a missed deadline must not mark the future done while its thread still runs
+            return await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            logging.warning('{} missed its deadline of {}s'.format(getattr(func, '__name__', func), deadline))
+            if manager is not None:
+                raise DeadlineMissed
+            return None
+
+    async def _detect(self):
+        """
+        get_login_managers() with a deadline. A detection which missed it keeps running and is awaited again
+        instead of starting another one, which would instantiate the same managers a second time.
+        """
+        if self.detection is None:
+            self.detection = self.loop.run_in_executor(self.executor, self.get_login_managers)
+            self.detection.add_done_callback(self._detection_done)
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.detection), self.deadline_detect)
+        except asyncio.TimeoutError:
+            logging.warning('Detection missed its deadline of {}s'.format(self.deadline_detect))
+            return None
+
+    def _detection_done(self, _):
+        self.detection = None
+        self.async_wakeup.set()
+
+    def _done(self, manager):
+        self.busy.discard(manager)
+        self.async_wakeup.set()
 
-    def get_login_manager(self):
+    async def manage(self, manager):
+        """ One poll of a manager: status, then quota or login. False if it was not due or still busy. """
+        scheduler = self.scheduler_for(manager)
+        if manager in self.busy:
+            logging.debug('{} is still busy, skipping its poll'.format(type(manager).__name__))
+            return False
+        if not scheduler.due():
+            return False
+        try:
+            await self._poll_async(manager, scheduler)
+        except DeadlineMissed:
+            # The state is the one of a call which may still change it, so don't act on it
+            pass
+        return True
+
+    async def _poll_async(self, manager, scheduler):
+        await self._call(self._update_online, manager, deadline=self.deadline_status, manager=manager)
+        scheduler.record(manager)
+        self._record(manager)
+        self._check_time_to_online(manager)
+        if manager.is_online:
+            if scheduler.renewal_due(manager):
+                logging.info('Session ends in {:.0f}s, renewing'.format(manager.session_left()))
+                await self._call(self._login, manager, deadline=self.deadline_login, manager=manager)
+            if self.mac_rotation is not None:
+                await self._call(self._rotate_mac, manager, deadline=self.mac_rotation.link_timeout +
+                                 self.mac_rotation.login_deadline + RetryEngine.max_timeout, manager=manager)
+            if len(self.uplinks) <= 1:
+                quota = await self._call(manager.get_quota, deadline=self.deadline_status, manager=manager)
+                self._print_quota(manager, quota)
+        elif manager.is_online is False:
+            await self._call(self._login, manager, deadline=self.deadline_login, manager=manager)
+            if self._association(manager) is not None:
+                await self._call(manager.update_online, deadline=self.deadline_status, manager=manager)
+                self._check_time_to_online(manager)
+
+    async def manage_batch(self, manager):
+        # The retry engine keeps its own deadline, this one only catches a request hanging past it
+        await self._call(self.login_batch, manager, deadline=self.login_deadline + RetryEngine.max_timeout)
+
+    def get_login_managers(self):
+        """ The managers of all interfaces on a known SSID, each bound to its interface """
+        if self.active is not None:
+            return self.active
         if self.manager is not None:
-            return self.manager
-
-        interface_ssids = []
-        res = subprocess.run(['/bin/ip', 'a'], stdout=subprocess.PIPE)
-        up_interfaces = [l.split(b':')[1].strip() for l in res.stdout.split(b'\n') if b"state UP" in l]
-        for interface in up_interfaces:
-            res = subprocess.run(['/sbin/iw', 'dev', interface, 'link'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            iw_result = res.stdout.decode('utf-8')
-            for line in iw_result.split('\n'):
-                if line.startswith('command failed'):
-                    break
-                if 'ssid' in line.lower():
-                    interface_ssids.append(line.strip().split()[-1])
-                    break
-
-        for ssid in interface_ssids:
-            manager = self.managers.get(ssid)
-            if manager is None:
-                continue
-
-            if hasattr(manager, "PROVIDERS"):
-                provider = manager()
-                manager = provider.get_specific_provider()
-
-            if type(manager) is type:
-                # If not yet in instanciated, do
-                manager = manager()
-                self.managers[ssid] = manager
-            return manager
+            return [self.manager]
+
+        with profiler.phase('detect interface/SSID'):
+            self.start_link_monitor()
+            interface_ssids = self.link_monitor.get_ssids()
+
+        managers = []
+        for ifname, ssid in interface_ssids.items():
+            link = getattr(self.link_monitor, 'links', {}).get(ifname)
+            manager = self.get_manager_for_ssid(ssid, ifname=ifname, bssid=link.bssid if link else None)
+            if manager is not None:
+                managers.append(manager)
+        self.active = managers or None
+        return managers
+
+    def get_manager_class(self, ssid):
+        """ The manager registered for the SSID, importing its module on first use """
+        manager = self.managers.get(ssid)
+        if isinstance(manager, str):
+            module_name, class_name = manager.rsplit('.', 1)
+            start = time.perf_counter()
+            module = importlib.import_module(module_name)
+            self.startup_profile.append(('import {}'.format(module_name), time.perf_counter() - start))
+            manager = getattr(module, class_name)
+            self.managers[ssid] = manager
+        return manager
+
+    def _instantiate(self, manager):
+        start = time.perf_counter()
+        instance = manager()
+        self.startup_profile.append(('init {}'.format(manager.__name__), time.perf_counter() - start))
+        return instance
+
+    def get_manager_for_ssid(self, ssid, ifname=None, bssid=None):
+        """ The (cached) manager instance for the SSID on the interface, None if we don't know it """
+        manager_class = self.get_manager_class(ssid)
+        if manager_class is None:
+            return None
+
+        state = self.state_cache.network(ssid, ifname=ifname, bssid=bssid)
+        if hasattr(manager_class, "PROVIDERS"):
+            provider = manager_class.PROVIDERS.get(state.get('provider'))
+            if provider is None:
+                decider = self._instantiate(manager_class)
+                with profiler.phase('provider decision'):
+                    provider = decider.get_specific_provider(ifname)
+                if provider is not None:
+                    state.set('provider', provider.URL, ttl=self.provider_ttl)
+            manager_class = provider
+            if manager_class is None:
+                return None
+
+        manager = self.instances.get((ssid, ifname))
+        if type(manager) is not manager_class:
+            # If not yet in instanciated for this interface, do
+            manager = self.instances[(ssid, ifname)] = self._instantiate(manager_class)
+
+        if getattr(manager, 'state', None) is not state:
+            if hasattr(manager, 'reset_network'):
+                # Same SSID, but (maybe) another train
+                manager.reset_network()
+            manager.state = state
+            if ifname and hasattr(manager, 'bind'):
+                # The new network may have given the interface another address
+                manager.bind(ifname)
+            if hasattr(manager, 'session'):
+                state.load_session(manager.session)
+            if hasattr(manager, 'quota_estimator'):
+                manager.quota_estimator = QuotaEstimator(ifname) if ifname and QuotaEstimator.available(ifname) else None
+        self.link = self.links[manager] = (ssid, ifname)
+        uplink = self.uplinks.get(ifname)
+        if ifname and getattr(uplink, 'manager', None) is not manager:
+            if uplink is not None:
+                uplink.close()
+            self.uplinks[ifname] = Uplink(ifname, ssid, manager)
+        return manager
+
+    def print_startup_profile(self):
+        for step, seconds in self.startup_profile:
+            print('{:<40} {:8.1f} ms'.format(step, seconds * 1000), file=sys.stderr)
+        if self.startup_profile:
+            print('{:<40} {:8.1f} ms'.format('total', sum(s for _, s in self.startup_profile) * 1000),
+                  file=sys.stderr)
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['report']:
+        import report
+        state_cache = StateCache()
+        providers = {tuple(key.split('/', 1)): state.get('provider') for key, state in state_cache.networks.items()}
+        report.main(sys.argv[2:], managers=DBManager.managers, providers=providers)
+        sys.exit()
+
     import argparse
     argparser = argparse.ArgumentParser(description="Keeps your Wifi logged into the various DB Wifis")
     argparser.add_argument('-b', '--batch', action='store_true',
                            help='Just check status and login, if not yet.')
+    argparser.add_argument('-a', '--asyncio', action='store_true',
+                           help='Run the managers as coroutines with deadlines, so slow requests do not block.')
+    argparser.add_argument('--startup-profile', action='store_true',
+                           help='Report the import and initialization time of the managers.')
+    argparser.add_argument('--profile', action='store_true',
+                           help='Log in once (like -b) and print a waterfall of its phases.')
+    argparser.add_argument('--pstats', metavar='PATH',
+                           help='With --profile, also dump a cProfile of the run to PATH.')
+    argparser.add_argument('--metrics', metavar='PATH',
+                           help='Write request and login metrics in the OpenMetrics text format to PATH.')
+    argparser.add_argument('--switch-route', action='store_true',
+                           help='With several interfaces on DB wifis, make the best uplink the default route.')
+    argparser.add_argument('--rotate-mac', nargs='?', const=0, type=float, metavar='LEAD',
+                           help='Get a new MAC and log in again at the throttle cap (needs root). '
+                                'With LEAD, already that many seconds before the projected cap.')
     argparser.add_argument('ssid', nargs="?", type=str, help="If you already know the SSID and it's not gonna change")
 
     args = argparser.parse_args()
 
-    db_manager = DBManager(batch_mode=args.batch, ssid=args.ssid)
+    profiling = args.profile
+    cprofile = None
+    if profiling:
+        profiler.start()
+        if args.pstats:
+            import cProfile
+            cprofile = cProfile.Profile()
+            cprofile.enable()
+
+    mac_rotation = None
+    if args.rotate_mac is not None:
+        from mac_rotation import MacRotation
+        mac_rotation = MacRotation(lead=args.rotate_mac)
+    db_manager = DBManager(batch_mode=args.batch or profiling, ssid=args.ssid, switch_route=args.switch_route,
+                           mac_rotation=mac_rotation)
+    metrics_writer = None
+    if args.metrics:
+        metrics_writer = MetricsWriter(args.metrics)
+        metrics_writer.start()
     try:
-        db_manager.run()
+        if args.asyncio:
+            asyncio.run(db_manager.run_async())
+        else:
+            db_manager.run()
     except (KeyboardInterrupt, EOFError):
         pass
+    finally:
+        if args.startup_profile:
+            db_manager.print_startup_profile()
+        for scheduler in db_manager.schedulers.values():
+            scheduler.log_stats()
+        if metrics_writer is not None:
+            metrics_writer.stop()
+        db_manager.route_selector.restore()
+        if profiling:
+            profiler.stop().print()
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.pstats)
+            print('cProfile written to {}, see python3 -m pstats {}'.format(args.pstats, args.pstats),
+                  file=sys.stderr)
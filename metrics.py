@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Request and connection metrics of all managers, exported in the OpenMetrics text format.
+
+Every manager session is an InstrumentedSession (see transport.py). Per endpoint (host and path) it records histograms of
+the DNS, connect, TLS, first-byte and total time and of the response size, and counts status codes,
+timeouts and connection errors. DNS is timed by the DNS cache (dns_cache.py), connect and TLS by the
+connection classes of InstrumentedAdapter, both report to the request running on their thread with mark().
+This module itself needs no HTTP library, so the poll loop can import it without loading requests.
+The DBManager counts logins, login failures and online/offline transitions, the DNS cache its hits, misses and lookups.
+
+Recording is a few dict updates per request, rendering only happens when the metrics are written.
+"""
+
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+HELP = {
+    'dbwifi_request_dns_seconds': 'Name resolution of the request',
+    'dbwifi_request_connect_seconds': 'TCP connect of a new connection',
+    'dbwifi_request_tls_seconds': 'TLS handshake of a new connection',
+    'dbwifi_request_first_byte_seconds': 'Time until the response headers arrived',
+    'dbwifi_request_seconds': 'Total time of the request, including the body',
+    'dbwifi_response_bytes': 'Size of the response body',
+    'dbwifi_responses': 'Responses by status code',
+    'dbwifi_request_timeouts': 'Requests which timed out',
+    'dbwifi_request_errors': 'Requests which failed to connect',
+    'dbwifi_logins': 'Login attempts',
+    'dbwifi_login_failures': 'Login attempts which did not get us online',
+    'dbwifi_transitions': 'Changes between online and offline',
+    'dbwifi_mac_rotations': 'MAC rotations at the throttle cap, by result',
+    'dbwifi_mac_rotation_downtime_seconds': 'Time offline during a MAC rotation',
+    'dbwifi_dns_cache_hits': 'Hosts served from the DNS cache',
+    'dbwifi_dns_cache_stale_hits': 'Expired hosts served from the DNS cache while they are refreshed',
+    'dbwifi_dns_cache_misses': 'Hosts which had to be looked up before the request',
+    'dbwifi_dns_cache_failures': 'Lookups which failed',
+    'dbwifi_dns_lookup_seconds': 'Lookups of the DNS cache, in the background or not',
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) -> value / Histogram, labels are a tuple of (key, value)
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def value(self, name, labels=()):
+        return self.counters.get((name, labels), 0)
+
+    def render(self):
+        """ The metrics in the OpenMetrics text format """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count))
+                                for key, h in self.histograms.items())
+
+        lines, described = [], set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append('# TYPE {} {}'.format(name, kind))
+                if name in HELP:
+                    lines.append('# HELP {} {}'.format(name, HELP[name]))
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append('{}_total{} {}'.format(name, format_labels(labels), value))
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', str(bound)),)), cumulative))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), count))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), total))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """ Replace the file atomically, e.g. for the textfile collector of the node exporter """
+        tmp_path = '{}.tmp'.format(path)
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning('Cannot write metrics to {}: {}'.format(path, e))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels) + '}'
+
+
+METRICS = Metrics()
+
+# Phases (dns, connect, tls) of the request running on this thread
+_current = threading.local()
+
+
+def mark(phase, seconds):
+    """ Called by the DNS cache and the connections for the request in flight """
+    phases = getattr(_current, 'phases', None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0) + seconds
+
+
+def start_phases():
+    """ Collect the phases of a new request on this thread, returns those of the request around it """
+    outer, _current.phases = getattr(_current, 'phases', None), {}
+    return outer
+
+
+def end_phases(outer):
+    """ The phases of the request, the ones of the request around it are collected again """
+    phases, _current.phases = _current.phases, outer
+    return phases
+
+
+class MetricsWriter(threading.Thread):
+    """ Writes the metrics to path every interval seconds """
+    def __init__(self, path, interval=15, metrics=METRICS):
+        super().__init__(daemon=True, name='metrics')
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.metrics.write(self.path)
+
+    def stop(self):
+        self.stopped.set()
+        self.metrics.write(self.path)
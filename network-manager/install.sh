@@ -5,3 +5,9 @@ chmod 700 /usr/share/db_wlan_manager/network-manager/network-manager-dbwifi
 chown root: /usr/share/db_wlan_manager/network-manager/network-manager-dbwifi
 
 ln -sf /usr/share/db_wlan_manager/network-manager/network-manager-dbwifi /etc/NetworkManager/dispatcher.d/10-dbwifi
+
+if [ -d /etc/systemd/system ]; then
+    ln -sf /usr/share/db_wlan_manager/network-manager/dbwifi.service /etc/systemd/system/dbwifi.service
+    systemctl daemon-reload
+    systemctl enable --now dbwifi.service
+fi
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Portals described as data. A Spec says where the status comes from and how it tells online from offline,
+which requests log in, and where the quota is; SpecManager runs any spec. A provider is then a SpecManager
+subclass with its spec, see db_cdwifi.py.
+
+Everything that does not change between polls is prepared when the spec is created: the URLs are built,
+the decoders and the online check picked, the quota fields fixed. A poll only sends the requests.
+"""
+
+import logging
+
+import requests
+
+import batch
+import jsonp
+import captive
+import html_scanner
+from db_generic_manager import DBManager
+from profiler import phase, profiled
+
+# Status from the captive portal probes (see captive.py) instead of a portal API
+CAPTIVE = 'captive'
+
+# Quota fields of the ombord API, (used, limit) in order of preference: some trains only limit the total
+OMBORD_QUOTA = (('data_download_used', 'data_download_limit'), ('data_total_used', 'data_total_limit'))
+
+
+def _decode_jsonp(ret):
+    return jsonp.decode(ret.text)
+
+
+def _decode_json(ret):
+    return ret.json()
+
+
+def _decode_text(ret):
+    return ret.text
+
+
+DECODERS = {'jsonp': _decode_jsonp, 'json': _decode_json, 'text': _decode_text}
+
+
+class Endpoint:
+    """
+    One request of a spec.
+        path     host and path, e.g. 'www.info.cdwifi.cz/api/jsonp/connectivity'
+        decode   'jsonp', 'json' or 'text'
+        accept   status codes of a valid answer
+    """
+    def __init__(self, path, method='GET', protocol=None, decode='text', accept=(200,)):
+        self.path = path
+        self.method = method
+        self.protocol = protocol
+        self.accept = accept
+        self.decoder = DECODERS[decode]
+        self.url = None
+
+    def compile(self, protocol):
+        self.url = '{}://{}'.format(self.protocol or protocol, self.path)
+
+    def decode(self, ret):
+        """ The decoded answer, None if the request failed or the answer is no valid one """
+        if ret is False or ret.status_code not in self.accept:
+            return None
+        try:
+            return self.decoder(ret)
+        except ValueError as e:
+            logging.debug('Answer from {} broken: {}'.format(self.url, e))
+
+
+class Field:
+    """ Online decision on a field of the status: offline if it has one of off, online if one of on (or any other) """
+    def __init__(self, name, on=None, off=('0',)):
+        self.name = name
+        self.on = on
+        self.off = off
+
+    def __call__(self, status):
+        value = status.get(self.name) if isinstance(status, dict) else None
+        if value is None:
+            return None
+        if value in self.off:
+            return False
+        if self.on is None or value in self.on:
+            return True
+
+
+class Step:
+    """
+    One request of the login.
+        data     form fields sent along
+        form     also send the carried fields: the hidden fields of the portal page and what earlier steps extracted
+        extract  {field: key} to carry over from the (decoded) answer into the next steps
+        refresh  follow the meta refresh of the answer and look for the success marker there
+    """
+    def __init__(self, endpoint, data=None, form=False, extract=None, refresh=False):
+        self.endpoint = endpoint
+        self.data = data or {}
+        self.form = form
+        self.extract = extract or {}
+        self.refresh = refresh
+
+    def form_data(self, fields):
+        if self.endpoint.method == 'GET':
+            return None
+        if not self.form:
+            return self.data
+        data = dict(fields)
+        data.update(self.data)
+        return data
+
+    def carried(self, ret):
+        if not self.extract:
+            return {}
+        answer = self.endpoint.decode(ret)
+        if not isinstance(answer, dict):
+            return {}
+        return {field: answer[key] for field, key in self.extract.items() if key in answer}
+
+
+class Spec:
+    """
+        status    Endpoint of the status, or CAPTIVE
+        online    decision on the decoded status, True/False/None (unknown); not needed with CAPTIVE
+        login     Steps, in order
+        quota     Endpoint of the quota, None if the status has it
+        quota_fields  (used, limit) pairs in the quota answer, in order of preference
+        dns       resolve with the system DNS cache
+    """
+    def __init__(self, status, online=None, login=(), quota=None, quota_fields=(), protocol='http', verify=False,
+                 dns=True):
+        self.status = status
+        self.online = online
+        self.login = tuple(login)
+        self.quota = quota
+        self.quota_fields = tuple(quota_fields)
+        self.verify = verify
+        self.dns = dns
+        for endpoint in [status, quota] + [step.endpoint for step in self.login]:
+            if isinstance(endpoint, Endpoint):
+                endpoint.compile(protocol)
+        # Whether the login needs the hidden fields of the portal page
+        self.needs_form = any(step.form for step in self.login)
+
+    def read_quota(self, answer):
+        return read_quota(answer, self.quota_fields)
+
+
+def read_quota(answer, fields):
+    """ (quota, limit) from the first pair of fields with a limit, None if there is none """
+    if not isinstance(answer, dict):
+        return None
+    for used, limit in fields:
+        used, limit = _integer(answer.get(used)), _integer(answer.get(limit))
+        if used is not None and limit is not None and limit > 0:
+            return 1.0*used/limit, limit
+
+
+def _integer(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+
+
+class SpecManager(DBManager):
+    """ Runs the spec of the subclass """
+    spec = None
+    # Bytes of the portal's answer to a probe to read when the login needs the form of the page
+    form_limit = 16384
+
+    def __init__(self):
+        super().__init__()
+        # Fields carried into the login, the hidden fields of the last portal page we saw
+        self.portal_fields = {}
+
+    def _mount_dns(self, session):
+        if self.spec.dns:
+            super()._mount_dns(session)
+
+    def _update_online_api(self):
+        spec = self.spec
+        if spec.status == CAPTIVE:
+            return self._update_online_captive()
+
+        quota = None
+        if self.is_online and spec.quota is not None and self.quota_fetch_needed():
+            # Most likely still online, so get the quota along with the status
+            status, quota = batch.gather(self._get_status, self._get_quota)
+        else:
+            status = self._get_status()
+        if status is None:
+            return None
+
+        online = spec.online(status)
+        if isinstance(status, dict):
+            self.update_session(status)
+        if spec.quota is None:
+            self.update_quota(status)
+        elif online:
+            self.update_quota(quota)
+        return online
+
+    def _update_online_captive(self):
+        with phase('status'):
+            limit = self.form_limit if self.spec.needs_form else captive.READ_LIMIT
+            answer = captive.detect(self.session, self._timeouts(), limit=limit)
+        if answer.online is False and self.spec.needs_form:
+            with phase('hidden fields'):
+                self.portal_fields = self._get_portal_fields(answer)
+        return answer.online
+
+    def _get_portal_fields(self, answer):
+        """ Hidden fields of the portal's login form, from the page the probe got or, after a redirect, the portal """
+        if not answer.redirected:
+            return html_scanner.scan(answer.page.decode('utf-8', 'replace'), until='form').hidden
+        try:
+            ret = self.session.get(answer.portal_url, timeout=self._timeouts(), verify=self.spec.verify, stream=True)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            return {}
+        try:
+            ret.encoding = ret.encoding or 'utf-8'
+            return html_scanner.scan(ret.iter_content(4096, decode_unicode=True), until='form').hidden
+        finally:
+            ret.close()
+
+    @profiled('status')
+    def _get_status(self):
+        return self.spec.status.decode(self._request(self.spec.status))
+
+    @profiled('quota')
+    def _get_quota(self):
+        return self.spec.quota.decode(self._request(self.spec.quota))
+
+    def update_quota(self, answer=None):
+        if answer is None:
+            if self.spec.quota is None or not self.quota_fetch_needed():
+                return
+            answer = self._get_quota()
+        reading = self.spec.read_quota(answer)
+        if reading is not None:
+            self.set_quota(*reading)
+
+    def _request(self, endpoint, data=None):
+        """ The response, False if the request failed """
+        return self._send(endpoint.method, endpoint.url, data, verify=self.spec.verify)
+
+    def login(self):
+        logging.info('Trying to log in...')
+        fields = dict(self.portal_fields)
+        for step in self.spec.login:
+            with phase('login post'):
+                ret = self._request(step.endpoint, step.form_data(fields))
+            if ret is False or ret.status_code not in step.endpoint.accept:
+                logging.debug('Login Failed, probably bad wifi')
+                return False
+            fields.update(step.carried(ret))
+            if step.refresh and not self.confirm_login(ret):
+                return False
+        return True
+
+    @profiled('confirm redirect')
+    def confirm_login(self, login_ret):
+        confirm_url = html_scanner.scan(login_ret.text, until='refresh').refresh_url
+        if confirm_url:
+            try:
+                ret = self.session.get(confirm_url, timeout=self._timeouts(), verify=self.spec.verify)
+                if html_scanner.scan(ret.text, until='success').success:
+                    logging.info('Login Successful!')
+                    return True
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                logging.debug('Login Confirm Failed, probably bad wifi')
+                return False
+
+        logging.warning("Return from Portal malformed! Did the {} website change?".format(type(self).__name__))
+        return False
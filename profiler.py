@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Phase profiling of one connection attempt (manager.py --profile): the managers mark their phases
+(detection, provider decision, DNS, API check, status, CSRF/hidden fields, login POST, confirm, quota)
+with phase() or @profiled, and the waterfall of one run is printed at the end.
+
+Without an active Waterfall, a phase costs one global lookup.
+"""
+
+import sys
+import time
+import threading
+import functools
+
+_active = None
+_local = threading.local()
+
+
+class Waterfall:
+    width = 40
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # (name, start, duration, depth), in the order the phases ended
+        self.phases = []
+
+    def add(self, name, start, duration, depth):
+        self.phases.append((name, start - self.started, duration, depth))
+
+    def print(self, file=sys.stderr):
+        if not self.phases:
+            return
+        phases = sorted(self.phases, key=lambda phase: (phase[1], phase[3]))
+        total = max(start + duration for _, start, duration, _ in phases) or 1
+        print('{:<30} {:>9} {:>9}'.format('phase', 'start', 'ms'), file=file)
+        for name, start, duration, depth in phases:
+            offset = int(start / total * self.width)
+            length = max(1, int(duration / total * self.width))
+            bar = ' ' * offset + '#' * length
+            print('{:<30} {:>9.1f} {:>9.1f} |{:<{width}}|'.format(
+                '  ' * depth + name, start * 1000, duration * 1000, bar, width=self.width), file=file)
+
+
+class Phase:
+    def __init__(self, waterfall, name):
+        self.waterfall = waterfall
+        self.name = name
+
+    def __enter__(self):
+        self.depth = getattr(_local, 'depth', 0)
+        _local.depth = self.depth + 1
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.waterfall.add(self.name, self.start, time.perf_counter() - self.start, self.depth)
+        _local.depth = self.depth
+
+
+class _NoPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_no_phase = _NoPhase()
+
+
+def phase(name):
+    """ Context manager timing a phase of the active waterfall """
+    if _active is None:
+        return _no_phase
+    return Phase(_active, name)
+
+
+def profiled(name):
+    """ Decorator timing every call of the function as a phase """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with Phase(_active, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start():
+    global _active
+    _active = Waterfall()
+    return _active
+
+
+def stop():
+    global _active
+    waterfall, _active = _active, None
+    return waterfall
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Estimates the quota from the byte counters of the interface, so the portal's quota endpoint only has to be
+asked now and then. Between two authoritative readings the quota is extrapolated with the learned
+quota-per-byte ratio; a new reading is requested when the estimate gets too uncertain, too old or close
+to the throttle cap.
+"""
+
+import os
+import time
+
+
+class QuotaEstimator:
+    # Ask the portal at least this often (s)
+    max_age = 600
+    # ... and when the estimate may be off by more than this (fraction of the cap)
+    max_error = 0.02
+    # ... or when it is this close to the cap
+    cap_margin = 0.05
+    # Relative error of the extrapolation until we measured it
+    initial_ratio_error = 0.2
+
+    def __init__(self, ifname, counters=('rx_bytes',)):
+        self.paths = [os.path.join('/sys/class/net', ifname, 'statistics', counter) for counter in counters]
+        self.synced_at = None
+        self.synced_bytes = None
+        self.synced_quota = None
+        # Quota (fraction of the cap) per byte on the interface, learned from two readings
+        self.quota_per_byte = None
+        self.ratio_error = self.initial_ratio_error
+        # Quota per second, from the counters
+        self.burn_rate = None
+        self._last_sample = None
+
+    @staticmethod
+    def available(ifname):
+        return os.path.exists(os.path.join('/sys/class/net', ifname, 'statistics'))
+
+    def read_bytes(self):
+        try:
+            total = 0
+            for path in self.paths:
+                with open(path) as f:
+                    total += int(f.read())
+            return total
+        except (OSError, ValueError):
+            return None
+
+    def sync(self, quota):
+        """ An authoritative reading from the portal """
+        now, current = time.monotonic(), self.read_bytes()
+        if current is None or quota is None:
+            return
+
+        if self.synced_bytes is not None and current > self.synced_bytes and quota >= self.synced_quota:
+            delta_bytes = current - self.synced_bytes
+            ratio = (quota - self.synced_quota) / delta_bytes
+            if self.quota_per_byte is not None:
+                expected = self.quota_per_byte * delta_bytes
+                if expected > 0:
+                    self.ratio_error = 0.5 * self.ratio_error + 0.5 * abs(quota - self.synced_quota - expected) / expected
+            if ratio > 0:
+                self.quota_per_byte = ratio
+
+        self.synced_at, self.synced_bytes, self.synced_quota = now, current, quota
+
+    def estimate(self, quota=None):
+        """ The extrapolated quota, or the given last reading if we cannot extrapolate """
+        if self.synced_bytes is None or self.quota_per_byte is None:
+            return quota if quota is not None else self.synced_quota
+        current = self.read_bytes()
+        if current is None or current < self.synced_bytes:
+            return self.synced_quota
+        self._update_burn_rate(current)
+        return self.synced_quota + (current - self.synced_bytes) * self.quota_per_byte
+
+    def error(self):
+        """ How far off the estimate may be (fraction of the cap) """
+        current = self.read_bytes()
+        if self.quota_per_byte is None or current is None or current < self.synced_bytes:
+            return 1.0
+        return (current - self.synced_bytes) * self.quota_per_byte * self.ratio_error
+
+    def needs_sync(self):
+        if self.synced_at is None or self.quota_per_byte is None:
+            return True
+        if time.monotonic() - self.synced_at > self.max_age:
+            return True
+        if self.error() > self.max_error:
+            return True
+        return self.estimate() + self.cap_margin >= 1
+
+    def _update_burn_rate(self, current):
+        now = time.monotonic()
+        if self._last_sample is not None and now - self._last_sample[0] >= 1:
+            rate = (current - self._last_sample[1]) / (now - self._last_sample[0]) * self.quota_per_byte
+            if rate >= 0:
+                self.burn_rate = rate if self.burn_rate is None else 0.8 * self.burn_rate + 0.2 * rate
+            self._last_sample = (now, current)
+        elif self._last_sample is None:
+            self._last_sample = (now, current)
+
+    def time_until_cap(self):
+        """ Projected seconds until the throttle cap is reached, None if we don't burn any quota """
+        quota = self.estimate()
+        if quota is None or not self.burn_rate:
+            return None
+        return max(0, 1 - quota) / self.burn_rate
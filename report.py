@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Trip analytics over the recorded history (history.py), per trip, SSID and train:
+uptime, outages (drops while on a train), time-to-online from the first login after a drop,
+login success rate, quota burn rate and the time from boarding until the throttle cap.
+
+A trip is a run of samples on the same SSID and network (train), without a gap longer than trip_gap.
+Everything is computed with NumPy operations over whole arrays (or cache-sized chunks of them), only the
+groups are looped over.
+
+Usage: manager.py report [--by trip|ssid|train] [--days N]
+"""
+
+import os
+import sys
+import time
+
+import numpy
+
+from history import History, HISTORY_PATH, EVENT_LOGIN, EVENT_LOGIN_FAILED
+
+# Samples further apart than this (s) belong to different trips
+TRIP_GAP = 1800
+
+
+def format_mac(raw):
+    raw = bytes(raw)
+    return ':'.join('{:02x}'.format(b) for b in raw) if raw.strip(b'\0') else '-'
+
+
+def format_seconds(seconds):
+    if seconds is None or seconds != seconds:
+        return '-'
+    if seconds < 60:
+        return '{:.1f}s'.format(seconds)
+    minutes, seconds = divmod(int(seconds), 60)
+    return '{}:{:02d}:{:02d}'.format(minutes // 60, minutes % 60, seconds)
+
+
+def words(values):
+    """ Fixed-size byte strings as rows of uint64, which compare much faster than the strings """
+    size = values.dtype.itemsize
+    if size % 8 == 0:
+        return numpy.ascontiguousarray(values).view(numpy.uint64).reshape(len(values), -1)
+    padded = numpy.zeros((len(values), -(-size // 8) * 8), dtype=numpy.uint8)
+    padded[:, :size] = numpy.ascontiguousarray(values).view(numpy.uint8).reshape(len(values), size)
+    return padded.view(numpy.uint64)
+
+
+def scan(records, trip_gap=TRIP_GAP, chunk=1 << 15):
+    """
+    The columns needed for the analysis, and whether each sample starts a trip.
+    The records are read once in cache-sized chunks, every column on its own would read the whole array.
+    """
+    n = len(records)
+    columns = {name: numpy.empty(n, dtype=records.dtype[name]) for name in ('timestamp', 'online', 'quota', 'event')}
+    new = numpy.zeros(n, dtype=bool)
+    new[:1] = True
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        # With the sample before the chunk, to compare the first one to it
+        part = records[max(start - 1, 0):end]
+        for name, column in columns.items():
+            column[start:end] = part[name][start - end:]
+        changed = new[end - len(part) + 1:end]
+        for values in (part['ssid'], part['network']):
+            values = words(values)
+            for i in range(values.shape[1]):
+                changed |= values[1:, i] != values[:-1, i]
+    new[1:] |= numpy.diff(columns['timestamp']) > trip_gap
+    return columns, new
+
+
+def first_after(indices, positions):
+    """ For each position, the first of the sorted indices at or after it (0 if none) and whether there is one """
+    after = numpy.searchsorted(indices, positions)
+    found = after < len(indices)
+    if not len(indices):
+        return numpy.zeros(len(positions), dtype=numpy.int64), found
+    return indices[numpy.minimum(after, len(indices) - 1)], found
+
+
+def split_by(groups, count, *values):
+    """ The values of every group, as one list of arrays per value """
+    order = numpy.argsort(groups, kind='stable')
+    bounds = numpy.cumsum(numpy.bincount(groups, minlength=count))[:-1]
+    return [numpy.split(value[order], bounds) for value in values]
+
+
+class Analysis:
+    """
+    Sums per trip and per-event arrays (drops, logins) of the history, aggregated by group().
+    Only __init__ looks at every sample.
+    """
+    def __init__(self, records, trip_gap=TRIP_GAP):
+        n = len(records)
+        if not n:
+            raise ValueError('No records')
+        self.records = records
+        columns, new = scan(records, trip_gap)
+        t, online, event = columns['timestamp'], columns['online'], columns['event']
+        quota = columns['quota'].astype(numpy.float64)
+        self.trip_start = numpy.flatnonzero(new)
+
+        def trip(indices):
+            return numpy.searchsorted(self.trip_start, indices, side='right') - 1
+
+        # Whether the next sample is on the same trip, and online at both
+        same_trip_next = numpy.zeros(n, dtype=bool)
+        numpy.logical_not(new[1:], out=same_trip_next[:-1])
+        is_online = online == 1
+        both_online = same_trip_next[:-1] & is_online[:-1] & is_online[1:]
+
+        # Time each sample stands for, up to the next one on the same trip
+        dt = numpy.zeros(n)
+        numpy.subtract(t[1:], t[:-1], out=dt[:-1])
+        numpy.minimum(dt, trip_gap, out=dt)
+        dt *= same_trip_next
+
+        # Quota burnt between consecutive online samples of a trip, resets (MAC change) don't count
+        burn = numpy.zeros(n)
+        numpy.subtract(quota[1:], quota[:-1], out=burn[:-1])
+        burn[:-1] *= both_online
+        numpy.maximum(burn, 0, out=burn)
+
+        self.trip_samples = numpy.diff(numpy.append(self.trip_start, n))
+        self.trip_known = numpy.add.reduceat(dt * (online >= 0), self.trip_start)
+        self.trip_online = numpy.add.reduceat(dt * is_online, self.trip_start)
+        self.trip_burn = numpy.add.reduceat(burn, self.trip_start)
+
+        # Drops: online -> offline on the same trip, ending with the next offline -> online
+        is_offline = online == 0
+        drops = numpy.flatnonzero(same_trip_next[:-1] & is_online[:-1] & is_offline[1:]) + 1
+        recoveries = numpy.flatnonzero(same_trip_next[:-1] & is_offline[:-1] & is_online[1:]) + 1
+        # Every drop ends with the first recovery after it, if it is on the same trip
+        ends, recovered = first_after(recoveries, drops)
+        self.drop_trip = trip(drops)
+        recovered &= trip(ends) == self.drop_trip
+        self.outage = numpy.where(recovered, t[ends] - t[drops], numpy.nan)
+
+        # Logins; in the poll loop the outcome is only seen in the following samples, so a login counts as
+        # successful if we are online on the same trip before the next login
+        logins = numpy.flatnonzero((event == EVENT_LOGIN) | (event == EVENT_LOGIN_FAILED))
+        next_online, has_online = first_after(numpy.flatnonzero(is_online), logins)
+        next_login, has_login = first_after(logins, logins + 1)
+        self.login_trip = trip(logins)
+        self.login_success = ((event[logins] == EVENT_LOGIN) & has_online &
+                              (trip(next_online) == self.login_trip) & (~has_login | (next_online < next_login)))
+
+        # Time to online: first login after the drop until the recovery
+        first_login, has_login = first_after(logins, drops)
+        login_at = numpy.where(has_login, t[first_login], numpy.inf)
+        recovered_at = t[drops] + self.outage
+        self.time_to_online = numpy.where(recovered & (login_at <= recovered_at), recovered_at - login_at, numpy.nan)
+
+        # Time from the start of the trip until the cap
+        capped = quota >= 1
+        capped[1:] &= ~capped[:-1] | new[1:]
+        capped = numpy.flatnonzero(capped)
+        capped_trips, first_capped = numpy.unique(trip(capped), return_index=True)
+        self.trip_first = t[self.trip_start]
+        self.time_to_cap = numpy.full(len(self.trip_start), numpy.nan)
+        self.time_to_cap[capped_trips] = t[capped[first_capped]] - self.trip_first[capped_trips]
+
+    def group(self, trip_keys):
+        """ One dict of metrics per distinct value of trip_keys (one per trip) """
+        groups, first_trip, trip_group = numpy.unique(trip_keys, return_index=True, return_inverse=True)
+        count = len(groups)
+        samples = numpy.bincount(trip_group, self.trip_samples, minlength=count)
+        known_time = numpy.bincount(trip_group, self.trip_known, minlength=count)
+        online_time = numpy.bincount(trip_group, self.trip_online, minlength=count)
+        burn = numpy.bincount(trip_group, self.trip_burn, minlength=count)
+        outages, times_to_online = split_by(trip_group[self.drop_trip], count, self.outage, self.time_to_online)
+        login_success, = split_by(trip_group[self.login_trip], count, self.login_success)
+        times_to_cap, = split_by(trip_group, count, self.time_to_cap)
+
+        rows = []
+        for index, key in enumerate(groups):
+            logins = login_success[index]
+            time_to_cap = times_to_cap[index][~numpy.isnan(times_to_cap[index])]
+            rows.append({
+                'key': key,
+                'first': self.trip_first[first_trip[index]],
+                'samples': int(samples[index]),
+                'hours': known_time[index] / 3600,
+                'uptime': online_time[index] / known_time[index] if known_time[index] else numpy.nan,
+                'drops': len(outages[index]),
+                'outage': percentiles(outages[index][~numpy.isnan(outages[index])]),
+                'time_to_online': percentiles(times_to_online[index][~numpy.isnan(times_to_online[index])]),
+                'logins': len(logins),
+                'login_success': logins.mean() if len(logins) else numpy.nan,
+                'burn_rate': burn[index] / online_time[index] * 3600 if online_time[index] else numpy.nan,
+                'capped_trips': len(time_to_cap),
+                'time_to_cap': numpy.median(time_to_cap) if len(time_to_cap) else numpy.nan,
+            })
+        return rows
+
+
+def percentiles(values):
+    """ (median, p90, max), NaN if there are no values """
+    if not len(values):
+        return numpy.nan, numpy.nan, numpy.nan
+    median, p90 = numpy.percentile(values, (50, 90))
+    return median, p90, values.max()
+
+
+def print_rows(title, rows, label):
+    print(title)
+    print('{:<64} {:>7} {:>7} {:>5} {:>26} {:>20} {:>12} {:>8} {:>9}'.format(
+        '', 'hours', 'uptime', 'drops', 'outage p50/p90/max', 'online p50/p90', 'logins ok', 'quota/h', 'cap after'))
+    for row in rows:
+        outage = '/'.join(format_seconds(value) for value in row['outage'])
+        time_to_online = '/'.join(format_seconds(value) for value in row['time_to_online'][:2])
+        logins = '{} {}'.format(row['logins'], '-' if row['login_success'] != row['login_success']
+                                else '{:.0%}'.format(row['login_success']))
+        burn = '-' if row['burn_rate'] != row['burn_rate'] else '{:.1%}'.format(row['burn_rate'])
+        cap = format_seconds(row['time_to_cap'])
+        if row['capped_trips']:
+            cap += ' ({})'.format(row['capped_trips'])
+        uptime = '-' if row['uptime'] != row['uptime'] else '{:.1%}'.format(row['uptime'])
+        print('{:<64} {:>7.1f} {:>7} {:>5} {:>26} {:>20} {:>12} {:>8} {:>9}'.format(
+            label(row)[:64], row['hours'], uptime, row['drops'], outage, time_to_online, logins, burn, cap))
+    print()
+
+
+def report(records, by=('trip', 'ssid', 'train'), trip_gap=TRIP_GAP, managers=None, providers=None):
+    """
+    Print the tables. managers maps SSID -> manager (class or "module.Class"),
+    providers maps (ssid, network MAC) -> portal of the Wifi@DB provider.
+    """
+    managers = managers or {}
+    providers = providers or {}
+    if not len(records):
+        print('No history recorded yet')
+        return
+    analysis = Analysis(records, trip_gap)
+
+    def manager_name(ssid):
+        manager = managers.get(ssid)
+        return getattr(manager, '__name__', str(manager).rsplit('.', 1)[-1]) if manager else '?'
+
+    def network_label(ssid, network):
+        ssid = ssid.decode('utf-8', 'replace')
+        network = format_mac(network)
+        return '{} {} {}'.format(ssid, network, providers.get((ssid, network)) or manager_name(ssid))
+
+    if 'trip' in by:
+        def trip_label(row):
+            sample = records[analysis.trip_start[row['key']]]
+            started = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['first']))
+            return '{} {}'.format(started, network_label(sample['ssid'], sample['network']))
+        print_rows('Trips', analysis.group(numpy.arange(len(analysis.trip_start))), trip_label)
+    if 'ssid' in by:
+        def ssid_label(row):
+            ssid = row['key'].decode('utf-8', 'replace')
+            return '{} ({})'.format(ssid, manager_name(ssid))
+        print_rows('SSIDs', analysis.group(records['ssid'][analysis.trip_start]), ssid_label)
+    if 'train' in by:
+        # SSID and network, the same MAC may come up on different SSIDs
+        starts = records[analysis.trip_start]
+        keys = [ssid + b'/' + bytes(network).hex().encode() for ssid, network in zip(starts['ssid'], starts['network'])]
+        trains = {key: (ssid, network) for key, ssid, network in zip(keys, starts['ssid'], starts['network'])}
+        keys = numpy.array(keys)
+        print_rows('Trains', analysis.group(keys), lambda row: network_label(*trains[row['key']]))
+
+
+def main(argv, managers=None, providers=None):
+    import argparse
+    argparser = argparse.ArgumentParser(prog='manager.py report',
+                                        description='Uptime, outages, logins and quota per trip, SSID and train')
+    argparser.add_argument('--by', action='append', choices=('trip', 'ssid', 'train'),
+                           help='Group by trip, SSID or train (can be repeated, default all)')
+    argparser.add_argument('-d', '--days', type=float, help='Only the last DAYS days')
+    argparser.add_argument('--trip-gap', type=float, default=TRIP_GAP, help='Gap (s) which ends a trip')
+    argparser.add_argument('--history', default=HISTORY_PATH, help='Path of the history file')
+
+    args = argparser.parse_args(argv)
+    if not os.path.exists(args.history):
+        print('No history recorded yet')
+        return
+    history = History(args.history)
+    try:
+        records = history.read(start=time.time() - args.days * 86400 if args.days else None)
+    finally:
+        history.close()
+    report(records, by=args.by or ('trip', 'ssid', 'train'), trip_gap=args.trip_gap, managers=managers,
+           providers=providers)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
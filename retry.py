@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Gets a manager online before a deadline. Each attempt checks the status, logs in and checks again, with
+request timeouts shrinking as the deadline comes closer. Failed attempts are retried with exponential backoff
+and jitter, fast failures (e.g. connection refused) right away.
+"""
+
+import time
+import random
+import logging
+
+
+class Attempt:
+    def __init__(self, start, timeout):
+        self.start = start
+        self.timeout = timeout
+        self.duration = None
+        self.online = None
+        # Whether the attempt called login(), i.e. we were not online already
+        self.logged_in = False
+        self.delay = 0
+
+    def __str__(self):
+        return '+{:6.2f}s  {:5.2f}s (timeout {:.1f}s)  {}{}'.format(
+            self.start, self.duration, self.timeout, 'online' if self.online else 'failed',
+            ', retry in {:.2f}s'.format(self.delay) if self.delay else '')
+
+
+class RetryEngine:
+    deadline = 20
+    max_timeout = 5
+    min_timeout = 0.5
+    base_delay = 0.25
+    max_delay = 4
+    # Attempts failing faster than this (s) are retried right away, but only a few times in a row
+    fast_failure = 0.1
+    max_fast_retries = 3
+
+    def __init__(self, deadline=None, sleep=time.sleep):
+        if deadline is not None:
+            self.deadline = deadline
+        self.sleep = sleep
+        self.timeline = []
+
+    def timeout_for(self, remaining):
+        """ An attempt makes up to three requests, they all have to fit before the deadline """
+        return max(self.min_timeout, min(self.max_timeout, remaining / 3))
+
+    def backoff(self, failures):
+        delay = min(self.max_delay, self.base_delay * 2 ** failures)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def login(self, manager):
+        """ True if the manager got online before the deadline """
+        start = time.monotonic()
+        end = start + self.deadline
+        failures = fast_retries = 0
+        self.timeline = []
+        default_timeout = manager.timeout
+        try:
+            while time.monotonic() < end:
+                now = time.monotonic()
+                attempt = Attempt(now - start, self.timeout_for(end - now))
+                self.timeline.append(attempt)
+                manager.timeout = attempt.timeout
+
+                manager.update_online()
+                if not manager.is_online:
+                    manager.login()
+                    attempt.logged_in = True
+                    manager.update_online()
+                attempt.duration = time.monotonic() - now
+                attempt.online = bool(manager.is_online)
+                if attempt.online:
+                    return True
+
+                if attempt.duration < self.fast_failure and fast_retries < self.max_fast_retries:
+                    fast_retries += 1
+                    continue
+                fast_retries = 0
+                attempt.delay = min(self.backoff(failures), max(0, end - time.monotonic()))
+                failures += 1
+                self.sleep(attempt.delay)
+            return False
+        finally:
+            manager.timeout = default_timeout
+
+    def log_timeline(self):
+        """ One line per attempt of the last login() """
+        for attempt in self.timeline:
+            logging.info(attempt)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Adaptive polling: instead of checking status and quota every second, the next poll of a manager is planned
+from what we saw. Right after transitions, link events or while offline we check every second, while stably
+online the interval backs off, bounded by the quota burn rate and the remaining session time.
+"""
+
+import time
+import logging
+from collections import deque
+
+
+class PollScheduler:
+    min_interval = 1
+    max_interval = 30
+    # While the connection flaps, don't back off further than this
+    flap_interval = 5
+    flap_window = 300
+    flap_count = 2
+    # Poll this often (in fractions) until the throttle cap or session end is reached
+    approach_fraction = 0.1
+    # Renew the portal session this many seconds before it ends
+    renew_margin = 60
+
+    def __init__(self, name=''):
+        self.name = name
+        self.interval = self.min_interval
+        self.next_poll = 0
+        self.started = time.monotonic()
+        self.was_online = None
+        self.flaps = deque()
+        self.last_quota = None
+        self.burn_rate = None
+        self.polls = 0
+        self.requests = 0
+        self.renewed_at = None
+
+    def attach(self, manager):
+        """ Count the HTTP requests of the manager, to know what a poll costs """
+        session = getattr(manager, 'session', None)
+        if session is not None:
+            session.hooks['response'].append(self._count_response)
+
+    def _count_response(self, response, *args, **kwargs):
+        self.requests += 1
+
+    def due(self, now=None):
+        return (now or time.monotonic()) >= self.next_poll
+
+    def time_until_due(self):
+        return max(0, self.next_poll - time.monotonic())
+
+    def poll_now(self):
+        """ Something happened on the link, check right away and closely afterwards """
+        self.interval = self.min_interval
+        self.next_poll = 0
+
+    def record(self, manager):
+        """ Plan the next poll after manager.update_online() """
+        now = time.monotonic()
+        self.polls += 1
+        online = manager.is_online
+
+        if online is not True:
+            interval = self.min_interval
+        elif self.was_online is not True:
+            interval = self.min_interval
+        else:
+            interval = min(self.interval * 2, self.max_interval)
+
+        if online != self.was_online and self.was_online is not None:
+            self.flaps.append(now)
+        while self.flaps and self.flaps[0] < now - self.flap_window:
+            self.flaps.popleft()
+        if len(self.flaps) >= self.flap_count:
+            interval = min(interval, self.flap_interval)
+
+        if online:
+            interval = min(interval, self._quota_bound(manager, now), self._session_bound(manager))
+
+        self.was_online = online
+        self.interval = max(self.min_interval, interval)
+        self.next_poll = now + self.interval
+
+    def _quota_bound(self, manager, now):
+        quota = manager.get_quota()
+        if self.last_quota is not None and now > self.last_quota[0]:
+            rate = (quota - self.last_quota[1]) / (now - self.last_quota[0])
+            if rate >= 0:
+                self.burn_rate = rate if self.burn_rate is None else 0.7 * self.burn_rate + 0.3 * rate
+        self.last_quota = (now, quota)
+
+        if self.burn_rate:
+            return max(0, 1 - quota) / self.burn_rate * self.approach_fraction
+        return self.max_interval
+
+    def _session_bound(self, manager):
+        """ Poll closer to the session end, and once right before the renewal is due """
+        session_left = manager.session_left() if hasattr(manager, 'session_left') else None
+        if session_left is None:
+            return self.max_interval
+        until_renewal = session_left - self.renew_margin
+        if until_renewal <= 0:
+            return self.min_interval
+        return min(until_renewal, max(self.min_interval, session_left * self.approach_fraction))
+
+    def renewal_due(self, manager):
+        """ True if the portal session ends within renew_margin, at most once per half margin """
+        session_left = manager.session_left() if hasattr(manager, 'session_left') else None
+        if session_left is None or session_left > self.renew_margin:
+            return False
+        now = time.monotonic()
+        if self.renewed_at is not None and now - self.renewed_at < self.renew_margin / 2:
+            return False
+        self.renewed_at = now
+        return True
+
+    def stats(self):
+        """ Polls and requests compared to polling once per second """
+        fixed_polls = int(time.monotonic() - self.started)
+        per_poll = self.requests / self.polls if self.polls else 0
+        return {
+            'polls': self.polls,
+            'fixed_polls': fixed_polls,
+            'requests': self.requests,
+            'requests_saved': int(max(0, fixed_polls - self.polls) * per_poll),
+            'interval': self.interval,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info('{}: {polls} polls ({fixed_polls} with a fixed 1s interval), {requests} requests, '
+                     '~{requests_saved} requests saved'.format(self.name, **stats))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of things that rarely change for one network (API version, resolved hosts, portal provider,
+session cookies), so a reconnect to the same train can skip straight to the status check.
+
+A network is identified by its SSID and the MAC of the gateway (the train router), falling back to the BSSID.
+"""
+
+import os
+import json
+import time
+import fcntl
+import socket
+import struct
+import logging
+
+CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'dbwifi', 'state.json')
+
+
+def default_gateway(ifname=None):
+    """ Address of the default gateway (of the interface), from /proc/net/route """
+    try:
+        with open('/proc/net/route') as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if fields[1] == '00000000' and (ifname is None or fields[0] == ifname):
+                    return socket.inet_ntoa(struct.pack('<L', int(fields[2], 16)))
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def interface_address(ifname):
+    """ IPv4 address of the interface, None if it has none """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            # SIOCGIFADDR
+            data = fcntl.ioctl(sock.fileno(), 0x8915, struct.pack('256s', ifname[:15].encode('utf-8')))
+        except OSError:
+            return None
+    return socket.inet_ntoa(data[20:24])
+
+
+def gateway_mac(ifname=None):
+    """ MAC of the default gateway (of the interface), from /proc/net/route and /proc/net/arp """
+    gateway = default_gateway(ifname)
+    if gateway is None:
+        return None
+    try:
+        with open('/proc/net/arp') as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if fields[0] == gateway and fields[3] != '00:00:00:00:00:00':
+                    return fields[3].lower()
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+class NetworkState:
+    """ The cached values of one network. Without a cache it only lives in memory. """
+    def __init__(self, key=None, cache=None):
+        self.key = key
+        self.cache = cache
+        self.values = {}
+
+    def get(self, name, default=None):
+        entry = self.values.get(name)
+        if entry is None:
+            return default
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            self.values.pop(name, None)
+            return default
+        return value
+
+    def set(self, name, value, ttl=None):
+        self.values[name] = [value, time.time() + ttl if ttl else None]
+        if self.cache is not None:
+            self.cache.save()
+
+    def invalidate(self, *names):
+        changed = False
+        for name in names:
+            changed |= self.values.pop(name, None) is not None
+        if changed:
+            logging.info('Cached {} of {} invalidated'.format(', '.join(names), self.key))
+            if self.cache is not None:
+                self.cache.save()
+
+    def load_session(self, session):
+        cookies = self.get('cookies')
+        if cookies:
+            session.cookies.update(cookies)
+
+    def save_session(self, session, ttl=3600):
+        cookies = {cookie.name: cookie.value for cookie in session.cookies}
+        if cookies and cookies != self.get('cookies'):
+            self.set('cookies', cookies, ttl=ttl)
+
+
+class StateCache:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.networks = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, values in data.items():
+            state = self.network_by_key(key)
+            state.values = {name: entry for name, entry in values.items() if entry[1] is None or entry[1] > now}
+
+    def save(self):
+        data = {key: state.values for key, state in self.networks.items() if state.values}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = '{}.tmp'.format(self.path)
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning('Cannot write state cache {}: {}'.format(self.path, e))
+
+    def network_by_key(self, key):
+        state = self.networks.get(key)
+        if state is None:
+            state = self.networks[key] = NetworkState(key, self)
+        return state
+
+    def network(self, ssid, ifname=None, bssid=None):
+        return self.network_by_key('{}/{}'.format(ssid, gateway_mac(ifname) or bssid or 'unknown'))
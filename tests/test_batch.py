@@ -0,0 +1,94 @@
+"""
+Concurrency of the batched requests, with events instead of requests so the order they finish in is fixed.
+"""
+
+import time
+import threading
+
+import batch
+
+TIMEOUT = 5
+
+
+def returns(value, after=None):
+    """ A call returning value, once the event after is set """
+    def call():
+        if after is not None:
+            assert after.wait(TIMEOUT)
+        return value
+    return call
+
+
+def test_gather_runs_concurrently():
+    barrier = threading.Barrier(3, timeout=TIMEOUT)
+
+    def call(value):
+        return lambda: (barrier.wait(), value)[1]
+
+    # Deadlocks (and breaks the barrier) unless all three run at the same time
+    assert batch.gather(call('status'), call('quota'), call('probe')) == ['status', 'quota', 'probe']
+
+
+def test_first_prefers_earlier_candidates():
+    slow = threading.Event()
+    threading.Timer(0.1, slow.set).start()
+    # The second is valid first, but the preferred one is awaited
+    assert batch.first((returns('new', slow), bool), (returns('old'), bool)) == (0, 'new')
+
+
+def test_first_does_not_wait_for_later_candidates():
+    never = threading.Event()
+    start = time.monotonic()
+    assert batch.first((returns('new'), bool), (returns('old', never), bool)) == (0, 'new')
+    assert time.monotonic() - start < 1
+    never.set()
+
+
+def test_first_falls_back():
+    assert batch.first((returns(None), bool), (returns('old'), bool)) == (1, 'old')
+    assert batch.first((returns(None), bool), (returns(''), bool)) == (None, None)
+
+
+class Call:
+    """ Records when it was started, returns value once released """
+    def __init__(self, value, release=None):
+        self.value = value
+        self.release = release
+        self.started = threading.Event()
+
+    def __call__(self):
+        self.started.set()
+        if self.release is not None:
+            assert self.release.wait(TIMEOUT)
+        return self.value
+
+
+def test_race_first_valid_wins():
+    hanging = threading.Event()
+    assert batch.race([Call('a', hanging), Call('b')], bool) == (1, 'b')
+    hanging.set()
+    assert batch.race([Call(None), Call('')], bool) == (None, None)
+
+
+def test_race_stagger_starts_next_after_stagger():
+    hanging = threading.Event()
+    calls = [Call('a', hanging), Call('b')]
+    start = time.monotonic()
+    assert batch.race(calls, bool, stagger=0.2) == (1, 'b')
+    assert 0.2 <= time.monotonic() - start < 1
+    hanging.set()
+
+
+def test_race_stagger_skips_calls_after_valid_result():
+    calls = [Call('a'), Call('b')]
+    assert batch.race(calls, bool, stagger=1) == (0, 'a')
+    assert not calls[1].started.is_set()
+
+
+def test_race_stagger_starts_next_on_invalid_result():
+    calls = [Call(None), Call('b')]
+    start = time.monotonic()
+    # Doesn't wait out the stagger
+    assert batch.race(calls, bool, stagger=TIMEOUT) == (1, 'b')
+    assert time.monotonic() - start < 1
+    assert batch.race([Call(None), Call(None)], bool, stagger=TIMEOUT) == (None, None)
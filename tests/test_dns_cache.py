@@ -0,0 +1,50 @@
+"""
+The DNS cache on the system resolver, with socket.gethostbyname replaced by a lookup table.
+"""
+
+import socket
+
+import pytest
+
+import dns_cache
+from dns_cache import DNSCache
+from metrics import METRICS
+
+ADDRESSES = {'wifi.bahn.de': '172.18.0.1', 'login.wifionice.de': '172.18.0.2'}
+
+
+def gethostbyname(host):
+    if host not in ADDRESSES:
+        raise socket.gaierror('Name or service not known')
+    return ADDRESSES[host]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(dns_cache.socket, 'gethostbyname', gethostbyname)
+    return DNSCache(fallback='172.18.0.254')
+
+
+def counts():
+    return {name: METRICS.value('dbwifi_dns_cache_' + name) for name in ('hits', 'stale_hits', 'misses', 'failures')}
+
+
+def test_counters(cache):
+    before = counts()
+    assert cache.resolve_all('wifi.bahn.de', 'login.wifionice.de') == ['172.18.0.1', '172.18.0.2']
+    assert cache.resolve('wifi.bahn.de') == '172.18.0.1'
+    assert cache.resolve('unknown.example') == '172.18.0.254'
+    after = counts()
+    assert {name: after[name] - before[name] for name in after} == {'hits': 1, 'stale_hits': 0, 'misses': 3,
+                                                                     'failures': 1}
+    assert 'dbwifi_dns_cache_misses_total' in METRICS.render()
+
+
+def test_seeded_host_is_stale(cache):
+    cache.seed({'wifi.bahn.de': '10.0.0.1'})
+    before = counts()
+    # Served without waiting, refreshed in the background
+    assert cache.resolve('wifi.bahn.de') in ('10.0.0.1', '172.18.0.1')
+    assert counts()['stale_hits'] - before['stale_hits'] == 1
+    cache.executor.shutdown(wait=True)
+    assert cache.resolve('wifi.bahn.de') == '172.18.0.1'
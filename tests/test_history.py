@@ -0,0 +1,73 @@
+import pytest
+
+from history import History, mac_bytes, EVENT_POLL, EVENT_LOGIN
+
+numpy = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = History(str(tmp_path / 'history.bin'), capacity=8)
+    yield history
+    history.close()
+
+
+def test_round_trip(history):
+    history.append('WIFIonICE', '00:1d:aa:8b:2c:40', 'a0:b1:c2:d3:00:00', True, 0.25, 52428800, 209715200,
+                   event=EVENT_LOGIN, timestamp=1000.0)
+    records = history.read()
+    assert len(records) == 1
+    record = records[0]
+    assert record['timestamp'] == 1000.0
+    assert record['quota'] == pytest.approx(0.25)
+    assert (record['used'], record['limit'], record['online'], record['event']) == (52428800, 209715200, 1, EVENT_LOGIN)
+    assert record['ssid'] == b'WIFIonICE'
+    assert bytes(record['bssid']) == mac_bytes('00:1d:aa:8b:2c:40')
+    # MACs ending in zero bytes keep them
+    assert bytes(record['network']) == b'\xa0\xb1\xc2\xd3\x00\x00'
+
+
+def test_unknown_values(history):
+    history.append(None, None, None, None, 0.0, timestamp=1000.0)
+    record = history.read()[0]
+    assert (record['online'], record['used'], record['limit']) == (-1, -1, -1)
+    assert record['ssid'] == b''
+    assert bytes(record['bssid']) == bytes(6)
+
+
+def test_reopen(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    history = History(path, capacity=8)
+    history.append('CDWiFi', None, None, False, 0.5, timestamp=1000.0)
+    history.close()
+
+    history = History(path)
+    assert history.capacity == 8
+    assert history.read()['ssid'].tolist() == [b'CDWiFi']
+    history.close()
+
+
+def test_unchanged_polls_are_sampled(history):
+    for second in range(25):
+        history.append('WIFIonICE', None, None, True, 0.1, timestamp=1000.0 + second)
+    history.append('WIFIonICE', None, None, False, 0.1, timestamp=1025.0)
+    # Every sample_interval, and the last poll before the change
+    assert history.read()['timestamp'].tolist() == [1000.0, 1010.0, 1020.0, 1024.0, 1025.0]
+
+
+def test_logins_are_always_kept(history):
+    history.append('WIFIonICE', None, None, True, 0.1, timestamp=1000.0)
+    history.append('WIFIonICE', None, None, True, 0.1, event=EVENT_LOGIN, timestamp=1001.0)
+    assert history.read()['event'].tolist() == [EVENT_POLL, EVENT_LOGIN]
+
+
+def test_ring_and_range(history):
+    for i in range(12):
+        history.append('WIFIonICE', None, None, i % 2 == 0, i / 100, timestamp=1000.0 + i * 60)
+    assert len(history) == 8
+    assert history.written() == 12
+    assert history.read()['timestamp'].tolist() == [1000.0 + i * 60 for i in range(4, 12)]
+    # The range spans both parts of the ring, end is exclusive
+    assert history.read(1000.0 + 5 * 60, 1000.0 + 10 * 60)['timestamp'].tolist() == [
+        1000.0 + i * 60 for i in range(5, 10)]
+    assert len(history.read(5000.0)) == 0
@@ -0,0 +1,49 @@
+import html_scanner
+from conftest import fixture_path
+
+LOGIN_FIELDS = {'challenge': '5c3f8a0e1b9d4f2a7e6c1d0b3a9f8e7d', 'uamip': '192.168.44.1', 'uamport': '80',
+                'userurl': 'http://detectportal.firefox.com/success.txt', 'myLogin': 'agb', 'll': 'de',
+                'nasid': 'db-lounge-frankfurt-hbf', 'custom': '1'}
+
+
+def read_fixture(name):
+    with open(fixture_path('hotsplots', name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_login_form():
+    assert html_scanner.scan(read_fixture('login.html'), until='form').hidden == LOGIN_FIELDS
+
+
+def test_chunks():
+    text = read_fixture('login.html')
+    chunks = (text[i:i+100] for i in range(0, len(text), 100))
+    assert html_scanner.scan(chunks, until='form').hidden == LOGIN_FIELDS
+
+
+def test_refresh():
+    page = html_scanner.scan(read_fixture('login_confirm.html'), until='refresh')
+    assert page.refresh_url == ('http://192.168.44.1:3990/logon?username=agb&response=0f3c2a1b'
+                                '&userurl=http%3A%2F%2Fdetectportal.firefox.com%2Fsuccess.txt')
+    assert not page.success
+
+
+def test_success():
+    assert html_scanner.scan(read_fixture('success.html'), until='success').success
+    assert not html_scanner.scan(read_fixture('login.html')).success
+
+
+def test_hidden_inputs_outside_of_forms():
+    page = html_scanner.scan('<input type="hidden" name="tracking" value="1">'
+                             '<form><input type="hidden" name="challenge" value="abc">'
+                             '<input type="text" name="user"><input type="HIDDEN" name="uamport" value="80"></form>'
+                             '<input type="hidden" name="footer" value="2">')
+    assert page.hidden == {'challenge': 'abc', 'uamport': '80'}
+
+
+def test_stops_after_the_first_form():
+    page = html_scanner.scan('<form><input type="hidden" name="a" value="1"></form>'
+                             '<form><input type="hidden" name="b" value="2"></form>'
+                             '<meta http-equiv="refresh" content="0;url=/next">', until='form')
+    assert page.hidden == {'a': '1'}
+    assert page.refresh_url is None
@@ -0,0 +1,44 @@
+import pytest
+
+import jsonp
+from conftest import fixture_path
+
+
+def decode_fixture(name):
+    with open(fixture_path('jsonp', name)) as f:
+        return jsonp.decode(f.read())
+
+
+def test_suewex_user():
+    user = decode_fixture('suewex_user.txt')
+    assert user['expires'] == 'Thu Dec 26 22:26:52 2019'
+    assert user['timeleft'] == 40991
+    assert user['data_total_used'] == 22913075
+    assert user['data_total_limit'] == 52428800
+    # Not a data or time field, so it stays as sent
+    assert user['online'] == '40991'
+
+
+def test_compact_equals_pretty():
+    assert decode_fixture('compact_user.txt') == dict(decode_fixture('suewex_user.txt'), online='1')
+
+
+def test_wifionice_without_callback_name():
+    user = decode_fixture('wifionice_user.txt')
+    assert user['online'] == '0'
+    assert user['data_download_limit'] == 209715200
+    assert user['expires'] == 'Never'
+
+
+def test_parentheses_in_values():
+    assert jsonp.decode('cb({"expires":"(soon) )", "data_x":"12"});') == {'expires': '(soon) )', 'data_x': 12}
+
+
+def test_non_digit_numbers_stay_strings():
+    assert jsonp.decode('cb({"data_total_limit":"-1", "timeleft":""});') == {'data_total_limit': '-1', 'timeleft': ''}
+
+
+@pytest.mark.parametrize('text', ['', 'cb();', '<html>offline</html>', 'cb({"online":"1"'])
+def test_broken(text):
+    with pytest.raises(ValueError):
+        jsonp.decode(text)
@@ -0,0 +1,110 @@
+"""
+The link monitor on recorded netlink messages (fixtures/netlink) of the same machine as fixtures/ip_a.txt:
+wlp4s0 (index 3) associated with WIFIonICE, which then roams, disconnects and goes down.
+"""
+
+from conftest import fixture_path
+from link_monitor import (LinkMonitor, Netlink, iter_messages, parse_attrs, format_mac, parse_ip_a, parse_iw_link,
+                          NLMSG_DONE, RTM_NEWLINK, NL80211_CMD_GET_INTERFACE, NL80211_CMD_GET_SCAN,
+                          NL80211_ATTR_BSS, NL80211_BSS_BSSID, NL80211_BSS_STATUS)
+
+NL80211_ID = 0x22
+
+
+def messages(name):
+    """ (type, payload) of the recorded messages, one datagram per line """
+    with open(fixture_path('netlink', name)) as f:
+        return [message for line in f if line.strip() and not line.startswith('#')
+                for message in iter_messages(bytes.fromhex(line.strip()))]
+
+
+class RecordedNetlink(Netlink):
+    """ Answers the nl80211 requests with the recorded replies instead of asking the kernel """
+    def __init__(self, replies):
+        self.replies = replies
+
+    def request(self, type_, payload, dump=False):
+        assert type_ == NL80211_ID
+        return [(msg_type, msg) for msg_type, msg in self.replies[payload[0]] if msg_type != NLMSG_DONE]
+
+
+def create_monitor(scan='get_scan.hex'):
+    monitor = LinkMonitor()
+    monitor.netlink = True
+    monitor.nl80211_id = NL80211_ID
+    monitor._genl = RecordedNetlink({NL80211_CMD_GET_INTERFACE: messages('get_interface.hex'),
+                                     NL80211_CMD_GET_SCAN: messages(scan)})
+    events = []
+    monitor.add_listener(lambda event, link: events.append((event, link.ifname, link.ssid, link.bssid)))
+    for msg_type, msg in messages('getlink_dump.hex'):
+        if msg_type == RTM_NEWLINK:
+            monitor._handle_link(msg_type, msg)
+    return monitor, events
+
+
+def mlme_event(index):
+    return messages('mlme_events.hex')[index][1]
+
+
+def test_iter_messages():
+    assert [msg_type for msg_type, _ in messages('getlink_dump.hex')] == [RTM_NEWLINK] * 4 + [NLMSG_DONE]
+
+
+def test_parse_nested_attrs():
+    _, msg = messages('get_scan.hex')[0]
+    bss = parse_attrs(parse_attrs(msg, 4)[NL80211_ATTR_BSS])
+    assert format_mac(bss[NL80211_BSS_BSSID]) == '00:1d:aa:8b:2c:40'
+    assert bss[NL80211_BSS_STATUS] == b'\x01\0\0\0'
+
+
+def test_dump():
+    monitor, events = create_monitor()
+    assert sorted(monitor.links) == ['docker0', 'enp0s31f6', 'lo', 'wlp4s0']
+    assert monitor.get_ssids() == {'wlp4s0': 'WIFIonICE'}
+    link = monitor.get_link('wlp4s0')
+    assert (link.index, link.up, link.bssid) == (3, True, '00:1d:aa:8b:2c:40')
+    assert not monitor.get_link('enp0s31f6').up
+    assert events == [('associated', 'wlp4s0', 'WIFIonICE', '00:1d:aa:8b:2c:40')]
+
+
+def test_roam():
+    monitor, events = create_monitor()
+    monitor._genl.replies[NL80211_CMD_GET_SCAN] = messages('get_scan_roamed.hex')
+    monitor._handle_wireless(mlme_event(1))
+    assert events[-1] == ('roamed', 'wlp4s0', 'WIFIonICE', '00:1d:aa:8b:31:00')
+
+
+def test_disconnect_and_connect():
+    monitor, events = create_monitor()
+    monitor._handle_wireless(mlme_event(2))
+    assert events[-1] == ('disconnected', 'wlp4s0', None, None)
+    assert monitor.get_ssids() == {}
+
+    monitor._handle_wireless(mlme_event(0))
+    assert events[-1] == ('associated', 'wlp4s0', 'WIFIonICE', '00:1d:aa:8b:2c:40')
+
+
+def test_link_down():
+    monitor, events = create_monitor()
+    for msg_type, msg in messages('link_down.hex'):
+        monitor._handle_link(msg_type, msg)
+    assert events[-1] == ('down', 'wlp4s0', None, None)
+    assert monitor.get_ssids() == {}
+
+
+def test_unchanged_association_is_no_event():
+    monitor, events = create_monitor()
+    monitor._handle_wireless(mlme_event(0))
+    assert len(events) == 1
+
+
+def test_parse_ip_a():
+    with open(fixture_path('ip_a.txt')) as f:
+        assert parse_ip_a(f.read()) == ['wlp4s0']
+
+
+def test_parse_iw_link():
+    with open(fixture_path('iw_link.txt'), 'rb') as f:
+        assert parse_iw_link(f.read()) == ('WIFIonICE', '00:1d:aa:8b:2c:40')
+    with open(fixture_path('iw_link_disconnected.txt')) as f:
+        assert parse_iw_link(f.read()) == (None, None)
@@ -0,0 +1,131 @@
+"""
+The poll loop of manager.py. In the asyncio run mode, calls which missed their deadline keep running in
+their thread, so nothing may start them a second time or act on their state meanwhile.
+"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from history import History
+from manager import DBManager
+from state_cache import StateCache
+
+
+class Manager:
+    def __init__(self, update_time=0.0, online=False):
+        self.update_time = update_time
+        self.online = online
+        self.is_online = None
+        self.updates = 0
+        self.logins = 0
+
+    def update_online(self):
+        self.updates += 1
+        time.sleep(self.update_time)
+        self.is_online = self.online
+
+    def login(self):
+        self.logins += 1
+
+    def get_quota(self):
+        return 0.0
+
+    def session_left(self):
+        return None
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    history = History(str(tmp_path / 'history.bin'), capacity=16)
+    db_manager = DBManager(state_cache=StateCache(str(tmp_path / 'state.json')), history=history)
+    yield db_manager
+    history.close()
+
+
+def run(db_manager, coroutine):
+    """ Run the coroutine as run_async() would, with the loop and executor set up """
+    async def main():
+        db_manager.loop = asyncio.get_running_loop()
+        db_manager.async_wakeup = asyncio.Event()
+        db_manager.executor = ThreadPoolExecutor(max_workers=4)
+        try:
+            return await coroutine()
+        finally:
+            db_manager.executor.shutdown(wait=True)
+    return asyncio.run(main())
+
+
+def test_detection_is_awaited_again_after_its_deadline(db_manager):
+    calls = []
+    release = threading.Event()
+    managers = [Manager()]
+
+    def get_login_managers():
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+        return managers
+    db_manager.get_login_managers = get_login_managers
+    db_manager.deadline_detect = 0.05
+
+    async def detect_three_times():
+        results = [await db_manager._detect(), await db_manager._detect()]
+        release.set()
+        results.append(await db_manager._detect())
+        return results
+
+    assert run(db_manager, detect_three_times) == [None, None, managers]
+    assert len(calls) == 1
+    assert db_manager.detection is None
+
+
+def test_busy_manager_is_skipped(db_manager):
+    manager = Manager()
+    db_manager.busy.add(manager)
+    assert run(db_manager, lambda: db_manager.manage(manager)) is False
+    assert manager.updates == 0
+
+
+def test_missed_deadline_keeps_the_manager_busy(db_manager):
+    manager = Manager(update_time=0.3)
+    db_manager.deadline_status = 0.05
+
+    async def poll_twice():
+        first = await db_manager.manage(manager)
+        busy = manager in db_manager.busy
+        second = await db_manager.manage(manager)
+        await asyncio.sleep(0.5)
+        return first, busy, second
+
+    assert run(db_manager, poll_twice) == (True, True, False)
+    assert manager.updates == 1
+    # The status came in after the deadline, so the poll did not act on it with a login
+    assert manager.logins == 0
+    assert manager not in db_manager.busy
+
+
+class Link:
+    def __init__(self, ifname, ssid):
+        self.ifname = ifname
+        self.ssid = ssid
+        self.bssid = '00:1d:aa:8b:2c:40'
+
+
+def test_time_to_online_per_interface(db_manager):
+    first, second = Manager(online=True), Manager(online=True)
+    db_manager.links = {first: ('WIFIonICE', 'wlan0'), second: ('Wifi@DB', 'wlan1')}
+    db_manager.link_monitor_started = True
+    db_manager.on_link_event('associated', Link('wlan1', 'Wifi@DB'))
+
+    # wlan0 was online all along
+    first.update_online()
+    db_manager._check_time_to_online(first)
+    assert list(db_manager.time_to_online) == []
+
+    second.update_online()
+    db_manager._check_time_to_online(second)
+    assert len(db_manager.time_to_online) == 1
+    assert db_manager.associated_at == {}
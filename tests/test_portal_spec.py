@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from portal_spec import Spec, Endpoint, Field, Step, read_quota, OMBORD_QUOTA, CAPTIVE
+
+
+class Response:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def test_read_quota_download_limit():
+    answer = {'data_download_used': 52428800, 'data_download_limit': 209715200, 'data_total_limit': 0}
+    assert read_quota(answer, OMBORD_QUOTA) == (0.25, 209715200)
+
+
+def test_read_quota_falls_back_to_total_limit():
+    answer = {'data_download_used': 100, 'data_download_limit': 0,
+              'data_total_used': '13107200', 'data_total_limit': '52428800'}
+    assert read_quota(answer, OMBORD_QUOTA) == (0.25, 52428800)
+
+
+@pytest.mark.parametrize('answer', [
+    None, 'offline', {}, {'data_download_used': 1, 'data_download_limit': 0},
+    {'data_download_used': '1.5', 'data_download_limit': '10'}, {'data_download_used': 1, 'data_download_limit': -1},
+])
+def test_read_quota_without_limit(answer):
+    assert read_quota(answer, OMBORD_QUOTA) is None
+
+
+def test_spec_read_quota():
+    spec = Spec(Endpoint('portal/quota'), quota_fields=(('usedAmount', 'totalLimit'),))
+    assert spec.read_quota({'usedAmount': 5, 'totalLimit': 10}) == (0.5, 10)
+
+
+def test_field_default():
+    online = Field('online')
+    assert online({'online': '1'}) is True
+    assert online({'online': '40991'}) is True
+    assert online({'online': '0'}) is False
+    assert online({}) is None
+    assert online('<html>') is None
+
+
+def test_field_on_off():
+    authenticated = Field('authenticated', on=('yes',), off=('no', 'expired'))
+    assert authenticated({'authenticated': 'yes'}) is True
+    assert authenticated({'authenticated': 'expired'}) is False
+    assert authenticated({'authenticated': 'pending'}) is None
+
+
+def test_endpoint_decode():
+    endpoint = Endpoint('api/status', decode='jsonp')
+    endpoint.compile('http')
+    assert endpoint.url == 'http://api/status'
+    assert endpoint.decode(Response('cb({"online":"1"});')) == {'online': '1'}
+    assert endpoint.decode(Response('cb({"online":"1"});', 404)) is None
+    assert endpoint.decode(Response('<html>captive</html>')) is None
+    assert endpoint.decode(False) is None
+
+
+def test_spec_compiles_endpoints():
+    status = Endpoint('portal/status', decode='json')
+    login = Endpoint('portal/login', method='POST', protocol='http')
+    spec = Spec(status, Field('online'), login=[Step(login, form=True)], protocol='https')
+    assert status.url == 'https://portal/status'
+    assert login.url == 'http://portal/login'
+    assert spec.needs_form
+    assert not Spec(CAPTIVE, login=[Step(login)]).needs_form
+
+
+def test_step_form_data():
+    fields = {'challenge': 'abc', 'login': 'x'}
+    post = Endpoint('portal/login', method='POST')
+    assert Step(post, data={'terms': 'on'}).form_data(fields) == {'terms': 'on'}
+    assert Step(post, data={'login': 'y'}, form=True).form_data(fields) == {'challenge': 'abc', 'login': 'y'}
+    assert Step(Endpoint('portal/connect')).form_data(fields) is None
+
+
+def test_step_carried():
+    step = Step(Endpoint('portal/', method='POST', decode='json'), extract={'login': 'user', 'password': 'password'})
+    assert step.carried(Response('{"user": "arw005o", "password": "5QMu7v6o"}')) == {
+        'login': 'arw005o', 'password': '5QMu7v6o'}
+    assert step.carried(Response('{"error": "full"}')) == {}
+    assert step.carried(Response('not json')) == {}
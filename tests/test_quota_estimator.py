@@ -0,0 +1,111 @@
+import pytest
+
+import quota_estimator
+from quota_estimator import QuotaEstimator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(quota_estimator.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def counter(tmp_path):
+    path = tmp_path / 'rx_bytes'
+
+    def set_bytes(value):
+        path.write_text('{}\n'.format(value))
+    set_bytes(1000)
+    set_bytes.path = str(path)
+    return set_bytes
+
+
+@pytest.fixture
+def estimator(counter, clock):
+    estimator = QuotaEstimator('wlp4s0')
+    estimator.paths = [counter.path]
+    return estimator
+
+
+def test_extrapolates_between_readings(estimator, counter):
+    assert estimator.needs_sync()
+    estimator.sync(0.1)
+    # No ratio yet, only the reading
+    assert estimator.estimate() == 0.1
+    counter(11000)
+    estimator.sync(0.2)
+    assert estimator.quota_per_byte == pytest.approx(1e-5)
+
+    counter(12000)
+    assert estimator.estimate() == pytest.approx(0.21)
+    assert estimator.error() == pytest.approx(1000 * 1e-5 * estimator.initial_ratio_error)
+    assert not estimator.needs_sync()
+
+
+def test_needs_sync(estimator, counter, clock):
+    estimator.sync(0.1)
+    counter(11000)
+    estimator.sync(0.2)
+    assert not estimator.needs_sync()
+
+    # Too old
+    clock.now += estimator.max_age + 1
+    assert estimator.needs_sync()
+    estimator.sync(0.2)
+    assert not estimator.needs_sync()
+
+    # Too uncertain
+    counter(11000 + 20000)
+    assert estimator.needs_sync()
+
+
+def test_needs_sync_close_to_the_cap(estimator, counter):
+    estimator.sync(0.1)
+    counter(11000)
+    estimator.sync(0.2)
+    counter(87000)
+    estimator.sync(0.96)
+    assert estimator.error() == 0
+    assert estimator.needs_sync()
+
+
+def test_counter_reset(estimator, counter):
+    estimator.sync(0.1)
+    counter(11000)
+    estimator.sync(0.2)
+    counter(500)
+    assert estimator.estimate() == 0.2
+    assert estimator.error() == 1.0
+
+
+def test_time_until_cap(estimator, counter, clock):
+    estimator.sync(0.1)
+    counter(11000)
+    estimator.sync(0.2)
+    assert estimator.time_until_cap() is None
+
+    # 1000 bytes/s at 1e-5 per byte
+    clock.now += 10
+    counter(21000)
+    assert estimator.time_until_cap() == pytest.approx(0.7 / 0.01)
+    clock.now += 10
+    counter(31000)
+    assert estimator.time_until_cap() == pytest.approx(0.6 / 0.01)
+
+
+def test_without_counters(tmp_path, clock):
+    estimator = QuotaEstimator('wlp4s0')
+    estimator.paths = [str(tmp_path / 'missing')]
+    estimator.sync(0.3)
+    assert estimator.estimate(0.3) == 0.3
+    assert estimator.needs_sync()
@@ -0,0 +1,91 @@
+"""
+The retry engine on a fake manager whose status and login take no time, with a clock advanced by sleep().
+"""
+
+import pytest
+
+import retry
+from retry import RetryEngine
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Manager:
+    """ Gets online with the login given by online_after, a status check or login takes duration seconds """
+    def __init__(self, clock, online_after=None, duration=0.0, online=False):
+        self.clock = clock
+        self.online_after = online_after
+        self.duration = duration
+        self.is_online = online
+        self.timeout = 10
+        self.timeouts = []
+        self.logins = 0
+
+    def update_online(self):
+        self.timeouts.append(self.timeout)
+        self.clock.now += self.duration
+
+    def login(self):
+        self.logins += 1
+        self.clock.now += self.duration
+        if self.logins == self.online_after:
+            self.is_online = True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(retry.random, 'uniform', lambda a, b: b)
+    return clock
+
+
+def test_online_already(clock):
+    engine = RetryEngine(deadline=20, sleep=clock.sleep)
+    manager = Manager(clock, online=True)
+    assert engine.login(manager)
+    assert manager.logins == 0
+    assert [attempt.logged_in for attempt in engine.timeline] == [False]
+
+
+def test_fast_failures_are_retried_right_away(clock):
+    engine = RetryEngine(deadline=20, sleep=clock.sleep)
+    manager = Manager(clock, online_after=5)
+    assert engine.login(manager)
+    assert manager.logins == 5
+    # Three fast retries in a row, then back off before the next ones
+    assert [attempt.delay for attempt in engine.timeline] == [0, 0, 0, 0.25, 0]
+    assert clock.sleeps == [0.25]
+
+
+def test_backoff(clock):
+    engine = RetryEngine(deadline=20, sleep=clock.sleep)
+    manager = Manager(clock, online_after=5, duration=0.5)
+    assert engine.login(manager)
+    assert clock.sleeps == [0.25, 0.5, 1, 2]
+    assert all(attempt.logged_in for attempt in engine.timeline)
+    assert [attempt.online for attempt in engine.timeline] == [False] * 4 + [True]
+
+
+def test_deadline(clock):
+    engine = RetryEngine(deadline=6, sleep=clock.sleep)
+    manager = Manager(clock, duration=0.5)
+    assert not engine.login(manager)
+    assert clock.now >= 6
+    # The last delay ends at the deadline instead of sleeping past it
+    assert sum(clock.sleeps) + 1.5 * len(engine.timeline) == pytest.approx(6)
+    # Request timeouts shrink as the deadline comes closer, the manager gets its own back
+    assert [attempt.timeout for attempt in engine.timeline] == pytest.approx([2, 4.25 / 3, 0.75])
+    assert clock.sleeps == [0.25, 0.5, 0.75]
+    assert manager.timeout == 10
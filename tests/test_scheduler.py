@@ -0,0 +1,117 @@
+"""
+Planning of the polls, on a fake manager and a clock which only moves when the test says so.
+"""
+
+import pytest
+
+import scheduler
+from scheduler import PollScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class Manager:
+    def __init__(self, online=True, quota=0.0, session_left=None):
+        self.is_online = online
+        self.quota = quota
+        self.left = session_left
+
+    def get_quota(self):
+        return self.quota
+
+    def session_left(self):
+        return self.left
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def poll(schedule, clock, manager):
+    """ Wait until the poll is due, then record it. Returns the planned interval. """
+    clock.now = max(clock.now, schedule.next_poll)
+    assert schedule.due()
+    schedule.record(manager)
+    assert not schedule.due()
+    return schedule.interval
+
+
+def test_backs_off_while_online(clock):
+    schedule, manager = PollScheduler(), Manager()
+    assert [poll(schedule, clock, manager) for _ in range(7)] == [1, 2, 4, 8, 16, 30, 30]
+
+
+def test_offline_polls_every_second(clock):
+    schedule, manager = PollScheduler(), Manager()
+    for _ in range(4):
+        poll(schedule, clock, manager)
+    manager.is_online = False
+    assert poll(schedule, clock, manager) == 1
+    manager.is_online = None
+    assert poll(schedule, clock, manager) == 1
+
+
+def test_flapping_caps_the_interval(clock):
+    schedule, manager = PollScheduler(), Manager()
+    poll(schedule, clock, manager)
+    manager.is_online = False
+    poll(schedule, clock, manager)
+    manager.is_online = True
+    assert [poll(schedule, clock, manager) for _ in range(5)] == [1, 2, 4, 5, 5]
+    # Once the flaps are out of the window, it backs off again
+    clock.now += PollScheduler.flap_window
+    assert poll(schedule, clock, manager) == 10
+
+
+def test_poll_now(clock):
+    schedule, manager = PollScheduler(), Manager()
+    for _ in range(4):
+        poll(schedule, clock, manager)
+    schedule.poll_now()
+    assert schedule.due() and schedule.time_until_due() == 0
+    # Back off again from the start
+    assert poll(schedule, clock, manager) == 2
+
+
+def test_quota_burn_rate_bounds_the_interval(clock):
+    schedule, manager = PollScheduler(), Manager()
+    start, intervals = clock.now, []
+    for _ in range(5):
+        # 1% of the quota per second
+        clock.now = max(clock.now, schedule.next_poll)
+        manager.quota = (clock.now - start) * 0.01
+        intervals.append(poll(schedule, clock, manager))
+    assert schedule.burn_rate == pytest.approx(0.01)
+    # 85% left after 15s: poll again within a tenth of the 85s until the cap
+    assert intervals == pytest.approx([1, 2, 4, 8, 8.5])
+
+
+def test_session_end_bounds_the_interval(clock):
+    schedule, manager = PollScheduler(), Manager(session_left=3600)
+    assert [poll(schedule, clock, manager) for _ in range(7)] == [1, 2, 4, 8, 16, 30, 30]
+    manager.left = 100
+    # Once more right before the renewal is due
+    assert poll(schedule, clock, manager) == 10
+    manager.left = 60
+    assert poll(schedule, clock, manager) == 1
+
+
+def test_renewal_due(clock):
+    schedule = PollScheduler()
+    assert not schedule.renewal_due(Manager(session_left=None))
+    assert not schedule.renewal_due(Manager(session_left=61))
+    manager = Manager(session_left=60)
+    assert schedule.renewal_due(manager)
+    # At most once per half margin
+    assert not schedule.renewal_due(manager)
+    clock.now += PollScheduler.renew_margin / 2
+    assert schedule.renewal_due(manager)
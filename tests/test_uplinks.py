@@ -0,0 +1,72 @@
+import pytest
+
+from uplinks import Uplink, RouteSelector
+
+
+class Manager:
+    def __init__(self, online=True, quota=0.0):
+        self.is_online = online
+        self.quota = quota
+
+    def get_quota(self):
+        return self.quota
+
+
+def uplink(ifname, latency, loss=0.0, online=True, quota=0.0):
+    uplink = Uplink(ifname, 'WIFIonICE', Manager(online, quota))
+    uplink.latency = latency
+    uplink.loss = loss
+    return uplink
+
+
+@pytest.fixture
+def routes(monkeypatch):
+    routes = []
+    monkeypatch.setattr(RouteSelector, 'set_default_route', lambda self, ifname: routes.append(ifname))
+    return routes
+
+
+def test_select_cheapest():
+    fast, slow = uplink('wlan0', 0.05), uplink('wlan1', 0.2)
+    assert RouteSelector().select([slow, fast]) is fast
+
+
+def test_loss_and_quota_count():
+    lossy, used = uplink('wlan0', 0.05, loss=0.8), uplink('wlan1', 0.1, quota=0.5)
+    assert RouteSelector().select([lossy, used]) is used
+    throttled = uplink('wlan2', 0.02, quota=1.0)
+    assert RouteSelector().select([throttled, used]) is used
+
+
+def test_unusable_uplinks():
+    offline, unmeasured, usable = uplink('wlan0', 0.01, online=False), uplink('wlan1', None), uplink('wlan2', 0.5)
+    assert RouteSelector().select([offline, unmeasured, usable]) is usable
+
+    selector = RouteSelector()
+    assert selector.select([offline, unmeasured]) is None
+    selector.select([usable])
+    # Keeps the last choice while nothing can be measured
+    assert selector.select([offline, unmeasured]) is usable
+
+
+def test_hysteresis():
+    selector = RouteSelector()
+    first, second = uplink('wlan0', 0.10), uplink('wlan1', 0.09)
+    assert selector.select([first]) is first
+    assert selector.select([first, second]) is first
+    second.latency = 0.07
+    assert selector.select([first, second]) is second
+
+
+def test_switch(routes):
+    first, second = uplink('wlan0', 0.1), uplink('wlan1', 0.2)
+    RouteSelector().select([first, second])
+    assert routes == []
+
+    selector = RouteSelector(switch=True)
+    selector.select([first, second])
+    selector.select([first, second])
+    assert routes == ['wlan0']
+    first.manager.is_online = False
+    selector.select([first, second])
+    assert routes == ['wlan0', 'wlan1']
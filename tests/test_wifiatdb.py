@@ -0,0 +1,43 @@
+from captive import Answer
+from db_wifiatdb import Fingerprint, FingerprintIndex, DBWifiAtDBDecider
+from db_wifiatdb_suewex import DBWifiAtDBSuewex
+
+SUEWEX_PAGE = (b'<html><head><script src="https://www.ombord.info/api/jsonp/user/?callback=jQuery3110_1533860865681">'
+               b'</script></head><body>Connected</body></html>')
+
+
+class Other:
+    pass
+
+
+def match(portal_url=None, page=b'', cookies=(), gateway=None, index=DBWifiAtDBDecider.INDEX):
+    return index.match(Answer(False, portal_url, page, cookies), gateway)
+
+
+def test_suewex():
+    assert match('http://wifi-bahn.de/connect.php') is DBWifiAtDBSuewex
+    assert match('http://portal.wifi-bahn.de/') is DBWifiAtDBSuewex
+    # Answered in place of the probe, only the page tells
+    assert match('http://detectportal.firefox.com/success.txt', SUEWEX_PAGE) is DBWifiAtDBSuewex
+
+
+def test_unknown_portals():
+    assert match('http://www.hotsplots.de/auth/login.php?res=notyet') is None
+    assert match('https://public-wifi.deutschebahn.com/') is None
+    assert match(None) is None
+
+
+def test_gateway_and_cookies_alone_do_not_match():
+    assert match('https://public-wifi.deutschebahn.com/', gateway='172.16.0.1') is None
+    assert match('http://portal.example.com/login.php', b'<html>', ('PHPSESSID',)) is None
+    assert match('http://portal.example.com/login.php', b'<html>', ('PHPSESSID',), '172.16.0.1') is None
+
+
+def test_gateway_and_cookies_decide_between_matches():
+    index = FingerprintIndex([
+        Fingerprint(Other, markers=(b'ombord.info',)),
+        Fingerprint(DBWifiAtDBSuewex, markers=(b'ombord.info',), gateways=('172.16.0.1',), cookies=('PHPSESSID',)),
+    ])
+    assert match(None, SUEWEX_PAGE, ('PHPSESSID',), index=index) is DBWifiAtDBSuewex
+    assert match(None, SUEWEX_PAGE, gateway='172.16.0.1', index=index) is DBWifiAtDBSuewex
+    assert match(None, b'<html>', ('PHPSESSID',), '172.16.0.1', index=index) is None
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+The HTTP layer of all managers: their sessions share one PortalAdapter, i.e. one pool of keep-alive connections
+per portal host, so polls and logins reuse the connections of earlier requests instead of paying a TCP handshake
+(and on lossy links its retransmits) each time. Broken connects, and idempotent requests whose connection broke
+or timed out, are retried within the adapter.
+
+Cookies stay per manager, only the connections are shared. With several uplinks, each interface has its own
+transport, whose connections are bound to the interface's address (and, as root, to the device itself).
+"""
+
+import os
+import time
+import socket
+import logging
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from metrics import METRICS, SIZE_BUCKETS, mark, start_phases, end_phases
+from state_cache import interface_address
+
+# Retries are expected on lossy links, the metrics count what failed for good
+logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+
+
+class InstrumentedSession(requests.Session):
+    def __init__(self, metrics=METRICS, adapter=None):
+        super().__init__()
+        self.metrics = metrics
+        self.mount('http://', adapter or InstrumentedAdapter())
+        self.mount('https://', adapter or InstrumentedAdapter())
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        labels = (('endpoint', '{}{}'.format(parts.hostname, parts.path or '/')),)
+        # Redirects are sent from within, and measured on their own
+        outer = start_phases()
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.Timeout:
+            self.metrics.inc('dbwifi_request_timeouts', labels)
+            raise
+        except requests.ConnectionError:
+            self.metrics.inc('dbwifi_request_errors', labels)
+            raise
+        finally:
+            total = time.perf_counter() - start
+            phases = end_phases(outer)
+
+        metrics = self.metrics
+        for phase, seconds in phases.items():
+            metrics.observe('dbwifi_request_{}_seconds'.format(phase), labels, seconds)
+        metrics.observe('dbwifi_request_first_byte_seconds', labels, response.elapsed.total_seconds())
+        metrics.observe('dbwifi_request_seconds', labels, total)
+        if not kwargs.get('stream'):
+            metrics.observe('dbwifi_response_bytes', labels, len(response.content), SIZE_BUCKETS)
+        metrics.inc('dbwifi_responses', labels + (('code', response.status_code),))
+        return response
+
+
+class TimedConnection:
+    """ Reports the TCP connect and TLS handshake of new connections """
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        self._connect_time = time.perf_counter() - start
+        mark('connect', self._connect_time)
+        return sock
+
+    def connect(self):
+        self._connect_time = 0
+        start = time.perf_counter()
+        super().connect()
+        if isinstance(self, HTTPSConnection):
+            mark('tls', time.perf_counter() - start - self._connect_time)
+
+
+class TimedHTTPConnection(TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnection, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+
+class PortalAdapter(InstrumentedAdapter):
+    # Hosts to keep connections to, and connections per host (batch.py runs up to 8 requests at once)
+    pool_hosts = 10
+    pool_size = 8
+    # Retries of failed connects, and of idempotent requests on a broken connection, e.g. a keep-alive
+    # connection the portal closed in the meantime. Failed connects are not retried here: a refused connect
+    # has to fail fast, the RetryEngine (see retry.py) retries those right away and the poll loop polls again
+    connect_retries = 0
+    read_retries = 1
+    backoff = 0.1
+
+    def __init__(self, source_address=None, device=None, **kwargs):
+        # Passed on to the connection pools
+        self.pool_kwargs = {}
+        if source_address:
+            self.pool_kwargs['source_address'] = (source_address, 0)
+        if device:
+            self.pool_kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, getattr(socket, 'SO_BINDTODEVICE', 25), device.encode('utf-8'))]
+        kwargs.setdefault('pool_connections', self.pool_hosts)
+        kwargs.setdefault('pool_maxsize', self.pool_size)
+        kwargs.setdefault('max_retries', Retry(
+            total=self.connect_retries + self.read_retries, connect=self.connect_retries, read=self.read_retries,
+            status=0, other=0, redirect=False, backoff_factor=self.backoff,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, raise_on_status=False))
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.update(self.pool_kwargs)
+        super().init_poolmanager(*args, **kwargs)
+
+
+class Transport:
+    # Connect timeout (s), the read timeout is the timeout of the manager
+    connect_timeout = 3
+
+    def __init__(self, adapter=None):
+        self.adapter = adapter or PortalAdapter()
+
+    def session(self):
+        """ A new session (own cookies) on the shared connection pool """
+        return InstrumentedSession(adapter=self.adapter)
+
+    def mount(self, session):
+        """ Move an existing session (cookies, hooks) onto this transport """
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+
+    def timeout(self, read_timeout):
+        """ (connect, read) timeout for requests """
+        return min(self.connect_timeout, read_timeout), read_timeout
+
+
+_shared_transport = None
+# (ifname, address) -> Transport
+_bound_transports = {}
+
+
+def shared_transport():
+    """ The transport shared by all managers """
+    global _shared_transport
+    if _shared_transport is None:
+        _shared_transport = Transport()
+    return _shared_transport
+
+
+def close_transports(ifname):
+    """ Close and forget the transports bound to the interface, e.g. when their connections became useless """
+    for key in [key for key in _bound_transports if key[0] == ifname]:
+        _bound_transports.pop(key).adapter.close()
+
+
+def transport_for(ifname):
+    """ The transport bound to the interface, the shared one if the interface has no address """
+    address = interface_address(ifname)
+    if address is None:
+        return shared_transport()
+    transport = _bound_transports.get((ifname, address))
+    if transport is None:
+        # Binding to the device needs CAP_NET_RAW, the address alone still picks the source
+        device = ifname if os.geteuid() == 0 else None
+        transport = _bound_transports[(ifname, address)] = Transport(PortalAdapter(source_address=address,
+                                                                                   device=device))
+    return transport
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Several interfaces on DB wifis at once (e.g. one adapter on WIFIonICE and one on WIFI@DB): every uplink is
+scored on what the polls of its manager measure, and the best one is reported or made the default route.
+
+Latency is the time until the response headers of the manager's requests, loss the share of polls without
+any response; both are moving averages. The cost of an uplink is its expected time per request (latency over
+the delivery rate), made worse by the quota already used and much worse once it is throttled.
+"""
+
+import logging
+import subprocess
+
+from state_cache import default_gateway
+
+
+class Uplink:
+    # Weight of a new measurement in the moving averages
+    smoothing = 0.2
+    # Cost factor of a throttled uplink
+    throttled_penalty = 10
+
+    def __init__(self, ifname, ssid, manager):
+        self.ifname = ifname
+        self.ssid = ssid
+        self.manager = manager
+        self.latency = None
+        self.loss = 0.0
+        self.responses = 0
+        session = getattr(manager, 'session', None)
+        if session is not None:
+            session.hooks['response'].append(self._on_response)
+
+    def close(self):
+        session = getattr(self.manager, 'session', None)
+        if session is not None and self._on_response in session.hooks['response']:
+            session.hooks['response'].remove(self._on_response)
+
+    def _on_response(self, response, *args, **kwargs):
+        self.responses += 1
+        latency = response.elapsed.total_seconds()
+        self.latency = latency if self.latency is None else self._average(self.latency, latency)
+
+    def _average(self, average, value):
+        return (1 - self.smoothing) * average + self.smoothing * value
+
+    def record_poll(self, responses_before):
+        """ After a poll, which started when we had seen responses_before responses """
+        self.loss = self._average(self.loss, 0.0 if self.responses > responses_before else 1.0)
+
+    def cost(self):
+        """ Expected seconds per request, weighted by the quota; None if the uplink is not usable """
+        if not self.manager.is_online or self.latency is None:
+            return None
+        cost = self.latency / max(0.05, 1 - self.loss)
+        quota = self.manager.get_quota()
+        return cost * (self.throttled_penalty if quota >= 1 else 1 + quota)
+
+    def __repr__(self):
+        latency = '{:.0f}ms'.format(self.latency * 1000) if self.latency is not None else '?'
+        return '{} ({}, {}, {:.0%} loss)'.format(self.ifname, self.ssid, latency, self.loss)
+
+
+class RouteSelector:
+    # Another uplink has to be this much cheaper before we prefer it
+    hysteresis = 0.2
+    # Metric of the default route we add for the preferred uplink, below the ones of the network manager
+    metric = 10
+
+    def __init__(self, switch=False):
+        # Only report the preferred uplink unless switch is set
+        self.switch = switch
+        self.preferred = None
+        self.routed = False
+
+    def select(self, uplinks):
+        """ The preferred uplink after this round of polls """
+        costs = {uplink: uplink.cost() for uplink in uplinks}
+        costs = {uplink: cost for uplink, cost in costs.items() if cost is not None}
+        if not costs:
+            return self.preferred
+        best = min(costs, key=costs.get)
+        current = costs.get(self.preferred)
+        if best is not self.preferred and (current is None or costs[best] < (1 - self.hysteresis) * current):
+            logging.info('Preferred uplink is now {}'.format(best))
+            self.preferred = best
+            if self.switch:
+                self.set_default_route(best.ifname)
+        return self.preferred
+
+    def set_default_route(self, ifname):
+        gateway = default_gateway(ifname)
+        if gateway is None:
+            logging.warning('No gateway on {}, keeping the default route'.format(ifname))
+            return
+        # Our route has its own metric, so replacing it moves it to the new uplink in one step
+        if self._ip('route', 'replace', 'default', 'via', gateway, 'dev', ifname, 'metric', str(self.metric)):
+            self.routed = True
+
+    def restore(self):
+        """ Remove our default route again """
+        if self.routed:
+            self._ip('route', 'del', 'default', 'metric', str(self.metric))
+            self.routed = False
+
+    @staticmethod
+    def _ip(*args):
+        try:
+            subprocess.run(('ip',) + args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            logging.warning('ip {} failed: {}'.format(' '.join(args), getattr(e, 'stderr', None) or e))
+            return False
+